@@ -1,3 +1,15 @@
-import runner.gui as gui
+import multiprocessing
+import sys
 
-gui.launchgui()
+# Guarded, solver worker processes re-import this file when they start
+if __name__ == '__main__':
+	multiprocessing.freeze_support()
+
+	# Any arguments means the command line runner, which never loads tkinter
+	if len(sys.argv) > 1:
+		import runner.cli as cli
+		sys.exit(cli.main())
+
+	import runner.gui as gui
+
+	gui.launchgui()
@@ -0,0 +1,220 @@
+'''
+CLI
+
+Runs models without the gui, for headless machines & cron jobs. Uses
+the same loading (converter), solving (pyomo_runner) and exporting
+(export) as the gui, and never imports tkinter.
+
+From the src directory (or with the .pyz)
+    $ python3 . run --constraints const.csv --objectives objs/ --out results/
+
+Progress goes to stdout, problems to stderr. The exit code is
+ - 0: every model loaded, solved optimally and was written
+ - 1: something failed (load errors, non optimal runs, export problems)
+ - 2: bad arguments
+'''
+
+import argparse
+import pathlib
+import sys
+import threading
+import time
+from typing import List, Optional
+
+import runner.converter as converter
+import runner.export as export
+import runner.modelcache as modelcache
+import runner.pyomo_runner as pyomo_runner
+import runner.text as text
+import runner.timing as timing
+
+
+EXIT_OK = 0
+EXIT_FAILURE = 1
+
+
+
+def main (argv: Optional[List[str]]=None) -> int:
+	parser = _buildParser()
+	args = parser.parse_args(argv)
+	return args.func(args)
+
+
+def _buildParser () -> argparse.ArgumentParser:
+	parser = argparse.ArgumentParser(
+		prog='formom-runner',
+		description='ForMOM Linear Model Runner. Run with no arguments to open the gui.'
+	)
+	subparsers = parser.add_subparsers(dest='command', required=True)
+
+	run = subparsers.add_parser('run', help='Solve models and write the results')
+	run.set_defaults(func=cmdRun)
+
+	run.add_argument('--constraints', required=True, type=pathlib.Path,
+		help='constraint .csv file')
+	objs = run.add_mutually_exclusive_group(required=True)
+	objs.add_argument('--objective', type=pathlib.Path,
+		help='a single objective .csv file')
+	objs.add_argument('--objectives', type=pathlib.Path,
+		help='a folder, every .csv in it is an objective')
+
+	run.add_argument('--out', required=True, type=pathlib.Path,
+		help='folder to write into, a RunOutput-<time> folder is made inside it')
+	run.add_argument('--format', choices=export.OUT_TYPES, default='csv',
+		help="csv & txt write files per run, long-csv & parquet write one table per result kind for all runs")
+	run.add_argument('--split-unders', action='store_true',
+		help='with csv output, split variable names by underscore into columns')
+	run.add_argument('--export-threads', type=int, default=export.DEFAULT_EXPORT_THREADS,
+		help='csv & txt runs written at once, handy on network drives (default: %(default)s)')
+
+	run.add_argument('--solver', choices=list(pyomo_runner.SOLVER_BACKENDS), default='glpk')
+	run.add_argument('--workers', type=int, default=pyomo_runner.defaultNumWorkers(),
+		help='number of models solved at once (default: %(default)s)')
+	run.add_argument('--time-limit', type=float, default=None, metavar='SECONDS',
+		help='solver time limit per model')
+	run.add_argument('--batch-timeout', type=float, default=None, metavar='SECONDS',
+		help='stop the whole run after this long, runs not finished are not written')
+	run.add_argument('--no-cache', action='store_true',
+		help="don't read or write the on-disk model & result cache")
+
+	return parser
+
+
+
+def cmdRun (args) -> int:
+	backend = pyomo_runner.getSolverBackend(args.solver)
+	if not backend.isAvailable():
+		_err(f"Solver '{args.solver}' is not available on this machine")
+		return EXIT_FAILURE
+
+	if args.format == 'parquet' and not export.isParquetAvailable():
+		_err("Parquet output needs the pyarrow package (pip install pyarrow)")
+		return EXIT_FAILURE
+
+	cache = None
+	if not args.no_cache:
+		cache = modelcache.ModelCache(modelcache.getDefaultCacheDir())
+
+	# Step 1: Load
+	with timing.recording() as loadPhases:
+		names, finalModels, loadFailed = _loadModels(args, cache)
+	print(text.statusPhases(loadPhases, "Load Phases"))
+
+	if len(finalModels) == 0:
+		_err("No models loaded, nothing to run")
+		return EXIT_FAILURE
+
+	# Step 2: Solve & write each run as it finishes
+	try:
+		args.out.mkdir(parents=True, exist_ok=True)
+	except OSError as e:
+		_err(f"Unable to create output folder {args.out}: {e}")
+		return EXIT_FAILURE
+
+	exporter = export.makeRunExporter(str(args.out), args.format, args.split_unders, max(1, args.export_threads))
+	if not exporter.begin():
+		_err(text.statusSaveMany(str(args.out), -1))
+		return EXIT_FAILURE
+
+	cancelEvent = None
+	if args.batch_timeout != None:
+		cancelEvent = threading.Event()
+		timer = threading.Timer(args.batch_timeout, cancelEvent.set)
+		timer.daemon = True
+		timer.start()
+
+	numWorkers = max(1, min(args.workers, len(finalModels)))
+	print(text.statusRunStarted(len(finalModels), numWorkers), end='')
+
+	start = time.perf_counter()
+	results = []
+	allResults = pyomo_runner.solveModels(
+		finalModels,
+		backendName=args.solver,
+		numWorkers=numWorkers,
+		cancelEvent=cancelEvent,
+		timeLimit=args.time_limit,
+		resultCache=cache
+	)
+
+	for i, res in enumerate(allResults):
+		results.append(exporter.writeRun(names[i], res))
+		print(f"[{i + 1}/{len(finalModels)}] " + text.statusRunLine(names[i], res), end='', flush=True)
+
+	numWritten = exporter.finish(loadPhases)
+	wallSeconds = time.perf_counter() - start
+
+	# Step 3: Report
+	print()
+	print(text.statusTiming(results, wallSeconds))
+	print(text.statusSaveMany(str(exporter.outDir), numWritten))
+
+	failed = loadFailed
+	if len(results) < len(finalModels):
+		_err(text.statusRunCancelled(len(results), len(finalModels)))
+		failed = True
+
+	if exporter.numFailed > 0:
+		_err(f"{exporter.numFailed} run(s) could not be written")
+		failed = True
+
+	numNotOptimal = sum(1 for res in results if not res.isOptimal())
+	if numNotOptimal > 0:
+		_err(f"{numNotOptimal} run(s) did not solve optimally")
+		failed = True
+
+	return EXIT_FAILURE if failed else EXIT_OK
+
+
+def _loadModels (args, cache):
+	'''
+	Returns (objective file names, FinalModels, whether any file failed)
+	'''
+	if not args.constraints.is_file():
+		_err(f"{args.constraints} is not a file")
+		return [], [], True
+
+	try:
+		if args.objective != None:
+			objPaths = [args.objective]
+			allLoaded = [converter.lintAndConvertFromFilepaths(args.objective, args.constraints, cache=cache)]
+		else:
+			if not args.objectives.is_dir():
+				_err(f"{args.objectives} is not a folder")
+				return [], [], True
+			objPaths = sorted(args.objectives.glob('*.csv'))
+			allLoaded = converter.lintAndConvertManyFromFilepaths(objPaths, args.constraints, cache=cache)
+	except (OSError, UnicodeDecodeError) as e:
+		_err(f"Unable to read the input files: {e}")
+		return [], [], True
+
+	names = []
+	finalModels = []
+	loadFailed = False
+
+	for p, (finalModel, messages) in zip(objPaths, allLoaded):
+		if finalModel == None:
+			loadFailed = True
+			_err(f"[[ Error ]] {p.name}")
+			for m in messages:
+				_err(f"  {m}")
+			continue
+
+		for m in messages:
+			_err(f"[[ Warning ]] {p.name}: {m}")
+
+		names.append(p.name)
+		finalModels.append(finalModel)
+
+	print(f"Loaded {len(finalModels)} of {len(objPaths)} objective file(s)")
+	return names, finalModels, loadFailed
+
+
+def _err (msg: str) -> None:
+	print(msg, file=sys.stderr)
+
+
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -16,13 +16,26 @@ William Zipse
 NJDEP
 '''
 
+import logging
 import pprint
 import sys
 import csv
-from typing import Union, List
+from typing import Optional, Tuple, Union, List
 from pathlib import Path
 
+import numpy as np
+
 import runner.model_data_classes as models
+import runner.modelcache as modelcache
+import runner.timing as timing
+
+
+_log = logging.getLogger(__name__)
+
+# Cached models (see modelcache.py) are keyed on this. Bump it whenever
+# a change to linting or conversion changes what a loaded model looks
+# like, so stale cache entries are never used.
+LINT_VERSION = 2
 
 
 
@@ -100,16 +113,316 @@ def openAndReadConstraintCSV (constFilepath: Path) -> models.InputConstraintData
 	)
 
 
+def openAndReadConstraintCSVAsSparse (constFilepath: Path) -> models.InputConstraintData:
+	'''
+		Opens and reads the constraint csv in a single pass, returning a
+		InputConstraintData class where the coefficients are a
+		models.SparseMatrix and the bounds are a float64 vector. Only the
+		nonzeros of each row are kept, so memory scales with the number of
+		nonzeros rather than rows * columns.
+
+		Unlike openAndReadConstraintCSV(...), every cell is converted to a
+		float as it is read. A ValueError is raised pointing at the row and
+		column of the first non-numeric cell.
+	'''
+	var_names = []
+	vec_operators = []
+	const_names = []
+	bound_list = []
+	row_cols = []
+	row_vals = []
+
+	for fileLine, row in _iterConstraintCSVRows(constFilepath):
+		if fileLine == None:
+			var_names = row[1:-2]
+			continue
+
+		coeffs, bound = _parseConstraintRow(row, fileLine, var_names)
+		nonzeroCols = np.flatnonzero(coeffs)
+		row_cols.append(nonzeroCols)
+		row_vals.append(coeffs[nonzeroCols])
+		bound_list.append(bound)
+		const_names.append(row[0])
+		vec_operators.append(row[-2])
+
+	return models.InputConstraintData(
+		var_names=var_names,
+		const_names=const_names,
+		vec_const_bounds=np.array(bound_list, dtype=np.float64),
+		vec_operators=vec_operators,
+		mat_constraint_coeffs=models.SparseMatrix.fromRows(row_cols, row_vals, len(var_names))
+	)
+
+
+def _iterConstraintCSVRows (constFilepath: Path):
+	'''
+		Yields (fileLine, row) for every non-empty row in the constraint
+		csv, with all cells stripped. The header row is yielded with a
+		fileLine of None, every other row has its (1-indexed) line number
+		in the file, so blank lines still count.
+	'''
+	with open(constFilepath, 'r') as constFile:
+		constCSVReader = csv.reader(constFile)
+		seenHeader = False
+
+		for row in constCSVReader:
+			if len(row) == 0:
+				continue
+			row = [str(x).strip() for x in row]
+
+			if not seenHeader:
+				seenHeader = True
+				yield None, row
+			else:
+				yield constCSVReader.line_num, row
+
+
+def _parseConstraintRow (row: List[str], fileLine: int, var_names: List[str]):
+	'''
+		Converts a (stripped) constraint row into a float64 array of
+		coefficients and a float bound. Raises a ValueError describing
+		where the first non-float cell is.
+	'''
+	if len(row) != len(var_names) + 3:
+		raise ValueError(
+			f"Constraint file row {fileLine} has {len(row)} columns, " +
+			f"expected {len(var_names) + 3}"
+		)
+
+	try:
+		coeffs = np.array(row[1:-2], dtype=np.float64)
+	except ValueError:
+		raise ValueError(_describeNonFloatCell(row, fileLine, var_names)) from None
+
+	try:
+		bound = float(row[-1])
+	except ValueError:
+		raise ValueError(
+			f"Constraint matrix contains non-float {row[-1]} " +
+			f"(row {fileLine}, column {len(row)}, right hand side)"
+		) from None
+
+	return coeffs, bound
+
+
+def _describeNonFloatCell (row: List[str], fileLine: int, var_names: List[str]) -> str:
+	'''
+		Finds the first coefficient in a constraint row that isn't a float
+		and builds an error message with its (1-indexed) row and column.
+	'''
+	for ind, cell in enumerate(row[1:-2]):
+		try:
+			float(cell)
+		except ValueError:
+			return f"Constraint matrix contains non-float {cell} " + \
+				   f"(row {fileLine}, column {ind + 2}, variable '{var_names[ind]}')"
+
+	# numpy and float() disagree on what a float is, should never happen
+	return f"Constraint matrix contains non-float in row {fileLine}"
+
+
+#
+# Triplet constraint files
+#
+# Instead of a column per variable, every nonzero gets its own row
+#     const_name,variable,coefficient
+#     167N_2021_Acres,167N_2021_STQO,1
+# and the operator & bound of each constraint go in a second, small
+# file next to it named <constraint file>_bounds.csv
+#     const_name,operator,rtSide
+#     167N_2021_Acres,eq,163363
+#
+# The bounds file decides which constraints there are and their order.
+# Variables are ordered by when they first show up in the triplets, so
+# every variable needs at least one triplet (a 0 coefficient is fine).
+
+TRIPLET_HEADER = ['const_name', 'variable', 'coefficient']
+BOUNDS_HEADER = ['const_name', 'operator', 'rtside']
+BOUNDS_SUFFIX = '_bounds.csv'
+
+
+def openAndReadConstraintFile (constFilepath: Path) -> models.InputConstraintData:
+	'''
+		Reads a constraint file in either format, going by its header.
+		Wide files go to openAndReadConstraintCSVAsSparse(...), triplet
+		files to openAndReadConstraintTriplets(...). Either way problems
+		with the file raise a ValueError.
+	'''
+	if isTripletConstraintCSV(constFilepath):
+		return openAndReadConstraintTriplets(constFilepath, getBoundsFilepath(constFilepath))
+	return openAndReadConstraintCSVAsSparse(constFilepath)
+
+
+def getConstraintFilepaths (constFilepath: Path) -> List[Path]:
+	'''
+		Every file that makes up a constraint file: itself, plus the
+		bounds file for triplet files (if it exists)
+	'''
+	filepaths = [Path(constFilepath)]
+	if isTripletConstraintCSV(constFilepath):
+		boundsFilepath = getBoundsFilepath(constFilepath)
+		if boundsFilepath.is_file():
+			filepaths.append(boundsFilepath)
+	return filepaths
+
+
+def isTripletConstraintCSV (constFilepath: Path) -> bool:
+	with open(constFilepath, 'r') as constFile:
+		for row in csv.reader(constFile):
+			if len(row) != 0:
+				return [str(x).strip().lower() for x in row] == TRIPLET_HEADER
+	return False
+
+
+def getBoundsFilepath (tripletFilepath: Path) -> Path:
+	tripletFilepath = Path(tripletFilepath)
+	return tripletFilepath.with_name(tripletFilepath.stem + BOUNDS_SUFFIX)
+
+
+def openAndReadConstraintTriplets (tripletFilepath: Path, boundsFilepath: Path) -> models.InputConstraintData:
+	'''
+		Reads a triplet constraint file and its bounds file, returning
+		the same InputConstraintData as openAndReadConstraintCSVAsSparse(...).
+		The triplets go straight into a models.SparseMatrix, there's never
+		a dense row or matrix.
+
+		A ValueError is raised pointing at the row of the first bad
+		cell, unknown constraint, or repeated constraint & variable pair.
+	'''
+	boundsFilepath = Path(boundsFilepath)
+	if not boundsFilepath.is_file():
+		raise ValueError(
+			f"Triplet constraint file {Path(tripletFilepath).name} needs a bounds " +
+			f"file with each constraint's operator & bound, {boundsFilepath.name}"
+		)
+
+	# Step 1: Constraints from the bounds file
+	const_names = []
+	vec_operators = []
+	bound_list = []
+	constInds = {}
+
+	for fileLine, row in _iterConstraintCSVRows(boundsFilepath):
+		if fileLine == None:
+			if [x.lower() for x in row] != BOUNDS_HEADER:
+				raise ValueError(f"Bounds file header should be {','.join(BOUNDS_HEADER)}, found {','.join(row)}")
+			continue
+
+		if len(row) != 3:
+			raise ValueError(f"Bounds file row {fileLine} has {len(row)} columns, expected 3")
+
+		name, op, bound = row
+		try:
+			bound_list.append(float(bound))
+		except ValueError:
+			raise ValueError(f"Bounds file contains non-float {bound} (row {fileLine}, right hand side)") from None
+
+		# Unnamed constraints are allowed (linting names them), they just can't have triplets
+		if name != "":
+			if name in constInds:
+				raise ValueError(f"Bounds file row {fileLine} repeats constraint '{name}'")
+			constInds[name] = len(const_names)
+
+		const_names.append(name)
+		vec_operators.append(op)
+
+	# Step 2: Nonzeros from the triplets
+	var_names = []
+	varInds = {}
+	rows = []
+	cols = []
+	vals = []
+
+	for fileLine, row in _iterConstraintCSVRows(tripletFilepath):
+		if fileLine == None:
+			continue
+
+		if len(row) != 3:
+			raise ValueError(f"Constraint file row {fileLine} has {len(row)} columns, expected 3")
+
+		constName, varName, coeff = row
+		rowInd = constInds.get(constName)
+		if rowInd == None:
+			raise ValueError(f"Constraint file row {fileLine} is for constraint '{constName}', which isn't in the bounds file")
+
+		colInd = varInds.get(varName)
+		if colInd == None:
+			colInd = len(var_names)
+			varInds[varName] = colInd
+			var_names.append(varName)
+
+		try:
+			vals.append(float(coeff))
+		except ValueError:
+			raise ValueError(
+				f"Constraint matrix contains non-float {coeff} " +
+				f"(row {fileLine}, column 3, variable '{varName}')"
+			) from None
+		rows.append(rowInd)
+		cols.append(colInd)
+
+	rows = np.array(rows, dtype=np.int64)
+	cols = np.array(cols, dtype=np.int64)
+
+	# [ Check ]: Each constraint has each variable at most once
+	keys = rows * max(1, len(var_names)) + cols
+	uniqueKeys, firstInds, counts = np.unique(keys, return_index=True, return_counts=True)
+	if np.any(counts > 1):
+		ind = firstInds[np.argmax(counts > 1)]
+		raise ValueError(
+			f"Constraint file lists variable '{var_names[cols[ind]]}' " +
+			f"in constraint '{const_names[rows[ind]]}' more than once"
+		)
+
+	return models.InputConstraintData(
+		var_names=var_names,
+		const_names=const_names,
+		vec_const_bounds=np.array(bound_list, dtype=np.float64),
+		vec_operators=vec_operators,
+		mat_constraint_coeffs=models.SparseMatrix.fromTriplets(rows, cols, vals, (len(const_names), len(var_names)))
+	)
+
+
 def convertInputToFinalModel (objData: models.InputObjectiveData, constData: models.InputConstraintData) -> models.FinalModel:
 	'''
 	DOES NOT LINT. It is expected that objData and constData were linted by lintInputData(...).
 
 	Combines objective & constraint data into a final model.
 	'''
-	# All the lists to populate
-	var_names = []
-	obj_coeffs = []
+	return convertToFinalModel(objData, convertConstraintDataToBlock(constData))
+
+
+def convertToFinalModel (objData: models.InputObjectiveData, constraints: models.ConstraintBlock, varIndex: Optional[models.NameIndex]=None) -> models.FinalModel:
+	'''
+	DOES NOT LINT. It is expected that objData was linted by lintObjectiveData(...)
+	against the constraint data the block was built from.
+
+	Lines the objective coefficients up with the block's variables. The
+	block is not copied, so many models can share one. When converting
+	many objectives against one block, pass a NameIndex of its var_names
+	so it's only built once.
+	'''
+	if varIndex == None:
+		varIndex = models.NameIndex(constraints.var_names)
 
+	obj_coeffs = [0.0] * len(objData.obj_coeffs)
+	for ind, name in enumerate(objData.var_names):
+		coef_ind = varIndex.indexOf(name)
+		obj_coeffs[coef_ind] = objData.obj_coeffs[ind]
+
+	return models.FinalModel(obj_coeffs=obj_coeffs, constraints=constraints)
+
+
+def convertConstraintDataToBlock (constData: models.InputConstraintData) -> models.ConstraintBlock:
+	'''
+	DOES NOT LINT. It is expected that constData was linted by lintConstraintData(...).
+
+	Splits the constraints by operator into an immutable ConstraintBlock.
+	'''
+	if isinstance(constData.mat_constraint_coeffs, models.SparseMatrix):
+		return _convertSparseConstraintDataToBlock(constData)
+
+	# All the lists to populate
 	le_const_names = []
 	le_vec = []
 	le_mat = []
@@ -122,13 +435,6 @@ def convertInputToFinalModel (objData: models.InputObjectiveData, constData: mod
 	eq_vec = []
 	eq_mat = []
 
-	# Actually populating the lists
-	var_names = constData.var_names
-	obj_coeffs = [0.0] * len(objData.obj_coeffs)
-	for ind, name in enumerate(objData.var_names):
-		coef_ind = var_names.index(name)
-		obj_coeffs[coef_ind] = objData.obj_coeffs[ind]
-
 	for ind, name in enumerate(constData.const_names):
 		# TODO: This .lower().strip() should happen in the linting step
 		op = constData.vec_operators[ind].lower().strip()
@@ -146,14 +452,53 @@ def convertInputToFinalModel (objData: models.InputObjectiveData, constData: mod
 			eq_vec.append(constData.vec_const_bounds[ind])
 			eq_mat.append(constData.mat_constraint_coeffs[ind])
 
-	return models.FinalModel(
-		var_names=var_names, obj_coeffs=obj_coeffs,
-		le_const_names=le_const_names, le_vec=le_vec, le_mat=le_mat,
-		ge_const_names=ge_const_names, ge_vec=ge_vec, ge_mat=ge_mat,
-		eq_const_names=eq_const_names, eq_vec=eq_vec, eq_mat=eq_mat
+	return models.ConstraintBlock(
+		var_names=tuple(constData.var_names),
+		le_const_names=tuple(le_const_names), le_vec=le_vec, le_mat=le_mat,
+		ge_const_names=tuple(ge_const_names), ge_vec=ge_vec, ge_mat=ge_mat,
+		eq_const_names=tuple(eq_const_names), eq_vec=eq_vec, eq_mat=eq_mat
 		)
 
 
+def _convertSparseConstraintDataToBlock (constData: models.InputConstraintData) -> models.ConstraintBlock:
+	'''
+	convertConstraintDataToBlock(...) for constraint data read by
+	openAndReadConstraintCSVAsSparse(...) or the triplet reader
+
+	Rows are split by operator with index arrays, so each matrix in the
+	block is its own SparseMatrix. Everything is made read only.
+	'''
+	ops = np.array([op.lower().strip() for op in constData.vec_operators], dtype=object)
+	const_names = np.array(constData.const_names, dtype=object)
+	mat = constData.mat_constraint_coeffs
+	split = {}
+
+	for opClass in ['le', 'ge', 'eq']:
+		inds = np.flatnonzero(ops == opClass)
+		split[opClass] = (
+			tuple(const_names[inds].tolist()),
+			_readOnly(np.asarray(constData.vec_const_bounds, dtype=np.float64)[inds]),
+			_readOnly(mat.selectRows(inds))
+		)
+
+	return models.ConstraintBlock(
+		var_names=tuple(constData.var_names),
+		le_const_names=split['le'][0], le_vec=split['le'][1], le_mat=split['le'][2],
+		ge_const_names=split['ge'][0], ge_vec=split['ge'][1], ge_mat=split['ge'][2],
+		eq_const_names=split['eq'][0], eq_vec=split['eq'][1], eq_mat=split['eq'][2]
+		)
+
+
+def _readOnly (arr: Union[np.ndarray, models.SparseMatrix]):
+	'''
+	Marks a bounds vector (or all the arrays in a SparseMatrix) as read only
+	'''
+	toLock = [arr.data, arr.indices, arr.indptr] if isinstance(arr, models.SparseMatrix) else [arr]
+	for a in toLock:
+		a.setflags(write=False)
+	return arr
+
+
 
 
 
@@ -170,13 +515,114 @@ def lintInputDataFromFilepaths (objFilePath: str, constrFilePath: str) -> Union[
 	'''
 		Same outputs as lintInputData()
 
-		Read its docstring for info
+		Read its docstring for info. The constraint file (wide or
+		triplets) is read straight into a sparse float matrix, so any
+		non-numeric cell is reported (with its row & column) as an error here.
 	'''
 	objData = openAndReadObjectiveCSV(objFilePath)
-	constrData = openAndReadConstraintCSV(constrFilePath)
+	try:
+		constrData = openAndReadConstraintFile(constrFilePath)
+	except ValueError as err:
+		return None, None, [str(err)]
 	return lintInputData(objData, constrData)
 
 
+def lintAndConvertFromFilepaths (objFilePath: str, constrFilePath: str, cache: Optional[modelcache.ModelCache]=None) -> Tuple[Optional[models.FinalModel], List[str]]:
+	'''
+		Reads, lints and converts a single objective & constraint file
+		pair. See lintAndConvertManyFromFilepaths() for outputs.
+	'''
+	return lintAndConvertManyFromFilepaths([objFilePath], constrFilePath, cache)[0]
+
+
+def lintAndConvertManyFromFilepaths (objFilePaths: List[Path], constrFilePath: str, cache: Optional[modelcache.ModelCache]=None) -> List[Tuple[Optional[models.FinalModel], List[str]]]:
+	'''
+		Loads many objective files which all share one constraint file.
+
+		The constraint file is read, linted and converted only once, into a
+		ConstraintBlock which every returned FinalModel shares. Each objective
+		file then only has its own vector read and checked against it.
+
+		If a cache is passed, files which were loaded before (same contents and
+		same LINT_VERSION) are memory mapped from it instead of parsed.
+
+		Returns a list parallel to objFilePaths of (FinalModel, ["Messages"]).
+		Like lintInputData(), a None model means the messages are errors,
+		otherwise they are warnings. Constraint file warnings are repeated
+		for every objective file.
+	'''
+	constKey = None
+	cached = None
+	if cache != None:
+		with timing.phase('cache'):
+			constHashes = [modelcache.hashFile(p) for p in getConstraintFilepaths(constrFilePath)]
+			constKey = modelcache.makeKey('const', LINT_VERSION, *constHashes)
+			cached = cache.getConstraints(constKey)
+
+	if cached != None:
+		constraints, constMessages = cached
+	else:
+		try:
+			with timing.phase('read_csv'):
+				constData = openAndReadConstraintFile(constrFilePath)
+		except ValueError as err:
+			return [(None, [str(err)]) for _ in objFilePaths]
+
+		with timing.phase('lint'):
+			constData, constMessages = lintConstraintData(constData)
+		if constData == None:
+			return [(None, constMessages) for _ in objFilePaths]
+
+		with timing.phase('convert'):
+			constraints = convertConstraintDataToBlock(constData)
+		if cache != None:
+			with timing.phase('cache'):
+				cache.putConstraints(constKey, constraints, constMessages)
+
+	loaded = []
+	varIndex = models.NameIndex(constraints.var_names)
+
+	for objFilePath in objFilePaths:
+		objKey = None
+		if cache != None:
+			with timing.phase('cache'):
+				objKey = modelcache.makeKey('obj', constKey, modelcache.hashFile(objFilePath))
+				cachedObj = cache.getObjective(objKey)
+
+			if cachedObj != None:
+				obj_coeffs, objMessages = cachedObj
+				finalModel = models.FinalModel(obj_coeffs=obj_coeffs, constraints=constraints)
+				loaded.append((finalModel, constMessages + objMessages))
+				continue
+
+		try:
+			with timing.phase('read_csv'):
+				objData = openAndReadObjectiveCSV(objFilePath)
+		except (ValueError, IndexError) as err:
+			loaded.append((None, [f"Unable to read objective file: {err}"]))
+			continue
+
+		with timing.phase('lint'):
+			objData, objMessages = lintObjectiveData(objData, constraints.var_names)
+		if objData == None:
+			loaded.append((None, objMessages))
+			continue
+
+		with timing.phase('convert'):
+			finalModel = convertToFinalModel(objData, constraints, varIndex)
+		loaded.append((finalModel, constMessages + objMessages))
+
+		if cache != None:
+			with timing.phase('cache'):
+				cache.putObjective(objKey, finalModel.obj_coeffs, objMessages)
+
+	if cache != None:
+		with timing.phase('cache'):
+			cache.evict()
+
+	return loaded
+
+
 def lintInputData (objData: models.InputObjectiveData, constData: models.InputConstraintData) -> Union[models.InputObjectiveData, models.InputConstraintData, str]:
 	'''
 		Goes through the data in the CSVs and runs some checks. It will return either:
@@ -184,27 +630,42 @@ def lintInputData (objData: models.InputObjectiveData, constData: models.InputCo
 			2. (InputObjData, InputConstData, ["Warning Messages"]) in the case of succesfull linting
 		The final entry will always be an array of strings. Whether they are warnings or errors depends on whether
 		the data objects are None. If there are no warnings, the list will be empty.
+
+		This is lintConstraintData() followed by lintObjectiveData()
+	'''
+	constData, warningList = lintConstraintData(constData)
+	if constData == None:
+		return None, None, warningList
+
+	objData, objMessages = lintObjectiveData(objData, constData.var_names)
+	if objData == None:
+		return None, None, objMessages
+
+	return objData, constData, warningList + objMessages
+
+
+def lintConstraintData (constData: models.InputConstraintData) -> Union[models.InputConstraintData, List[str]]:
+	'''
+		Runs the checks that only need the constraint file. It will return either:
+			1. (None, ["Error Message"]) in the case of an error
+			2. (InputConstData, ["Warning Messages"]) otherwise
+
+		Models don't need every constraint class (le, ge, eq), the
+		pyomo models handle empty ones as is.
 	'''
-	objVars = objData.var_names
 	constVars = constData.var_names
 	warningList = []
 
 
 	# [ Check ]: No duplicate or unnamed variables
-	errMsg = checkVarNameList(objVars)
-	if (errMsg):
-		return None, None, ["Error in objective file variable names: " + errMsg]
-
 	errMsg = checkVarNameList(constVars)
 	if (errMsg):
-		return None, None, ["Error in constraint file variable name: " + errMsg]
+		return None, ["Error in constraint file variable name: " + errMsg]
 
 
-	# [ Check ]: Variables in the objective file match those in the
-	# 			 constraint file
-	errMsg = checkVarNamesMatch(objVarNames=objVars, constVarNames=constVars)
-	if (errMsg):
-		return None, None, [errMsg]
+	# [ Check ]: There exists at least one variable
+	if len(constVars) == 0:
+		return None, ["No variables found!"]
 
 
 	# [ Check + Fix ]: All constraint are named
@@ -216,83 +677,90 @@ def lintInputData (objData: models.InputObjectiveData, constData: models.InputCo
 
 	# [ Check ]: There exists at least one constraint
 	if len(constData.const_names) == 0:
-		return None, None, ["No constraints found!"]
+		return None, ["No constraints found!"]
 
 
 	# [ Check ]: Remove unrecognized operators
-	allOps = constData.vec_operators
 	# TODO: This is really ugly for adding new constraint types
 	opClasses = ['le', 'eq', 'ge']
-	indsToRemove = []
+	keep = np.array([op in opClasses for op in constData.vec_operators], dtype=bool)
 
-	for ind, op in enumerate(allOps):
-		if not op in opClasses:
-			indsToRemove.append(ind)
+	for ind in np.flatnonzero(~keep):
+		warningList.append(f"Found unrecognized constraint operator {constData.vec_operators[ind]}" + \
+						   f"named '{constData.const_names[ind]}'. Skipping it.")
 
-			warningList.append(f"Found unrecognized constraint operator {op}" + \
-							   f"named '{constData.constraint_names[ind]}'. Skipping it.")
+	# Every list & the matrix are filtered once with the same mask
+	if not keep.all():
+		constData.const_names = [name for name, k in zip(constData.const_names, keep) if k]
+		constData.vec_operators = [op for op, k in zip(constData.vec_operators, keep) if k]
+		constData.vec_const_bounds = _keepRows(constData.vec_const_bounds, keep)
+		constData.mat_constraint_coeffs = _keepRows(constData.mat_constraint_coeffs, keep)
 
-	# Very important we start with the largest indicies first (reversed list)
-	for ind in reversed(indsToRemove):
-		constData.const_names.pop(ind)
-		constData.vec_const_bounds.pop(ind)
-		constData.vec_operators.pop(ind)
-		constData.mat_constraint_coeffs.pop(ind)
 
+	# [ Check ]: Note any constraint types with no constraints
+	presentOps = set(constData.vec_operators)
+	missingOps = [op for op in opClasses if op not in presentOps]
 
-	# [ Check ]: There is at least one of each constraint type
-	allOps = constData.vec_operators
-	opClasses = ['le', 'eq', 'ge']
-	missingOps = opClasses[:]
+	if len(missingOps) != 0:
+		warningList.append(f"No constraints found for types: {' '.join(missingOps)}")
 
-	for op in allOps:
-		if op in missingOps:
-			missingOps.remove(op)
 
-	if len(missingOps) != 0:
-		warningList.append(f"No constraints found for types: {' '.join(missingOps)}." + 
-						   f" Adding dummy constraints & variables for them")
+	# [ Check ]: Constraint array lengths match 
+	num_constrs = len(constData.const_names)
+	if num_constrs != len(constData.vec_const_bounds) or \
+		num_constrs != len(constData.vec_operators) or \
+		num_constrs != len(constData.mat_constraint_coeffs):
+			return None, [f"Found mismatch between number of constraint names, number of bounds (right hand sides), number of operators, and number of rows in matrix"]
 
+	# [ Check & Fix ]: Cast Constraint Data to floats
+	# The sparse readers have already done this (and reported bad cells)
+	if isinstance(constData.mat_constraint_coeffs, models.SparseMatrix):
+		return constData, warningList
 
-	# [ Fix ]: Add dummy constraints & vars for each non-existent constraint class
-	for op in missingOps:
-		dumVar1, suffix = getNextAvailableDummyName(constData.var_names, 'dummy')
-		dumVar2, _ = getNextAvailableDummyName(constData.var_names, 'dummy', startInd=suffix+1)
+	_errMsg = 'Constraint matrix contains non-float '
+	for ind in range(num_constrs):
+		try:
+			constData.vec_const_bounds[ind] = float(constData.vec_const_bounds[ind])
+		except ValueError:
+			return None, [_errMsg + f"{constData.vec_const_bounds[ind]}"]
+		
+		for varind in range(len(constData.var_names)):
+			try:
+				constData.mat_constraint_coeffs[ind][varind] = float(constData.mat_constraint_coeffs[ind][varind])
+			except ValueError:
+				return None, [_errMsg + f"{constData.mat_constraint_coeffs[ind][varind]}"]
+	
 
-		constData.var_names.append(dumVar1)
-		constData.var_names.append(dumVar2)
-		objData.var_names.append(dumVar1)
-		objData.var_names.append(dumVar2)
+	return constData, warningList
 
-		# Resizing all previous constraints to have 0 coeffs for the new variables
-		for ind, _ in enumerate(constData.mat_constraint_coeffs):
-			constData.mat_constraint_coeffs[ind] += [0, 0]
 
-		# Since we're maximizing the function, making these negative
-		# will mean dummyVar1 & 2 always equal 0 and keep the actual objective
-		objData.obj_coeffs.append(-1)
-		objData.obj_coeffs.append(-1)
+def lintObjectiveData (objData: models.InputObjectiveData, constVarNames: List[str]) -> Union[models.InputObjectiveData, List[str]]:
+	'''
+		Checks an objective file against the variables of an already
+		linted constraint file (see lintConstraintData). It will return either:
+			1. (None, ["Error Message"]) in the case of an error
+			2. (InputObjData, ["Warning Messages"]) in the case of succesfull linting
+	'''
+	objVars = objData.var_names
+	warningList = []
 
-		# Construct a list in the form [0, 0, ..., 0, 1, 1] so the constraint
-		# involves the two dummy variables
-		constraint_coeffs = [0] * len(constData.var_names)
-		constraint_coeffs[-2:] = [1, 1]
 
-		dumConstName, _ = getNextAvailableDummyName(constData.const_names, 'dummy' + op.upper())
+	# [ Check ]: No duplicate or unnamed variables
+	errMsg = checkVarNameList(objVars)
+	if (errMsg):
+		return None, ["Error in objective file variable names: " + errMsg]
 
-		constData.const_names.append(dumConstName)
-		constData.vec_const_bounds.append(0)
-		constData.vec_operators.append(op)
-		constData.mat_constraint_coeffs.append(constraint_coeffs)
 
-		warningList.append(f'No {op.upper()} constraint found, adding variables' +
-						   f' "{dumVar1}", "{dumVar2}" and constraint "{dumConstName}"')
+	# [ Check ]: Variables in the objective file match those in the constraint file
+	errMsg = checkVarNamesMatch(objVarNames=objVars, constVarNames=constVarNames)
+	if (errMsg):
+		return None, [errMsg]
 
 
 	# [ Check ]: Objective file lengths match up
 	num_vars = len(objData.var_names)
 	if num_vars != len(objData.obj_coeffs):
-		return None, None, [f"Differen number of coefficients ({len(objData.obj_coeffs)}) to number of variables ({num_vars})"]
+		return None, [f"Differen number of coefficients ({len(objData.obj_coeffs)}) to number of variables ({num_vars})"]
 
 	# [ Check & Fix ]: Cast Objective Function to floats
 	for ind in range(num_vars):
@@ -300,32 +768,10 @@ def lintInputData (objData: models.InputObjectiveData, constData: models.InputCo
 		try:
 			objData.obj_coeffs[ind] = float(objData.obj_coeffs[ind])
 		except ValueError:
-			return None, None, [f"Found non-float in objective function: {objData.obj_coeffs[ind]}"]
-	
-
-	# [ Check ]: Constraint array lengths match 
-	num_constrs = len(constData.const_names)
-	if num_constrs != len(constData.vec_const_bounds) or \
-		num_constrs != len(constData.vec_operators) or \
-		num_constrs != len(constData.mat_constraint_coeffs):
-			return None, None, [f"Found mismatch between number of constraint names, number of bounds (right hand sides), number of operators, and number of rows in matrix"]
+			return None, [f"Found non-float in objective function: {objData.obj_coeffs[ind]}"]
 
-	# [ Check & Fix ]: Cast Constraint Data to floats
-	_errMsg = 'Constraint matrix contains non-float '
-	for ind in range(num_constrs):
-		try:
-			constData.vec_const_bounds[ind] = float(constData.vec_const_bounds[ind])
-		except ValueError:
-			return None, None, [_errMsg + f"{constData.vec_const_bounds[ind]}"]
-		
-		for varind in range(len(constData.var_names)):
-			try:
-				constData.mat_constraint_coeffs[ind][varind] = float(constData.mat_constraint_coeffs[ind][varind])
-			except ValueError:
-				return None, None, [_errMsg + f"{constData.mat_constraint_coeffs[ind][varind]}"]
-	
 
-	return objData, constData, warningList
+	return objData, warningList
 
 
 def checkVarNameList (varNameList: List[str]) -> str:
@@ -341,10 +787,9 @@ def checkVarNameList (varNameList: List[str]) -> str:
 		if varName.strip() == "":
 			return "Unnamed variable found"
 
-	if len(varNameList) != len(set(varNameList)):
-		duplicates = [name for name in varNameList if varNameList.count(name) > 1]
-		duplicates = [str(x) for x in list(set(duplicates))]
-		return f"Repeated variable names: {' '.join(duplicates)}"
+	duplicates = models.NameIndex(varNameList).duplicates
+	if len(duplicates) != 0:
+		return f"Repeated variable names: {' '.join(str(x) for x in duplicates)}"
 
 	return None
 
@@ -381,6 +826,27 @@ def checkVarNamesMatch (objVarNames: List[str], constVarNames: List[str]) -> str
 	assert(False)
 
 
+#
+# Editing the constraint matrix
+#
+# The matrix is either a list of lists from openAndReadConstraintCSV(...)
+# or a SparseMatrix from openAndReadConstraintCSVAsSparse(...), whose
+# bounds are a float64 vector. These return new objects rather than
+# mutating, so callers should reassign.
+
+def _keepRows (mat, keep: np.ndarray):
+	'''
+	Only the rows (or entries of a bounds vector) where the boolean mask
+	keep is True
+	'''
+	if isinstance(mat, models.SparseMatrix):
+		return mat.selectRows(np.flatnonzero(keep))
+	if isinstance(mat, np.ndarray):
+		return mat[keep]
+
+	return [row for row, k in zip(mat, keep) if k]
+
+
 #
 # Filling in lists
 
@@ -391,18 +857,22 @@ def fillInEmptyNames (nameList: list, nameBase: str) -> Union[List[str], bool]:
 		any empty entries were found.
 	'''
 	filledList = [x for x in nameList] # duplicate the list
+	takenNames = models.NameIndex(filledList)
 	anyEmptiesFound = False
+	num = 0
 
 	for ind, constName in enumerate(filledList):
 		if constName.strip() == "":
 			anyEmptiesFound = True
-			newConstName = getNextAvailableDummyName(filledList, nameList)
+			# Numbers below num are already taken, no need to check them again
+			newConstName, num = getNextAvailableDummyName(takenNames, nameBase, startInd=num)
 			filledList[ind] = newConstName
+			takenNames.append(newConstName)
 
 	return filledList, anyEmptiesFound
 
 
-def getNextAvailableDummyName (nameList: List[str], nameBase: str, startInd: int=0) -> Union[str, int]:
+def getNextAvailableDummyName (nameList: Union[List[str], models.NameIndex], nameBase: str, startInd: int=0) -> Union[str, int]:
 	'''
 		This searches through a list to find the first unused
 		string in the form nameBase + a number.
@@ -410,16 +880,14 @@ def getNextAvailableDummyName (nameList: List[str], nameBase: str, startInd: int
 		For example, given
 			- nameBase = 'un'
 			- nameList = ['un0', 'un1', 'un3']
-		this would return 'un2'
-	'''
-	num = startInd
-	outStr = nameBase + str(num)
+		this would return ('un2', 2)
 
-	while (outStr in nameList):
-		num += 1
-		outStr = nameBase + str(num)
-
-	return outStr, num
+		Pass a models.NameIndex when calling this repeatedly on the same
+		names, otherwise one is built every call.
+	'''
+	if not isinstance(nameList, models.NameIndex):
+		nameList = models.NameIndex(nameList)
+	return nameList.nextAvailable(nameBase, startInd)
 
 
 
@@ -454,29 +922,16 @@ def convertFinalModelToDataDict (modeldata: models.FinalModel):
 	for constr, coef in zip(fm.eq_const_names, fm.eq_vec):
 		vec_eq[constr] = coef
 	
-	mat_le = {}
-	for ind, constr in enumerate(fm.le_const_names):
-		for varind, value in enumerate(fm.le_mat[ind]):
-			varname = fm.var_names[varind]
-			mat_le[(constr, varname)] = value
-	
-	mat_ge = {}
-	for ind, constr in enumerate(fm.ge_const_names):
-		for varind, value in enumerate(fm.ge_mat[ind]):
-			varname = fm.var_names[varind]
-			mat_ge[(constr, varname)] = value
-	
-	mat_eq = {}
-	for ind, constr in enumerate(fm.eq_const_names):
-		for varind, value in enumerate(fm.eq_mat[ind]):
-			varname = fm.var_names[varind]
-			mat_eq[(constr, varname)] = value
+	# Only nonzeros are sent, the pyomo model defaults missing entries to 0
+	mat_le = _matrixToSparseDict(fm.le_mat, fm.le_const_names, fm.var_names)
+	mat_ge = _matrixToSparseDict(fm.ge_mat, fm.ge_const_names, fm.var_names)
+	mat_eq = _matrixToSparseDict(fm.eq_mat, fm.eq_const_names, fm.var_names)
 
 	datadict = { None:{
-		'index_vars': {None: fm.var_names},
-		'index_le_consts': {None: fm.le_const_names},
-		'index_ge_consts': {None: fm.ge_const_names},
-		'index_eq_consts': {None: fm.eq_const_names},
+		'index_vars': {None: list(fm.var_names)},
+		'index_le_consts': {None: list(fm.le_const_names)},
+		'index_ge_consts': {None: list(fm.ge_const_names)},
+		'index_eq_consts': {None: list(fm.eq_const_names)},
 		'vec_objective': vec_obj,
 		'mat_le': mat_le,
 		'vec_le': vec_le,
@@ -486,12 +941,31 @@ def convertFinalModelToDataDict (modeldata: models.FinalModel):
 		'vec_eq': vec_eq
 	} }
 
-	print("Did model -> dict conversion")
+	_log.debug("Did model -> dict conversion")
 	# pprint.pprint(datadict)
 
 	return datadict
 
 
+def _matrixToSparseDict (mat: models.Matrix, rowNames: List[str], varNames: List[str]) -> dict:
+	'''
+	Returns {(rowName, varName): value} for only the nonzero entries
+	'''
+	matDict = {}
+
+	if isinstance(mat, models.SparseMatrix):
+		for rowInd, varInd, value in mat.iterNonzeros():
+			matDict[(rowNames[rowInd], varNames[varInd])] = value
+		return matDict
+
+	for ind, constr in enumerate(rowNames):
+		for varind, value in enumerate(mat[ind]):
+			if value != 0:
+				matDict[(constr, varNames[varind])] = float(value)
+
+	return matDict
+
+
 
 
 
@@ -553,6 +1027,11 @@ def writeTopComment (outFile, objFilepath: str, constFilepath: str) -> None:
 def writeVector (outFile, vectorName: str, vector: list, indexNames: list) -> None:
 	assert(len(vector) == len(indexNames))
 
+	# .dat files can't have an empty param block, and with an empty
+	# index set there's nothing to give anyway
+	if len(vector) == 0:
+		return
+
 	outFile.write(f'\nparam {vectorName} := \n')
 	for ind, objCoef in enumerate(vector):
 		outFile.write(f'\t{indexNames[ind]} {objCoef}\n')
@@ -560,9 +1039,16 @@ def writeVector (outFile, vectorName: str, vector: list, indexNames: list) -> No
 
 
 def writeMatrix (outFile, matrixName: str, matrix: list, rowNames: list, varNames: list, ) -> None:
+	if isinstance(matrix, models.SparseMatrix):
+		matrix = matrix.toDense()
+
 	# The indexing sets need to have the same lengths as the matrix
 	assert(len(matrix) == len(rowNames))
-	assert(len(matrix) > 0 and len(matrix[0]) == len(varNames))
+
+	# Same as writeVector(...), no constraints of this type means no block
+	if len(matrix) == 0:
+		return
+	assert(len(matrix[0]) == len(varNames))
 
 	# First, we need the line 'param matName: 1 2 ... 6 7 :='
 	outFile.write(f'\nparam {matrixName}: ')
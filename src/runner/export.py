@@ -1,7 +1,7 @@
 '''
 Export.py
 
-This file handles all exporting. Pass in names, results, instances and this will
+This file handles all exporting. Pass in names and RunResults and this will
 write to files.
 
 The architecture here is actually kinda bad, I use function pointers so you
@@ -9,21 +9,42 @@ lose typing info and I even have to resort to lambdas :/. A lot of functions
 have asserts though so that should act as a guard rail.
 '''
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 import csv
+import itertools
+import json
+import logging
 import os
 import pathlib
 from pprint import pprint
+import sqlite3
 import sys
-from typing import Dict, Union, List, Tuple, Optional
-import pyomo.environ as pyo
-import pyomo.opt as opt
+import time
+from typing import Deque, Dict, Union, List, Tuple, Optional
+
+import numpy as np
 
 import runner.converter as converter
+import runner.model_data_classes as models
 import runner.text as text
 import runner.pyomo_runner as pyomo_runner
+import runner.timing as timing
+
+
+_log = logging.getLogger(__name__)
 
 # TODO: Why am I returning ints? Why not just return error messages ?
 
+# 'csv' & 'txt' write files per run, 'long-csv' & 'parquet' write one
+# table per result kind holding every run, see LongTableExporter
+# 'sqlite' adds every run to a database in the output folder, see SQLiteExporter
+OUT_TYPES = ['csv', 'txt', 'long-csv', 'parquet', 'sqlite']
+LONG_OUT_TYPES = ['long-csv', 'parquet']
+
+# Threads writing per run files at once, see RunExporter
+DEFAULT_EXPORT_THREADS = 4
+
 
 
 # =====================================================================================
@@ -33,70 +54,106 @@ import runner.pyomo_runner as pyomo_runner
 
 def exportRuns (outDir: str,
                 runNames: List[str],
-                instances: List[pyo.ConcreteModel],
-                results: List[opt.SolverResults],
+                results: List[models.RunResult],
                 outType: str,
-                splitUnders: bool) -> int:
+                splitUnders: bool,
+                loadPhases: Optional[timing.PhaseRecorder]=None,
+                numThreads: int=DEFAULT_EXPORT_THREADS) -> int:
     '''
     Exports runs.
-     - outType: str 'csv' or 'txt'. Tells what type of file to save each run as
+     - outType: one of OUT_TYPES. Tells what type of file to save each run as
      - splitUnders: if a csv, will split the variable names by underscores
             'asv_343' -> 'asv', '343 as seperate columns
      - outDir: the directory into which a new folder is created
+     - loadPhases: timings from loading the models, for TIMING.json
+     - numThreads: runs written at once with csv & txt, see RunExporter
     '''
-    assert(outType == 'csv' or outType == 'txt')
-    assert(len(runNames) == len(instances) == len(results))
+    assert(outType in OUT_TYPES)
+    assert(len(runNames) == len(results))
     assert(pathlib.Path(outDir).exists())
     assert(pathlib.Path(outDir).is_dir())
 
+    numWritten = -1
+
     if outType == 'csv':
-        exportManyAsCSV(
+        numWritten = exportManyAsCSV(
             outDir,
             runNames,
-            instances,
             results,
-            splitUnders
+            splitUnders,
+            loadPhases,
+            numThreads
         )
     elif outType == 'txt':
-        exportManyAsTXT(
+        numWritten = exportManyAsTXT(
             outDir,
             runNames,
-            instances,
-            results
+            results,
+            loadPhases,
+            numThreads
+        )
+    else:
+        numWritten = _writeAllRuns(
+            makeRunExporter(outDir, outType, splitUnders),
+            runNames,
+            results,
+            loadPhases
         )
 
     print("Export success :)")
+    return numWritten
+
+
+def makeRunExporter (outDir: str, outType: str, splitUnders: bool, numThreads: int=DEFAULT_EXPORT_THREADS) -> 'RunExporter':
+    '''
+    Same options as exportRuns(...), but for writing runs one at a
+    time as they finish, see RunExporter
+
+    The long formats ignore splitUnders, names are kept whole. They and
+    sqlite write to shared files, so always one run at a time
+    '''
+    assert(outType in OUT_TYPES)
+
+    if outType == 'sqlite':
+        return SQLiteExporter(outDir)
+    elif outType == 'long-csv':
+        return LongTableExporter(_CSVTable, '.csv', outDir)
+    elif outType == 'parquet':
+        return LongTableExporter(_ParquetTable, '.parquet', outDir)
+    elif outType == 'csv':
+        return RunExporter(
+            lambda runPath, res: exportSingleAsCSVs(runPath, res, splitUnders),
+            exportSummaryCSV,
+            outDir,
+            numThreads
+        )
+    else:
+        return RunExporter(exportSingleAsTXT, exportSummaryTXT, outDir, numThreads)
 
 
 def exportSummaryTXT (outfile,
                     runNames: List[str],
-                    instances: List[pyo.ConcreteModel],
-                    results: List[opt.SolverResults]):
+                    results: List[models.RunResult]):
     '''
     Generates a .txt file with descriptions of all runs in aggregate
     '''
     assert(type(outfile) == str)
     assert(outfile[:-4] != '.txt')
-    summaryText = text.exportSummaryText(runNames, instances, results)
-
     with open(outfile + '.txt', 'w') as f:
-        f.write(summaryText)
+        text.writeSummaryText(f, runNames, results)
 
 
 def exportSummaryCSV (outfile,
                     runNames: List[str],
-                    instances: List[pyo.ConcreteModel],
-                    results: List[opt.SolverResults]):
+                    results: List[models.RunResult]):
     '''
     Generates a .csv file with summary statistics for all runs
     '''
     assert(type(outfile) == str)
     assert(outfile[:-4] != '.csv')
 
-    all_runs_info = []
-    for inst, res in zip(instances, results):
-        all_runs_info.append(pyomo_runner.getRunSummary(inst, res))
-    
+    all_runs_info = [{**res.summary(), **res.timingSummary()} for res in results]
+
     fields = ['name'] + list(all_runs_info[0].keys())
 
     with open(outfile + '.csv', 'w', newline='') as f:
@@ -108,8 +165,7 @@ def exportSummaryCSV (outfile,
 
 
 def exportSingleAsTXT (outfile, 
-                    instance: pyo.ConcreteModel, 
-                    result: opt.SolverResults) -> int:
+                    result: models.RunResult) -> int:
     '''
     Converts a run into a single .txt file
 
@@ -125,20 +181,19 @@ def exportSingleAsTXT (outfile,
     # With .txt files, we can export even if unsuccesfull
     # so we don't check for optimal termination
 
-    runOut = text.exportRunText(instance, result)
-
     with open(outfile + ".txt", 'w') as f:
-        f.write(runOut)
+        text.writeRunText(f, result)
     
     return 1
  
 
 def exportManyAsTXT (outFolder,
                     runNames: List[str],
-                    instances: List[pyo.ConcreteModel],
-                    results: List[opt.SolverResults]) -> int:
+                    results: List[models.RunResult],
+                    loadPhases: Optional[timing.PhaseRecorder]=None,
+                    numThreads: int=DEFAULT_EXPORT_THREADS) -> int:
     '''
-    Converts parallel lists of instances and results to file files.
+    Converts parallel lists of names and results to files.
 
     Attempts to create a folder within the specified directory
 
@@ -151,16 +206,16 @@ def exportManyAsTXT (outFolder,
         exportSummaryTXT,
         outFolder,
         runNames,
-        instances,
-        results
+        results,
+        loadPhases,
+        numThreads
     )
 
     return nWritten
 
 
 def exportSingleAsCSVs (outfile, 
-                    instance: pyo.ConcreteModel, 
-                    result: opt.SolverResults,
+                    result: models.RunResult,
                     splitUnders: bool=True) -> int:
     '''
     Converts a single run to multiple .csvs
@@ -179,15 +234,14 @@ def exportSingleAsCSVs (outfile,
     assert(str(outfile)[:-4] != '.csv')
 
     # For csv, we can only export optimal solutions
-    status = result.solver.status
-    if status != 'ok':
+    if not result.isOptimal():
         return 0
 
     # Start off with variables values
-    decvars_values = pyomo_runner.getVariableValues(instance)
-    shadow_prices = pyomo_runner.getShadowPrices(instance)
-    ge_slack = pyomo_runner.getSlackGE(instance)
-    le_slack = pyomo_runner.getSlackLE(instance)
+    decvars_values = result.varValuesDict()
+    shadow_prices = result.shadowPricesDict()
+    ge_slack = result.slackGEDict()
+    le_slack = result.slackLEDict()
 
 
     header = []
@@ -240,11 +294,12 @@ def exportSingleAsCSVs (outfile,
 
 def exportManyAsCSV (outFolder,
                     runNames: List[str],
-                    instances: List[pyo.ConcreteModel],
-                    results: List[opt.SolverResults],
-                    splitUnders=False) -> int:
+                    results: List[models.RunResult],
+                    splitUnders=False,
+                    loadPhases: Optional[timing.PhaseRecorder]=None,
+                    numThreads: int=DEFAULT_EXPORT_THREADS) -> int:
     '''
-    Converts parallel lists of instances and results to file files.
+    Converts parallel lists of names and results to files.
 
     Attempts to create a folder within the specified directory
 
@@ -252,15 +307,16 @@ def exportManyAsCSV (outFolder,
     '''
     return _exportManyRuns(
         # Yea this is a code smell ...
-        # Basically, exportMany passes 3 parameters to the exportFunction,
-        # but exportCSV requires a fourth one (splitUnders), so I'm wrapping it in
+        # Basically, exportMany passes 2 parameters to the exportFunction,
+        # but exportCSV requires a third one (splitUnders), so I'm wrapping it in
         # a lambda
-        lambda runPath, inst, res: exportSingleAsCSVs(runPath, inst, res, splitUnders),
+        lambda runPath, res: exportSingleAsCSVs(runPath, res, splitUnders),
         exportSummaryCSV,
         outFolder,
         runNames,
-        instances,
-        results
+        results,
+        loadPhases,
+        numThreads
     )
 
 
@@ -300,41 +356,542 @@ def _exportManyRuns (funcExportRun,
                 funcExportSummary,
                 outFolder, 
                 runNames: List[str],
-                instances: List[pyo.ConcreteModel],
-                results: List[opt.SolverResults]) -> int:
-    numExport = 0
+                results: List[models.RunResult],
+                loadPhases: Optional[timing.PhaseRecorder]=None,
+                numThreads: int=DEFAULT_EXPORT_THREADS) -> int:
+    exporter = RunExporter(funcExportRun, funcExportSummary, outFolder, numThreads)
+    return _writeAllRuns(exporter, runNames, results, loadPhases)
 
-    # Step 1: Create sub directory
-    if _isInvalidDir(outFolder):
+
+def _writeAllRuns (exporter: 'RunExporter',
+                runNames: List[str],
+                results: List[models.RunResult],
+                loadPhases: Optional[timing.PhaseRecorder]=None) -> int:
+    if not exporter.begin():
         return -1
 
-    outDir = pathlib.Path(outFolder)
-    time_str = text.getTimestamp()
-    subdir = f'RunOutput-{time_str}'
-    outDir = outDir.joinpath(subdir)
+    for name, res in zip(runNames, results):
+        exporter.writeRun(name, res)
+
+    return exporter.finish(loadPhases)
+
+
 
-    try:
-        os.mkdir(outDir)
-    except Exception:
-        return -1
 
-    # Step 2: Write to it
-    summaryFile = str(outDir.joinpath('SUMMARY'))
-    funcExportSummary(summaryFile, runNames, instances, results)
+class RunExporter:
+    '''
+    Writes runs to a new RunOutput-<time> folder one at a time, so
+    results can be saved (and thrown away) as soon as each model is solved
+
+        exporter = RunExporter(...)
+        if exporter.begin():
+            for name, res in ...:
+                exporter.writeRun(name, res)
+            numWritten = exporter.finish()
+
+    Only each run's summary (status, objective value, timings) is held
+    on to for the SUMMARY and TIMING.json files, written by finish().
+
+    With numThreads > 1, runs are written on a thread pool (writing is
+    mostly waiting on the disk, or a network share) and writeRun(...)
+    returns straight away. At most numThreads * 2 runs are waiting to be
+    written at once, after that writeRun(...) waits for the oldest.
+    Runs are reported as exported in the order they were given, and
+    summaries are kept in that order too. A run that raises while being
+    written is reported and counted as -1, the rest carry on.
+    '''
+
+    def __init__ (self, funcExportRun, funcExportSummary, outFolder, numThreads: int=1):
+        self.funcExportRun = funcExportRun
+        self.funcExportSummary = funcExportSummary
+        self.outFolder = outFolder
+        self.outDir: Optional[pathlib.Path] = None
+
+        self.numThreads = numThreads
+        self.pool: Optional[ThreadPoolExecutor] = None
+        self.pending: Deque[Tuple[str, models.RunResult, Future]] = deque()
+
+        self.numExport = 0
+        self.numFailed = 0 # runs that couldn't be written (-1)
+        self.runNames: List[str] = []
+        self.summaries: List[models.RunResult] = []
+
+    def begin (self) -> bool:
+        '''
+        Creates the sub directory. Returns False if it couldn't
+        '''
+        if _isInvalidDir(self.outFolder):
+            return False
+
+        outDir = pathlib.Path(self.outFolder)
+        time_str = text.getTimestamp()
+        subdir = f'RunOutput-{time_str}'
+        outDir = outDir.joinpath(subdir)
+
+        try:
+            os.mkdir(outDir)
+        except Exception:
+            return False
+
+        self.outDir = outDir
+        if self.numThreads > 1:
+            self.pool = ThreadPoolExecutor(max_workers=self.numThreads, thread_name_prefix='export')
+        return True
+
+    def writeRun (self, name: str, result: models.RunResult) -> models.RunResult:
+        '''
+        Writes a single run (with a thread pool, queues it) and returns
+        its summary, the result without its values. The summary is also
+        kept for SUMMARY & TIMING.json, its 'export' seconds are filled
+        in once the run is written.
+        '''
+        assert(self.outDir != None)
 
-    for name, inst, res in zip(runNames, instances, results):
         # runNames is a list of the objective files (not their paths)
         # they should be .csv, even if we're exporting to text
         assert(name[-4:] == '.csv')
         runName = text.FILE_OUTTXT_PREFIX + name[:-4]
-        runPath = str(outDir.joinpath(runName))
-
-        succ = funcExportRun(runPath, inst, res)
-        print(f"Exported?: {succ}")
+        runPath = str(self.outDir.joinpath(runName))
+
+        summary = result.withoutValues()
+        summary.phase_seconds = dict(result.phase_seconds or {})
+        self.runNames.append(name)
+        self.summaries.append(summary)
+
+        if self.pool == None:
+            succ, seconds = self._timedExport(runPath, name, result)
+            self._reportWritten(name, summary, succ, seconds)
+        else:
+            self.pending.append((name, summary, self.pool.submit(self._timedExport, runPath, name, result)))
+            self._collectWritten(maxPending=self.numThreads * 2)
+
+        return summary
+
+    def _timedExport (self, runPath: str, name: str, result: models.RunResult) -> Tuple[int, float]:
+        start = time.perf_counter()
+        try:
+            succ = self._exportRun(runPath, name, result)
+        except Exception as e:
+            print(f"Unable to export {name}: {e!r}")
+            succ = -1
+        return succ, time.perf_counter() - start
+
+    def _collectWritten (self, maxPending: int):
+        '''
+        Reports queued runs in order, waiting on the oldest until at
+        most maxPending are left
+        '''
+        while len(self.pending) > 0 and (len(self.pending) > maxPending or self.pending[0][2].done()):
+            name, summary, future = self.pending.popleft()
+            succ, seconds = future.result()
+            self._reportWritten(name, summary, succ, seconds)
+
+    def _reportWritten (self, name: str, summary: models.RunResult, succ: int, seconds: float):
+        _log.debug("Exported %s: %d", name, succ)
         if succ > 0:
-            numExport += 1
+            self.numExport += 1
+        elif succ < 0:
+            self.numFailed += 1
+        summary.phase_seconds['export'] = seconds
+
+    def _exportRun (self, runPath: str, name: str, result: models.RunResult) -> int:
+        return self.funcExportRun(runPath, result)
+
+    def finish (self, loadPhases: Optional[timing.PhaseRecorder]=None) -> int:
+        '''
+        Writes the SUMMARY & TIMING.json files and returns the number
+        of runs exported. loadPhases are the timings from loading the
+        models, if known.
+        '''
+        assert(self.outDir != None)
+
+        if self.pool != None:
+            self._collectWritten(maxPending=0)
+            self.pool.shutdown()
+            self.pool = None
+
+        if len(self.summaries) > 0:
+            summaryFile = str(self.outDir.joinpath('SUMMARY'))
+            self.funcExportSummary(summaryFile, self.runNames, self.summaries)
+
+        exportTimingJSON(str(self.outDir.joinpath('TIMING.json')), self.runNames, self.summaries, loadPhases)
+
+        return self.numExport
+
+
+
+LONG_TABLE_PREFIX = 'ALL_'
+LONG_TABLES = {
+    'decision_vars': ['run', 'variable', 'value', 'reduced_cost'],
+    'shadow_price': ['run', 'constraint', 'shadow_price'],
+    'slack_ge': ['run', 'constraint', 'slack_ge'],
+    'slack_le': ['run', 'constraint', 'slack_le'],
+}
+
+
+class LongTableExporter(RunExporter):
+    '''
+    A RunExporter that appends every run to one long format table per
+    result kind (LONG_TABLES), each row tagged with the run it came
+    from, so a whole sweep loads in a single read
+
+        ALL_decision_vars   run, variable, value, reduced_cost
+        ALL_shadow_price    run, constraint, shadow_price
+        ALL_slack_ge        run, constraint, slack_ge
+        ALL_slack_le        run, constraint, slack_le
+
+    The run column is the objective file name without '.csv'. Like the
+    per run csvs, only optimal runs are written. Rows go to disk as each
+    run is written, the tables are closed by finish().
+    '''
+
+    def __init__ (self, tableType, extension: str, outFolder):
+        super().__init__(None, exportSummaryCSV, outFolder)
+        self.tableType = tableType
+        self.extension = extension
+        self.tables: Dict[str, Union['_CSVTable', '_ParquetTable']] = {}
+
+    def begin (self) -> bool:
+        if not super().begin():
+            return False
+
+        try:
+            for kind, header in LONG_TABLES.items():
+                path = self.outDir.joinpath(f'{LONG_TABLE_PREFIX}{kind}{self.extension}')
+                self.tables[kind] = self.tableType(str(path), header)
+        except Exception as e:
+            print(f"Unable to open long format tables: {e}")
+            self._closeTables()
+            return False
+
+        return True
+
+    def _exportRun (self, runPath: str, name: str, result: models.RunResult) -> int:
+        if not result.isOptimal() or not result.hasValues():
+            return 0
+
+        run = name[:-4]
+        names = result.names
+        reduced_costs = result.reduced_costs
+        if reduced_costs is None:
+            reduced_costs = np.full(len(names.var_names), np.nan)
+
+        self.tables['decision_vars'].writeRun(run, names.var_names, [result.var_values, reduced_costs])
+        self.tables['shadow_price'].writeRun(run, names.const_names, [result.duals])
+        self.tables['slack_ge'].writeRun(run, names.ge_const_names, [result.slack_ge])
+        self.tables['slack_le'].writeRun(run, names.le_const_names, [result.slack_le])
+        return 1
+
+    def finish (self, loadPhases: Optional[timing.PhaseRecorder]=None) -> int:
+        self._closeTables()
+        return super().finish(loadPhases)
+
+    def _closeTables (self):
+        for table in self.tables.values():
+            table.close()
+        self.tables = {}
+
+
+def isParquetAvailable () -> bool:
+    '''
+    Parquet output needs the optional pyarrow package
+    '''
+    try:
+        import pyarrow.parquet
+        return True
+    except ImportError:
+        return False
+
+
+class _CSVTable:
+    '''
+    A long format .csv, appended to one run at a time
+    '''
+
+    def __init__ (self, filepath: str, header: List[str]):
+        self.file = open(filepath, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(header)
+
+    def writeRun (self, run: str, names: Tuple[str, ...], columns: List[np.ndarray]):
+        self.writer.writerows(zip(itertools.repeat(run), names, *[c.tolist() for c in columns]))
+        self.file.flush()
+
+    def close (self):
+        self.file.close()
+
+
+class _ParquetTable:
+    '''
+    A zstd compressed .parquet file, each run is written as its own row group
+    '''
+
+    def __init__ (self, filepath: str, header: List[str]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema(
+            [(header[0], pa.string()), (header[1], pa.string())] +
+            [(col, pa.float64()) for col in header[2:]]
+        )
+        self.writer = pq.ParquetWriter(filepath, self.schema, compression='zstd')
+
+    def writeRun (self, run: str, names: Tuple[str, ...], columns: List[np.ndarray]):
+        pa = self.pa
+        arrays = [
+            pa.array(itertools.repeat(run, len(names)), type=pa.string()),
+            pa.array(names, type=pa.string()),
+        ] + [pa.array(np.asarray(c, dtype=np.float64)) for c in columns]
+        self.writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close (self):
+        self.writer.close()
+
+
+
+
+SQLITE_FILENAME = 'results.sqlite'
+
+SQLITE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    output_folder TEXT,
+    status TEXT,
+    termination TEXT,
+    objective_value REAL,
+    task_seconds REAL
+);
+CREATE TABLE IF NOT EXISTS variables (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS constraints (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    UNIQUE (name, kind)
+);
+CREATE TABLE IF NOT EXISTS var_values (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    var_id INTEGER NOT NULL REFERENCES variables(id),
+    value REAL,
+    reduced_cost REAL,
+    PRIMARY KEY (run_id, var_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS const_values (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    const_id INTEGER NOT NULL REFERENCES constraints(id),
+    shadow_price REAL,
+    slack REAL,
+    PRIMARY KEY (run_id, const_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS runs_name ON runs(name);
+CREATE INDEX IF NOT EXISTS var_values_var ON var_values(var_id, run_id);
+CREATE INDEX IF NOT EXISTS const_values_const ON const_values(const_id, run_id);
+PRAGMA user_version = 2;
+'''
+
+# Databases written before constraints were unique on (name, kind) have
+# user_version 0. Their constraints table is rebuilt in place, ids kept.
+SQLITE_MIGRATE_V0 = '''
+CREATE TABLE constraints_v1 (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    UNIQUE (name, kind)
+);
+INSERT INTO constraints_v1 SELECT id, name, kind FROM constraints;
+DROP TABLE constraints;
+ALTER TABLE constraints_v1 RENAME TO constraints;
+'''
+
+# runs.solve_seconds was the whole worker task, not just the solve phase
+SQLITE_MIGRATE_V1 = '''
+ALTER TABLE runs RENAME COLUMN solve_seconds TO task_seconds;
+'''
+
+
+class SQLiteExporter(RunExporter):
+    '''
+    A RunExporter that also adds every run to a normalized SQLite
+    database, SQLITE_FILENAME, directly in the output folder (not the
+    RunOutput-<time> folder) so later sessions append to the same one
+
+        runs            one row per run, name is the objective file without '.csv'
+        variables       id, name
+        constraints     id, name, kind ('ge', 'le' or 'eq'), unique on (name, kind),
+                        so a constraint whose operator changed between sessions
+                        gets a new row and older runs keep pointing at the old one
+        var_values      run_id, var_id, value, reduced_cost
+        const_values    run_id, const_id, shadow_price, slack (NULL for eq)
+
+    Each run is written with executemany inside its own transaction,
+    so a run is either all there or not at all. Every run gets a row
+    in runs, values are only written for optimal runs.
+    '''
+
+    def __init__ (self, outFolder):
+        super().__init__(None, exportSummaryCSV, outFolder)
+        self.conn: Optional[sqlite3.Connection] = None
+
+        # name -> id for variables, (name, kind) -> id for constraints, and
+        # the id arrays for the last ResultNames seen (usually shared by every run)
+        self.varIds: Dict[str, int] = {}
+        self.constIds: Dict[Tuple[str, str], int] = {}
+        self.lastNames: Optional[models.ResultNames] = None
+        self.lastIds: Tuple[List[int], List[int]] = ([], [])
+
+    def begin (self) -> bool:
+        if not super().begin():
+            return False
+
+        try:
+            self.conn = sqlite3.connect(str(pathlib.Path(self.outFolder).joinpath(SQLITE_FILENAME)))
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            hasTables = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'constraints'").fetchone() != None
+            if hasTables and version < 1:
+                self.conn.executescript(SQLITE_MIGRATE_V0)
+            if hasTables and version < 2:
+                self.conn.executescript(SQLITE_MIGRATE_V1)
+            self.conn.executescript(SQLITE_SCHEMA)
+            self._readIds()
+        except sqlite3.Error as e:
+            print(f"Unable to open results database: {e}")
+            self._close()
+            return False
+
+        return True
+
+    def _exportRun (self, runPath: str, name: str, result: models.RunResult) -> int:
+        try:
+            return self._insertRun(name[:-4], result)
+        except sqlite3.Error as e:
+            # The run's transaction was rolled back, names it added included
+            print(f"Unable to write {name} to the results database: {e}")
+            self._readIds()
+            self.lastNames = None
+            return -1
+
+    def _readIds (self):
+        self.varIds = dict(self.conn.execute('SELECT name, id FROM variables'))
+        self.constIds = {(name, kind): constId for constId, name, kind in self.conn.execute('SELECT id, name, kind FROM constraints')}
+
+    def _insertRun (self, runName: str, result: models.RunResult) -> int:
+        writeValues = result.isOptimal() and result.hasValues()
+
+        with self.conn:
+            cur = self.conn.execute(
+                'INSERT INTO runs (name, output_folder, status, termination, objective_value, task_seconds) VALUES (?, ?, ?, ?, ?, ?)',
+                (runName, self.outDir.name, result.status, result.termination, result.objective_value, result.task_seconds)
+            )
+            runId = cur.lastrowid
+
+            if not writeValues:
+                return 0
+
+            varIds, constIds = self._idsFor(result.names)
+            reduced_costs = result.reduced_costs
+            if reduced_costs is None:
+                reduced_costs = np.full(len(varIds), np.nan)
+
+            self.conn.executemany(
+                'INSERT INTO var_values VALUES (?, ?, ?, ?)',
+                zip(itertools.repeat(runId), varIds, result.var_values.tolist(), reduced_costs.tolist())
+            )
+
+            # Duals are GE, LE then EQ, the same order as the constraint ids
+            numEq = len(result.names.eq_const_names)
+            slacks = result.slack_ge.tolist() + result.slack_le.tolist() + [None] * numEq
+            self.conn.executemany(
+                'INSERT INTO const_values VALUES (?, ?, ?, ?)',
+                zip(itertools.repeat(runId), constIds, result.duals.tolist(), slacks)
+            )
+
+        return 1
+
+    def finish (self, loadPhases: Optional[timing.PhaseRecorder]=None) -> int:
+        self._close()
+        return super().finish(loadPhases)
+
+    def _idsFor (self, names: models.ResultNames) -> Tuple[List[int], List[int]]:
+        '''
+        Ids of the result's variables & constraints, in the same order as
+        the result arrays. Names not in the database yet are added.
+        '''
+        if names is self.lastNames:
+            return self.lastIds
+
+        kinds = ['ge'] * len(names.ge_const_names) + ['le'] * len(names.le_const_names) + ['eq'] * len(names.eq_const_names)
+
+        varIds = self._addRows('variables', self.varIds, list(names.var_names), [(name,) for name in names.var_names])
+        constKeys = list(zip(names.const_names, kinds))
+        constIds = self._addRows('constraints', self.constIds, constKeys, constKeys)
+
+        self.lastNames = names
+        self.lastIds = (varIds, constIds)
+        return self.lastIds
+
+    def _addRows (self, table: str, ids: Dict, keys: List, rows: List[tuple]) -> List[int]:
+        '''
+        Ids for keys (looked up in ids), inserting rows[i] (without its
+        id) into table for every key not there yet
+        '''
+        newRows = []
+        nextId = max(ids.values(), default=0) + 1
+        for key, row in zip(keys, rows):
+            if key not in ids:
+                ids[key] = nextId
+                newRows.append((nextId, *row))
+                nextId += 1
+
+        if len(newRows) > 0:
+            marks = ', '.join(['?'] * len(newRows[0]))
+            self.conn.executemany(f'INSERT INTO {table} VALUES ({marks})', newRows)
+
+        return [ids[key] for key in keys]
+
+    def _close (self):
+        if self.conn != None:
+            self.conn.close()
+            self.conn = None
+
+
+
+
+def exportTimingJSON (outfile: str,
+                    runNames: List[str],
+                    results: List[models.RunResult],
+                    loadPhases: Optional[timing.PhaseRecorder]=None):
+    '''
+    Machine readable timings: the load phases, per phase totals over
+    all runs, and each run's phases
+    '''
+    totals = timing.PhaseRecorder()
+    runs = []
+    for name, res in zip(runNames, results):
+        for phase, seconds in (res.phase_seconds or {}).items():
+            totals.add(phase, seconds, (res.phase_peak_mib or {}).get(phase))
+        runs.append({
+            'name': name,
+            'termination': res.termination,
+            'from_cache': res.from_cache,
+            'worker': res.worker,
+            'task_seconds': res.task_seconds,
+            'phase_seconds': res.phase_seconds,
+            'phase_peak_mib': res.phase_peak_mib,
+            'peak_mib': res.peak_mib,
+        })
+
+    report = {
+        'load': loadPhases.asDict() if loadPhases != None else {},
+        'run_totals': totals.asDict(),
+        'runs': runs,
+    }
 
-    return numExport
+    with open(outfile, 'w') as f:
+        json.dump(report, f, indent=2)
 
 
 
@@ -373,9 +930,7 @@ if __name__ == '__main__':
     finalModel = converter.convertInputToFinalModel(objData, constrData)
 
     # Run the model
-    datadict = converter.convertFinalModelToDataDict(finalModel)
-    inst = pyomo_runner.loadPyomoModelFromDataDict(datadict)
-    inst, res = pyomo_runner.solveConcreteModel(inst, verboseToConsole=True)
+    res = next(pyomo_runner.solveModels([finalModel], verboseToConsole=True))
 
     # Export
     objFileName = pathlib.Path(file_objective).parts[-1]
@@ -383,13 +938,12 @@ if __name__ == '__main__':
     exportRuns(
         OUTPUT_DIR,
         [objFileName],
-        [inst],
         [res],
         'csv',
         True
     )
 
-    print(pyomo_runner.getRunSummary(inst, res))
+    print(res.summary())
 
     print("Finished")
 
@@ -5,7 +5,10 @@ This file launches the gui. Gui is built with pygubu-designer.
 '''
 
 from pprint import pprint
+import queue
+import threading
 import time
+import traceback
 import tkinter as tk
 from tkinter import filedialog
 from tkinter import dialog
@@ -19,14 +22,17 @@ from typing import List, Set, Union
 
 import runner.converter as converter
 import runner.model_data_classes as model
+import runner.modelcache as modelcache
 import runner.pyomo_runner as pyomo_runner
 import runner.text as text
+import runner.timing as timing
 import runner.export as export
 
-import pyomo.environ as pyo
-import pyomo.opt as opt
-
 PATH_DISPLAY_LEN = 35
+# How often (ms) the gui checks on background work
+POLL_MS = 100
+# How long closing the window waits for background work to cancel
+CLOSE_WAIT_SECONDS = 5
 # TODO: You can have it filter only *obj.csv and *const.csv
 CSV_FILES = [('CSV Files','*.csv'), ('All Files','*.*')]
 TXT_FILES = [('Text Files','*.txt'), ('All Files','*.*')]
@@ -45,15 +51,28 @@ class GUIState:
 	csvOutput: bool = False
 	splitVarsByUnderscore: bool = False
 
+	# Save each run as soon as it's solved instead of keeping every
+	# result until Save is pressed. The output folder is picked before
+	# running and runResults stays None.
+	streamOutput: bool = False
+
 	# We store arrays of everything. In the case of a single
 	# objective file, we just use the first index
-	# TODO: This is bad but tolerable for memory. Analysis lives
-	# 		in memory.txt. In the future, we should iterate through
-	# 		models so only ever a single one is stored in memory.
+	# Models loaded from a directory share one constraint block, and
+	# runs only keep numeric results (see streamOutput for not even that)
 	objFilenames: List[str] = None
 	loadedModels: List[model.FinalModel] = None
-	runInstances: List[pyo.ConcreteModel] = None
-	runResults: List[opt.SolverResults] = None
+	runResults: List[model.RunResult] = None
+	loadPhases: timing.PhaseRecorder = None
+
+	# Many objective runs are solved by this many processes at once
+	solverName: str = 'glpk'
+	numWorkers: int = attrs.Factory(pyomo_runner.defaultNumWorkers)
+
+	# Loading, running and saving happen on a background thread,
+	# the gui is locked while one is going
+	busy: bool = False
+	cancellable: bool = False
 
 
 
@@ -65,6 +84,9 @@ class GuibuildingApp:
 		# state variable
 		self.state = GUIState()
 
+		# Previously loaded models are kept on disk between sessions
+		self.modelCache = modelcache.ModelCache(modelcache.getDefaultCacheDir())
+
 		# build ui
 		self.im_a_top = ttk.Frame(master)
 		self.frm_title = ttk.Frame(self.im_a_top)
@@ -138,6 +160,33 @@ class GuibuildingApp:
 		self.lbl_run_modelstats = ttk.Label(self.lblfrm_run)
 		self.lbl_run_modelstats.configure(text="No Model Loaded")
 		self.lbl_run_modelstats.grid(column=0, padx=10, pady=10, row=0, sticky="nsew")
+		self.frm_workers = ttk.Frame(self.lblfrm_run)
+		self.lbl_workers = ttk.Label(self.frm_workers)
+		self.lbl_workers.configure(text="Parallel Solvers")
+		self.lbl_workers.grid(column=0, padx=5, row=0, sticky="w")
+		self.spin_workers = ttk.Spinbox(self.frm_workers)
+		self.intvar_workers = tk.IntVar()
+		self.spin_workers.configure(
+			from_=1, increment=1, textvariable=self.intvar_workers, to=64, width=4
+		)
+		self.spin_workers.grid(column=1, row=0, sticky="w")
+		self.spin_workers.configure(command=self.onspin_workers)
+		self.frm_workers.configure(height=200, padding=1, width=200)
+		self.frm_workers.grid(column=0, pady=5, row=2)
+		self.frm_progress = ttk.Frame(self.lblfrm_run)
+		self.prog_run = ttk.Progressbar(self.frm_progress)
+		self.prog_run.configure(mode="determinate", orient="horizontal")
+		self.prog_run.grid(column=0, row=0, sticky="ew")
+		self.lbl_run_progress = ttk.Label(self.frm_progress)
+		self.lbl_run_progress.configure(anchor="w")
+		self.lbl_run_progress.grid(column=0, pady=2, row=1, sticky="ew")
+		self.btn_cancel = ttk.Button(self.frm_progress)
+		self.btn_cancel.configure(text="Cancel")
+		self.btn_cancel.grid(column=0, row=2)
+		self.btn_cancel.configure(command=self.onbtn_run_cancel)
+		self.frm_progress.configure(height=200, padding=1, width=200)
+		self.frm_progress.grid(column=0, padx=10, pady=5, row=3, sticky="ew")
+		self.frm_progress.columnconfigure(0, weight=1)
 		self.lblfrm_run.configure(height=200, text="Run", width=200)
 		self.lblfrm_run.grid(column=0, pady=10, row=1, sticky="nsew")
 		self.lblfrm_run.columnconfigure(0, weight=1)
@@ -161,6 +210,13 @@ class GuibuildingApp:
 		)
 		self.checkbutton4.grid(column=0, row=1, sticky="w")
 		self.checkbutton4.configure(command=self.onchk_splitvars)
+		self.chk_streamoutput = ttk.Checkbutton(self.frame2)
+		self.strvar_streamoutput = tk.StringVar(value="")
+		self.chk_streamoutput.configure(
+			text="Save While Running", variable=self.strvar_streamoutput
+		)
+		self.chk_streamoutput.grid(column=0, row=2, sticky="w")
+		self.chk_streamoutput.configure(command=self.onchk_streamout)
 		self.frame2.configure(height=200, padding=1, width=200)
 		self.frame2.grid(column=0, padx=5, row=0)
 		self.lblfrm_output.configure(height=200, text="Output", width=200)
@@ -195,6 +251,17 @@ class GuibuildingApp:
 		# Main widget
 		self.mainwindow = self.im_a_top
 
+		# Background work, see _start_background
+		self._bgQueue: queue.Queue = None
+		self._bgOnDone = None
+		self._bgStart = 0.0
+		self._bgProgress = None
+		self._bgThread: threading.Thread = None
+		self._cancelEvent = threading.Event()
+
+		if master != None:
+			master.protocol("WM_DELETE_WINDOW", self.onclose)
+
 		self._init_config()
 		self._redraw_dynamics()
 
@@ -294,18 +361,23 @@ class GuibuildingApp:
 		reporting back any issues
 		'''
 		print("Loading model")
-		status_str = ''
-
-		if self.state.multipleObjFiles:
-			status_str = self._load_dir_of_objective()
-		else:
-			status_str = self._load_single_obj()
 
-		# reset any existing results
+		# reset any existing results, and models until the load succeeds
 		self.state.runResults = None
+		self.state.loadedModels = None
 
-		self._write_new_status(status_str)
-		self._redraw_dynamics()
+		def work (report, cancelEvent):
+			with timing.recording() as rec:
+				if self.state.multipleObjFiles:
+					statusStr = self._load_dir_of_objective()
+				else:
+					statusStr = self._load_single_obj()
+
+			self.state.loadPhases = rec
+			return statusStr + "\n\n" + text.statusPhases(rec, "Load Phases")
+
+		self._write_new_status("Loading ...")
+		self._start_background(work, self._write_new_status)
 
 
 	def _load_dir_of_objective(self) -> str:
@@ -320,16 +392,20 @@ class GuibuildingApp:
 		warnings_found: Set[str] = set()
 		errors_found: Set[str] = set()
 
-		self.state.objFilenames = []
-		self.state.loadedModels = []
+		objFilenames = []
+		loadedModels = []
 
-		for p in pathlib.Path(self.state.objFileDirStr).glob('*.csv'):
-			objData, constrData, messages = converter.lintInputDataFromFilepaths(
-				objFilePath=p,
-				constrFilePath=self.state.constFileStr
-			)
+		# The constraint file is only parsed once, and every model
+		# shares the same constraint block
+		objPaths = list(pathlib.Path(self.state.objFileDirStr).glob('*.csv'))
+		allLoaded = converter.lintAndConvertManyFromFilepaths(
+			objFilePaths=objPaths,
+			constrFilePath=self.state.constFileStr,
+			cache=self.modelCache
+		)
 
-			if objData == None:
+		for p, (finalModel, messages) in zip(objPaths, allLoaded):
+			if finalModel == None:
 				# Error
 				error_files.append(p.name)
 				errors_found.update(messages)
@@ -343,27 +419,21 @@ class GuibuildingApp:
 					# Perfect file
 					perfect_files.append(p.name)
 				
-				self.state.objFilenames.append(p.name)
-
-				self.state.loadedModels.append(
-					converter.convertInputToFinalModel(
-						objData=objData,
-						constData=constrData
-					)
-				)
+				objFilenames.append(p.name)
+				loadedModels.append(finalModel)
 
 		# Now check for errors
 		nPerf = len(perfect_files)
 		nWarn = len(warning_files)
 		nErr = len(error_files)
-		nLoaded = len(self.state.loadedModels)
+		nLoaded = len(loadedModels)
 		
 		assert(nLoaded == nPerf + nWarn)
 
-		if nPerf + nWarn + nErr == 0:
-			self.state.loadedModels = None
-		elif nLoaded == 0:
-			self.state.loadedModels = None
+		# Only set once everything loaded, a read error above leaves it None
+		self.state.objFilenames = objFilenames
+		if nLoaded > 0:
+			self.state.loadedModels = loadedModels
 
 		# Return status string
 		return text.statusLoadMany(
@@ -379,24 +449,22 @@ class GuibuildingApp:
 		'''
 		Loads the singular objective file and returns a status string
 		'''
-		objData, constrData, messages = converter.lintInputDataFromFilepaths(
+		finalModel, messages = converter.lintAndConvertFromFilepaths(
 			objFilePath=self.state.objFileSingleStr,
-			constrFilePath=self.state.constFileStr
+			constrFilePath=self.state.constFileStr,
+			cache=self.modelCache
 		)
 
-		if objData == None: # Error
+		if finalModel == None: # Error
 			self.state.loadedModels = None
 		else: 
 			# Success
-			self.state.loadedModels = [converter.convertInputToFinalModel(
-				objData=objData, 
-				constData=constrData
-			)]
+			self.state.loadedModels = [finalModel]
 
 			objFileName = pathlib.Path(self.state.objFileSingleStr).parts[-1]
 			self.state.objFilenames = [objFileName]
 		
-		return text.statusLoadSingle(objData, messages)
+		return text.statusLoadSingle(finalModel, messages)
 
 
 
@@ -404,35 +472,113 @@ class GuibuildingApp:
 
 	def onbtn_run_run(self):
 		print("Now do the run")
+		self.onspin_workers() # in case the number was typed in
+
+		names = list(self.state.objFilenames)
+		loadedModels = self.state.loadedModels
+		numWorkers = min(self.state.numWorkers, len(loadedModels))
+		self.state.runResults = None
+
+		# When streaming, each result is written then dropped
+		exporter = None
+		if self.state.streamOutput:
+			outputDir = filedialog.askdirectory()
+			if isInvalidDir(outputDir):
+				return
+			exporter = export.makeRunExporter(
+				outputDir,
+				'csv' if self.state.csvOutput else 'txt',
+				self.state.splitVarsByUnderscore
+			)
 
-		self.state.runInstances = []
-		self.state.runResults = []
+		def work (report, cancelEvent):
+			# Only the results are kept, never the pyomo instances
+			results = []
+			report(('progress', 0, len(names), names[0]))
 
-		# Run all the models
-		for lm in self.state.loadedModels:
-			datadict = converter.convertFinalModelToDataDict(lm)
-			instance = pyomo_runner.loadPyomoModelFromDataDict(datadict)
-			instance, res = pyomo_runner.solveConcreteModel(instance)
+			if exporter != None and not exporter.begin():
+				return None
 
-			self.state.runInstances.append(instance)
-			self.state.runResults.append(res)
+			allResults = pyomo_runner.solveModels(
+				loadedModels,
+				backendName=self.state.solverName,
+				numWorkers=numWorkers,
+				cancelEvent=cancelEvent,
+				resultCache=self.modelCache
+			)
+
+			for i, res in enumerate(allResults):
+				if exporter != None:
+					res = exporter.writeRun(names[i], res)
+
+				results.append(res)
+				nextName = names[i + 1] if i + 1 < len(names) else None
+				report(('status', text.statusRunLine(names[i], res)))
+				report(('progress', i + 1, len(names), nextName))
+
+			if exporter != None:
+				exporter.finish(self.state.loadPhases)
+
+			return results
+
+		self._write_new_status(text.statusRunStarted(len(names), numWorkers))
+		self._start_background(work, lambda results: self._finish_run(names, results, exporter), cancellable=True)
+
+
+	def _finish_run (self, names: List[str], results: List[model.RunResult], exporter: export.RunExporter):
+		wallSeconds = time.perf_counter() - self._bgStart
+
+		if results == None:
+			self._write_new_status(text.statusSaveMany(exporter.outFolder, -1))
+			return
+
+		saveStr = ''
+		if exporter != None:
+			saveStr = "\n\n\n" + text.statusSaveMany(str(exporter.outDir), exporter.numExport)
+
+		if len(results) < len(names):
+			self._write_new_status(text.statusRunCancelled(len(results), len(names)) + saveStr)
+			return
+
+		if exporter != None:
+			# Already saved, nothing is kept
+			self._write_new_status(text.statusRunMany(names, results, wallSeconds) + saveStr)
+			return
+
+		self.state.runResults = results
 
 		# Write the status string
 		statusStr = ""
 
 		if self.state.multipleObjFiles:
 			statusStr = text.statusRunMany(
-				names=self.state.objFilenames,
-				results=self.state.runResults
+				names=names,
+				results=results,
+				wallSeconds=wallSeconds
 			)
 		else:
 			statusStr = text.statusRunSingle(
-				instance=self.state.runInstances[0],
-				results=self.state.runResults[0]
+				result=results[0]
 			)
 
 		self._write_new_status(statusStr)
-		self._redraw_dynamics()
+
+
+	def onbtn_run_cancel(self):
+		print("Cancelling")
+		self._cancelEvent.set()
+		self.btn_cancel['state'] = 'disabled'
+		self._append_status("\nCancelling ...\n")
+
+
+	def onclose(self):
+		# Kills any solver processes before closing. The background thread
+		# is a daemon, so it has to be given the chance to notice the cancel
+		# and stop its workers (and their solvers) before the program exits
+		self._cancelEvent.set()
+		if self._bgThread != None and self._bgThread.is_alive():
+			self._bgThread.join(timeout=CLOSE_WAIT_SECONDS)
+		self.mainwindow.winfo_toplevel().destroy()
 
 
 
@@ -447,19 +593,19 @@ class GuibuildingApp:
 
 		print(self.state.csvOutput)
 
-		numWritten = export.exportRuns(
-			outDir=outputDir,
-			runNames=self.state.objFilenames,
-			instances=self.state.runInstances,
-			results=self.state.runResults,
-			outType='csv' if self.state.csvOutput else 'txt',
-			splitUnders=self.state.splitVarsByUnderscore
-		)
-
-		msg = text.statusSaveMany(outputDir, numWritten)
+		def work (report, cancelEvent):
+			numWritten = export.exportRuns(
+				outDir=outputDir,
+				runNames=self.state.objFilenames,
+				results=self.state.runResults,
+				outType='csv' if self.state.csvOutput else 'txt',
+				splitUnders=self.state.splitVarsByUnderscore,
+				loadPhases=self.state.loadPhases
+			)
+			return text.statusSaveMany(outputDir, numWritten)
 
-		self._write_new_status(msg)
-		self._redraw_dynamics()
+		self._write_new_status("Saving ...")
+		self._start_background(work, self._write_new_status)
 
 
 	def onchk_csvout (self):
@@ -469,6 +615,22 @@ class GuibuildingApp:
 		self._redraw_dynamics()
 
 
+	def onchk_streamout (self):
+		self.state.streamOutput = self.strvar_streamoutput.get() == '1'
+		print(f"streamout: {self.state.streamOutput}")
+
+		self._redraw_dynamics()
+
+
+	def onspin_workers (self):
+		try:
+			self.state.numWorkers = max(1, self.intvar_workers.get())
+		except tk.TclError:
+			# Not a number (eg: the box is mid edit), keep the last value
+			return
+		print(f"workers: {self.state.numWorkers}")
+
+
 	def onchk_splitvars (self):
 		self.state.splitVarsByUnderscore = self.strvar_splitbyunderscore.get()
 		print(f"split?: {self.state.splitVarsByUnderscore}")
@@ -476,7 +638,89 @@ class GuibuildingApp:
 		self._redraw_dynamics()
 
 
-	
+
+	#
+	# Background Work
+	#
+
+	def _start_background(self, work, onDone, cancellable: bool=False):
+		'''
+		Runs work(report, cancelEvent) on a background thread so the window
+		stays responsive. From its thread, work can call report(...) with
+		 - ('status', str): appended to the status box
+		 - ('progress', numDone, numTotal, currentName): shown under the run button
+
+		Once work returns, onDone(returned value) is called on the gui thread.
+		tk isn't thread safe, so work must never touch widgets itself.
+		'''
+		self.state.busy = True
+		self.state.cancellable = cancellable
+		self._cancelEvent = threading.Event()
+		self._bgQueue = queue.Queue()
+		self._bgOnDone = onDone
+		self._bgStart = time.perf_counter()
+		self._bgProgress = None
+
+		bgQueue = self._bgQueue
+		cancelEvent = self._cancelEvent
+
+		def target():
+			try:
+				bgQueue.put(('done', work(bgQueue.put, cancelEvent)))
+			except Exception:
+				bgQueue.put(('error', traceback.format_exc()))
+
+		self._bgThread = threading.Thread(target=target, daemon=True)
+		self._bgThread.start()
+
+		self._redraw_dynamics()
+		self.mainwindow.after(POLL_MS, self._poll_background)
+
+
+	def _poll_background(self):
+		'''
+		Handles everything reported by the background work since the last poll
+		'''
+		while True:
+			try:
+				msg = self._bgQueue.get_nowait()
+			except queue.Empty:
+				break
+
+			kind = msg[0]
+			if kind == 'status':
+				self._append_status(msg[1])
+			elif kind == 'progress':
+				self._bgProgress = msg[1:]
+			else:
+				# Finished
+				self.state.busy = False
+				self.state.cancellable = False
+
+				if kind == 'done':
+					self._bgOnDone(msg[1])
+				else:
+					self._write_new_status(text.statusBackgroundError(msg[1]))
+
+				self._redraw_dynamics()
+				return
+
+		# Refresh every poll so the elapsed time ticks up
+		if self._bgProgress != None:
+			numDone, numTotal, currentName = self._bgProgress
+			self.prog_run.configure(maximum=numTotal, value=numDone)
+			self.lbl_run_progress.configure(text=text.guiRunProgress(
+				numDone, numTotal, currentName, time.perf_counter() - self._bgStart
+			))
+
+		self.mainwindow.after(POLL_MS, self._poll_background)
+
+
+	def _append_status(self, msg_str: str):
+		self.txt_status.insert(tk.END, msg_str)
+		self.txt_status.see(tk.END)
+
+
 	def _write_new_status(self, msg_str: str):
 		'''
 		Writes to the status box, clearing out whatever was there
@@ -509,12 +753,15 @@ class GuibuildingApp:
 		# Reset all check buttons
 		chk_button_vars = [
 			self.strvar_csvoutput,
-			self.strvar_splitbyunderscore
+			self.strvar_splitbyunderscore,
+			self.strvar_streamoutput
 		]
 
 		for s in chk_button_vars:
 			s.set('0')
 
+		self.intvar_workers.set(self.state.numWorkers)
+
 		# Buttons that are always green
 		btns = [
 			self.btn_constcsv,
@@ -550,13 +797,38 @@ class GuibuildingApp:
 			self.btn_loadmodel, 
 			self.btn_run,
 			self.checkbutton4,
-			self.chk_csvoutput
+			self.chk_csvoutput,
+			self.chk_streamoutput
 		]
 
 		for b in btns:
 			b['state'] = 'disabled'
 			b['style'] = ''
 
+		# Nothing can change while working in the background
+		inputs = [
+			self.btn_objcsv,
+			self.btn_constcsv,
+			self.radiobutton1,
+			self.radiobutton2,
+			self.spin_workers
+		]
+
+		self.btn_cancel['state'] = 'disabled'
+
+		if self.state.busy:
+			for w in inputs:
+				w['state'] = 'disabled'
+			if self.state.cancellable:
+				self.btn_cancel['state'] = 'normal'
+			return
+
+		for w in inputs:
+			w['state'] = 'normal'
+
+		self.prog_run.configure(value=0)
+		self.lbl_run_progress.configure(text='')
+
 		# label
 		self.lbl_run_modelstats.configure(text="No Model Loaded")
 
@@ -605,6 +877,11 @@ class GuibuildingApp:
 
 			model_str = text.guiLoadedModelsSummary(allLM)
 			self.lbl_run_modelstats.configure(text=model_str)
+
+			# Output options are picked before running when streaming
+			self.chk_streamoutput['state'] = 'normal'
+			if self.state.streamOutput:
+				self._redraw_output_options()
 		
 		else:
 			self.state.runResults = None
@@ -617,19 +894,22 @@ class GuibuildingApp:
 		if res == None:
 			return
 
-		self.chk_csvoutput['state'] = 'normal'
+		self._redraw_output_options()
+
+		# Even if it's a failed output, we can save it
+		self.btn_output['state'] = 'normal'
+		self.btn_output['style'] = 'Accent.TButton'
 
 
+	def _redraw_output_options(self):
+		self.chk_csvoutput['state'] = 'normal'
+
 		if self.state.csvOutput:
 			self.checkbutton4['state'] = 'normal'
 		else:
 			self.checkbutton4['state'] = 'disabled'
 			self.strvar_splitbyunderscore.set(0)
 
-		# Even if it's a failed output, we can save it
-		self.btn_output['state'] = 'normal'
-		self.btn_output['style'] = 'Accent.TButton'
-
 
 
 
@@ -13,8 +13,228 @@ https://www.attrs.org/en/stable/
 '''
 
 import sys
-from typing import List
-from attrs import define, frozen
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+from attrs import define, evolve, field, frozen
+import numpy as np
+
+import runner.timing as timing
+
+
+@frozen(eq=False)
+class SparseMatrix:
+	'''
+	A compressed sparse row (CSR) matrix. Forest models are mostly zeros,
+	a stand/year/prescription variable only shows up in a handful of rows,
+	so only the nonzeros are stored.
+
+	The columns of row i are indices[indptr[i]:indptr[i+1]] and the
+	values are data[indptr[i]:indptr[i+1]]. Columns within a row
+	are sorted.
+
+	This is immutable, every "edit" returns a new matrix.
+	'''
+	data: np.ndarray    # float64 nonzero values
+	indices: np.ndarray # column of each value
+	indptr: np.ndarray  # length is (num rows + 1)
+	shape: Tuple[int, int]
+
+	@staticmethod
+	def fromRows (rowCols: Sequence[np.ndarray], rowVals: Sequence[np.ndarray], numCols: int) -> 'SparseMatrix':
+		'''
+		Builds a matrix from parallel lists of (sorted) column indices
+		and values, one entry per row.
+		'''
+		lens = np.array([len(c) for c in rowCols], dtype=np.int64)
+		indptr = np.zeros(len(rowCols) + 1, dtype=np.int64)
+		np.cumsum(lens, out=indptr[1:])
+
+		if len(rowCols) == 0:
+			indices = np.zeros(0, dtype=np.int64)
+			data = np.zeros(0, dtype=np.float64)
+		else:
+			indices = np.concatenate(rowCols).astype(np.int64, copy=False)
+			data = np.concatenate(rowVals).astype(np.float64, copy=False)
+
+		return SparseMatrix(data=data, indices=indices, indptr=indptr, shape=(len(rowCols), numCols))
+
+	@staticmethod
+	def fromTriplets (rows: np.ndarray, cols: np.ndarray, vals: np.ndarray, shape: Tuple[int, int]) -> 'SparseMatrix':
+		'''
+		Builds a matrix from (row, column, value) triplets in any order.
+		Zero values are dropped. Each (row, column) may only appear once,
+		the caller is expected to have checked.
+		'''
+		rows = np.asarray(rows, dtype=np.int64)
+		cols = np.asarray(cols, dtype=np.int64)
+		vals = np.asarray(vals, dtype=np.float64)
+
+		keep = vals != 0
+		rows, cols, vals = rows[keep], cols[keep], vals[keep]
+
+		order = np.lexsort((cols, rows))
+		indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+		np.cumsum(np.bincount(rows, minlength=shape[0]), out=indptr[1:])
+
+		return SparseMatrix(data=vals[order], indices=cols[order], indptr=indptr, shape=shape)
+
+	@staticmethod
+	def fromDense (dense) -> 'SparseMatrix':
+		dense = np.asarray(dense, dtype=np.float64)
+		if dense.ndim == 1:
+			dense = dense.reshape((0 if dense.size == 0 else 1, -1))
+
+		rowCols = [np.flatnonzero(row) for row in dense]
+		rowVals = [row[cols] for row, cols in zip(dense, rowCols)]
+		return SparseMatrix.fromRows(rowCols, rowVals, dense.shape[1])
+
+	@staticmethod
+	def vstack (mats: Sequence['SparseMatrix']) -> 'SparseMatrix':
+		'''
+		Stacks matrices with the same number of columns on top of each other
+		'''
+		numCols = mats[0].shape[1]
+		assert(all(m.shape[1] == numCols for m in mats))
+
+		indptrs = [mats[0].indptr]
+		offset = mats[0].indptr[-1]
+		for m in mats[1:]:
+			indptrs.append(m.indptr[1:] + offset)
+			offset += m.indptr[-1]
+
+		return SparseMatrix(
+			data=np.concatenate([m.data for m in mats]),
+			indices=np.concatenate([m.indices for m in mats]),
+			indptr=np.concatenate(indptrs),
+			shape=(sum(m.shape[0] for m in mats), numCols)
+		)
+
+	def __len__ (self) -> int:
+		# Number of rows, so this can stand in for a list of rows
+		return self.shape[0]
+
+	@property
+	def nnz (self) -> int:
+		return len(self.data)
+
+	def row (self, ind: int) -> Tuple[np.ndarray, np.ndarray]:
+		'''
+		Returns (column indices, values) of the nonzeros in a row
+		'''
+		start, end = self.indptr[ind], self.indptr[ind + 1]
+		return self.indices[start:end], self.data[start:end]
+
+	def rowIndexOfNonzeros (self) -> np.ndarray:
+		'''
+		The row of each entry in data/indices (ie: the COO row vector)
+		'''
+		return np.repeat(np.arange(self.shape[0]), np.diff(self.indptr))
+
+	def iterNonzeros (self) -> Iterator[Tuple[int, int, float]]:
+		'''
+		Yields (row, column, value) for every nonzero, row by row
+		'''
+		for rowInd in range(self.shape[0]):
+			cols, vals = self.row(rowInd)
+			for col, val in zip(cols.tolist(), vals.tolist()):
+				yield rowInd, col, val
+
+	def toDense (self) -> np.ndarray:
+		dense = np.zeros(self.shape, dtype=np.float64)
+		dense[self.rowIndexOfNonzeros(), self.indices] = self.data
+		return dense
+
+	def dot (self, vec) -> np.ndarray:
+		'''
+		Matrix-vector product, A @ vec
+		'''
+		vec = np.asarray(vec, dtype=np.float64)
+		return np.bincount(
+			self.rowIndexOfNonzeros(),
+			weights=self.data * vec[self.indices],
+			minlength=self.shape[0]
+		)
+
+	def selectRows (self, rowInds) -> 'SparseMatrix':
+		'''
+		Returns a new matrix made of only the passed rows, in order
+		'''
+		rowInds = np.asarray(rowInds, dtype=np.int64)
+		starts = self.indptr[rowInds]
+		lens = self.indptr[rowInds + 1] - starts
+
+		indptr = np.zeros(len(rowInds) + 1, dtype=np.int64)
+		np.cumsum(lens, out=indptr[1:])
+
+		# For each output nonzero, its position in the original arrays
+		take = np.repeat(starts - indptr[:-1], lens) + np.arange(indptr[-1])
+
+		return SparseMatrix(
+			data=self.data[take],
+			indices=self.indices[take],
+			indptr=indptr,
+			shape=(len(rowInds), self.shape[1])
+		)
+
+# Constraint matrices are either a list of rows (the original csv reader)
+# or a SparseMatrix (openAndReadConstraintCSVAsSparse). Bounds vectors are
+# lists or float64 arrays.
+Matrix = Union[List[List[float]], SparseMatrix]
+Vector = Union[List[float], np.ndarray]
+
+
+@define
+class NameIndex:
+	'''
+	The position of every name in a list of names, so finding one is a
+	dict lookup rather than a list.index() or `in` scan. Used by linting
+	and converting, where models have tens of thousands of variables.
+
+	A repeated name keeps its first position and is listed (once) in
+	duplicates. Names added with append() are indexed as they go.
+	'''
+	names: List[str] = field(converter=list)
+	duplicates: List[str] = field(init=False, factory=list)
+	_positions: Dict[str, int] = field(init=False, factory=dict)
+	_repeated: Set[str] = field(init=False, factory=set)
+
+	def __attrs_post_init__ (self):
+		for ind, name in enumerate(self.names):
+			self._index(name, ind)
+
+	def _index (self, name: str, ind: int) -> None:
+		if self._positions.setdefault(name, ind) != ind and name not in self._repeated:
+			self._repeated.add(name)
+			self.duplicates.append(name)
+
+	def append (self, name: str) -> int:
+		self.names.append(name)
+		self._index(name, len(self.names) - 1)
+		return len(self.names) - 1
+
+	def indexOf (self, name: str) -> int:
+		'''
+		Same as list.index(), raises a ValueError for missing names
+		'''
+		ind = self._positions.get(name)
+		if ind == None:
+			raise ValueError(f"'{name}' is not in the names")
+		return ind
+
+	def nextAvailable (self, nameBase: str, startInd: int=0) -> Tuple[str, int]:
+		'''
+		The first nameBase + a number (from startInd up) not already
+		a name, along with its number
+		'''
+		num = startInd
+		while nameBase + str(num) in self._positions:
+			num += 1
+		return nameBase + str(num), num
+
+	def __contains__ (self, name: str) -> bool:
+		return name in self._positions
+
+	def __len__ (self) -> int:
+		return len(self.names)
 
 
 @define
@@ -28,37 +248,218 @@ class InputConstraintData:
 	var_names: List[str]
 	const_names: List[str]
 
-	# These are all parallel Lists
-	vec_const_bounds: List[float]
+	# These are all parallel Lists (or arrays, in the case
+	# of the bounds & matrix)
+	vec_const_bounds: Vector
 	vec_operators: List[str]
-	mat_constraint_coeffs: List[List[float]] 
+	mat_constraint_coeffs: Matrix
 
 
-@frozen
+@frozen(eq=False)
+class ConstraintBlock:
+	'''
+	All the final constraints & names, split by operator.
+
+	When loading a directory of objective files, they all share
+	the same constraint file. So, this is built once and every
+	FinalModel points to the same (immutable) block. Names are
+	tuples and arrays are marked read only so nothing can edit
+	the block out from under another model.
+	'''
+	var_names: Tuple[str, ...]
+
+	le_const_names: Tuple[str, ...]
+	ge_const_names: Tuple[str, ...]
+	eq_const_names: Tuple[str, ...]
+
+	le_vec: Vector
+	ge_vec: Vector
+	eq_vec: Vector
+
+	le_mat: Matrix
+	ge_mat: Matrix
+	eq_mat: Matrix
+
+
+@frozen(eq=False)
 class FinalModel:
 	'''
 	This class represents all the final constraints & names
 	When created it should already be valid. The idea is do
 	error checking & linting first, then instantiate this class,
 	then write it to the dat file.
+
+	The constraints live in a (possibly shared) ConstraintBlock,
+	the properties below let you read them off the model directly,
+	eg: finalModel.le_mat
 	'''
 
 	# Because this class is immutable, there are no
 	# defaults. All values placed should be final
-	var_names: List[str]
 	obj_coeffs: List[float]
+	constraints: ConstraintBlock
+
+	@property
+	def var_names (self) -> Tuple[str, ...]:
+		return self.constraints.var_names
+
+	@property
+	def le_const_names (self) -> Tuple[str, ...]:
+		return self.constraints.le_const_names
+
+	@property
+	def ge_const_names (self) -> Tuple[str, ...]:
+		return self.constraints.ge_const_names
+
+	@property
+	def eq_const_names (self) -> Tuple[str, ...]:
+		return self.constraints.eq_const_names
+
+	@property
+	def le_vec (self) -> Vector:
+		return self.constraints.le_vec
+
+	@property
+	def ge_vec (self) -> Vector:
+		return self.constraints.ge_vec
+
+	@property
+	def eq_vec (self) -> Vector:
+		return self.constraints.eq_vec
+
+	@property
+	def le_mat (self) -> Matrix:
+		return self.constraints.le_mat
+
+	@property
+	def ge_mat (self) -> Matrix:
+		return self.constraints.ge_mat
+
+	@property
+	def eq_mat (self) -> Matrix:
+		return self.constraints.eq_mat
+
+
+
+@frozen(eq=False)
+class ResultNames:
+	'''
+	The name tables RunResult arrays are indexed against. Built once
+	per ConstraintBlock and shared by every run on it.
+
+	Duals are ordered GE, then LE, then EQ constraints (const_names).
+	'''
+	var_names: Tuple[str, ...]
+	ge_const_names: Tuple[str, ...]
+	le_const_names: Tuple[str, ...]
+	eq_const_names: Tuple[str, ...]
+
+	const_names: Tuple[str, ...]
+
+	@staticmethod
+	def fromNames (var_names: Sequence[str], ge_const_names: Sequence[str], le_const_names: Sequence[str], eq_const_names: Sequence[str]) -> 'ResultNames':
+		const_names = tuple(ge_const_names) + tuple(le_const_names) + tuple(eq_const_names)
+		return ResultNames(
+			var_names=tuple(var_names),
+			ge_const_names=tuple(ge_const_names),
+			le_const_names=tuple(le_const_names),
+			eq_const_names=tuple(eq_const_names),
+			const_names=const_names
+		)
+
+	@staticmethod
+	def fromBlock (block: ConstraintBlock) -> 'ResultNames':
+		return ResultNames.fromNames(block.var_names, block.ge_const_names, block.le_const_names, block.eq_const_names)
+
+
+
+
+
+@define
+class RunResult:
+	'''
+	Everything read out of a solve, detached from pyomo (and whichever
+	solver ran it). Filled once right after the solve so the instance
+	can be thrown away. attrs gives it __slots__.
+
+	The arrays line up with the shared name table (names) and are None
+	unless the run terminated optimally. The *Dict() methods give the
+	same dicts as pyomo_runner.getVariableValues(...), getShadowPrices(...),
+	getSlackGE(...) and getSlackLE(...).
+	'''
+	status: str
+	termination: str
+	objective_value: Optional[float]
+
+	names: Optional[ResultNames] = None
+	var_values: Optional[np.ndarray] = None     # names.var_names
+	reduced_costs: Optional[np.ndarray] = None  # names.var_names, nan if the solver gave none
+	duals: Optional[np.ndarray] = None          # names.const_names
+	slack_ge: Optional[np.ndarray] = None       # names.ge_const_names
+	slack_le: Optional[np.ndarray] = None       # names.le_const_names
+
+	# Filled in by pyomo_runner.solveModels(...)
+	task_seconds: Optional[float] = None # the whole worker task (build, solve, extract, or the cache read)
+	worker: Optional[int] = None # process id that solved it
+	from_cache: bool = False     # read from a ModelCache instead of solved
+
+	# timing.RUN_PHASES -> wall seconds & peak memory (MiB) of the solving
+	# process during the phase, and the largest of those peaks
+	phase_seconds: Optional[Dict[str, float]] = None
+	phase_peak_mib: Optional[Dict[str, float]] = None
+	peak_mib: Optional[float] = None
+
+	def summary (self) -> Dict[str, Any]:
+		'''
+		The same dict as pyomo_runner.getRunSummary(...)
+		'''
+		return {
+			'status': self.status,
+			'termination': self.termination,
+			'objective_value': self.objective_value
+		}
+
+	def timingSummary (self) -> Dict[str, Optional[float]]:
+		'''
+		Seconds for each of timing.RUN_PHASES plus peak memory, for summaries
+		'''
+		phases = self.phase_seconds or {}
+		row = {f'{p}_seconds': phases.get(p) for p in timing.RUN_PHASES}
+		row['peak_mib'] = self.peak_mib
+		return row
+
+	def isOptimal (self) -> bool:
+		return self.termination == 'optimal'
+
+	def hasValues (self) -> bool:
+		return self.var_values is not None
+
+	def varValuesDict (self) -> Dict[str, float]:
+		return self._toDict(self.names.var_names, self.var_values)
+
+	def reducedCostsDict (self) -> Dict[str, float]:
+		return self._toDict(self.names.var_names, self.reduced_costs)
+
+	def shadowPricesDict (self) -> Dict[str, float]:
+		return self._toDict(self.names.const_names, self.duals)
+
+	def slackGEDict (self) -> Dict[str, float]:
+		return self._toDict(self.names.ge_const_names, self.slack_ge)
 
-	le_const_names: List[str]
-	ge_const_names: List[str]
-	eq_const_names: List[str]
+	def slackLEDict (self) -> Dict[str, float]:
+		return self._toDict(self.names.le_const_names, self.slack_le)
 
-	le_vec: List[float]
-	ge_vec: List[float]
-	eq_vec: List[float]
+	def withoutValues (self) -> 'RunResult':
+		'''
+		A copy with only the summary & timing, the per variable and per
+		constraint values are dropped
+		'''
+		return evolve(self, names=None, var_values=None, reduced_costs=None, duals=None, slack_ge=None, slack_le=None)
 
-	le_mat: List[List[float]]
-	ge_mat: List[List[float]]
-	eq_mat: List[List[float]]
+	def _toDict (self, names: Tuple[str, ...], values: Optional[np.ndarray]) -> Dict[str, float]:
+		if values is None:
+			return {}
+		return dict(zip(names, values.tolist()))
 
 
 
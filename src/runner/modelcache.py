@@ -0,0 +1,440 @@
+'''
+Model Cache
+
+An on-disk cache of linted & converted models, so loading the same
+constraint/objective files again (even in a later session) doesn't
+re-parse and re-lint the csvs.
+
+It also keeps solved results, so re-running a model that was already
+solved with the same solver settings never calls the solver again.
+
+Entries are content addressed, the key is a hash of the input file(s)
+and converter.LINT_VERSION, so editing a file or changing the lint
+rules means a new key. Result keys hash the (canonicalized) constraint
+block, objective, solver settings and RESULT_VERSION, see
+makeResultKey(...). Each entry is a folder of .npy arrays, which are
+memory mapped when loaded, and a small json name table.
+
+  <cache dir>/
+    const-<key>/    ConstraintBlock arrays + names.json
+    obj-<key>/      objective coefficients + names.json
+    res-<key>/      RunResult arrays + names.json (summary fields only)
+
+The cache is size and age bounded. evict() deletes entries not used in
+maxAgeSeconds, then the least recently used entries until the cache is
+under maxBytes. Writing entries doesn't evict on its own, so call
+evict() once after a batch of put*() calls.
+
+Nothing in here should ever stop a model from loading. Any problem
+reading or writing the cache is treated as a cache miss.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import runner.model_data_classes as models
+
+
+# Bump this if the layout of an entry changes
+_FORMAT_VERSION = 1
+
+# Bump this if what gets read out of a solve changes (pyomo_runner's
+# extractRunResult(...) or a backend's solve(...)), so results stored
+# by older code are solved again instead of served stale
+RESULT_VERSION = 1
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+DEFAULT_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+_APP_FOLDER = 'ForMOM-Runner'
+_OP_CLASSES = ['le', 'ge', 'eq']
+_NAME_TABLE = 'names.json'
+_RESULT_ARRAYS = ['var_values', 'reduced_costs', 'duals', 'slack_ge', 'slack_le']
+
+# Only results that would come out the same on a re-solve are kept,
+# hitting a time limit depends on how busy the machine was
+_CACHEABLE_TERMINATIONS = {'optimal', 'infeasible', 'unbounded', 'infeasibleOrUnbounded'}
+
+
+
+def getDefaultCacheDir () -> Path:
+	'''
+	Returns the user level cache folder for this program. Can be
+	overriden with the FORMOM_CACHE_DIR environment variable.
+	'''
+	if os.environ.get('FORMOM_CACHE_DIR'):
+		return Path(os.environ['FORMOM_CACHE_DIR'])
+
+	if sys.platform.startswith('win'):
+		base = os.environ.get('LOCALAPPDATA', Path.home() / 'AppData' / 'Local')
+		return Path(base) / _APP_FOLDER / 'cache'
+
+	if sys.platform == 'darwin':
+		return Path.home() / 'Library' / 'Caches' / _APP_FOLDER
+
+	base = os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')
+	return Path(base) / _APP_FOLDER
+
+
+def hashFile (filepath) -> str:
+	'''
+	sha256 of a file's contents
+	'''
+	hasher = hashlib.sha256()
+	with open(filepath, 'rb') as f:
+		for chunk in iter(lambda: f.read(1024 * 1024), b''):
+			hasher.update(chunk)
+	return hasher.hexdigest()
+
+
+def makeKey (*parts) -> str:
+	'''
+	Combines strings (file hashes, versions, other keys) into one key
+	'''
+	hasher = hashlib.sha256(f'format{_FORMAT_VERSION}'.encode())
+	for p in parts:
+		hasher.update(b'\0' + str(p).encode())
+	return hasher.hexdigest()
+
+
+def hashConstraintBlock (block: models.ConstraintBlock) -> str:
+	'''
+	Hashes a block by content. Blocks that describe the same constraints
+	hash the same no matter how their matrices are stored (lists, sparse,
+	memory mapped), explicit zeros and -0.0s are ignored.
+	'''
+	hasher = hashlib.sha256()
+	_hashNames(hasher, block.var_names)
+
+	for op in _OP_CLASSES:
+		mat = _canonicalSparse(getattr(block, f'{op}_mat'), len(block.var_names))
+		_hashNames(hasher, getattr(block, f'{op}_const_names'))
+		_hashArray(hasher, getattr(block, f'{op}_vec'), np.float64)
+		_hashArray(hasher, mat.data, np.float64)
+		_hashArray(hasher, mat.indices, np.int64)
+		_hashArray(hasher, mat.indptr, np.int64)
+
+	return hasher.hexdigest()
+
+
+def hashObjective (objCoeffs) -> str:
+	hasher = hashlib.sha256()
+	_hashArray(hasher, objCoeffs, np.float64)
+	return hasher.hexdigest()
+
+
+def makeResultKey (blockHash: str, objHash: str, solverName: str, timeLimit: Optional[float]) -> str:
+	'''
+	The key a RunResult is stored under. Anything that changes what the
+	solver returns, or how it's read, has to be in here.
+	'''
+	return makeKey('result', RESULT_VERSION, blockHash, objHash, solverName, timeLimit)
+
+
+def _hashNames (hasher, names: Sequence[str]) -> None:
+	hasher.update(json.dumps(list(names)).encode())
+
+
+def _hashArray (hasher, arr, dtype) -> None:
+	# + 0 turns -0.0 into 0.0
+	arr = np.ascontiguousarray(np.asarray(arr, dtype=dtype) + dtype(0))
+	hasher.update(str(arr.shape).encode())
+	hasher.update(arr.tobytes())
+
+
+def _canonicalSparse (mat: models.Matrix, numCols: int) -> models.SparseMatrix:
+	if not isinstance(mat, models.SparseMatrix):
+		if len(mat) == 0:
+			return models.SparseMatrix.fromRows([], [], numCols)
+		return models.SparseMatrix.fromDense(mat)
+
+	keep = np.asarray(mat.data) != 0
+	if keep.all():
+		return mat
+
+	rows = mat.rowIndexOfNonzeros()[keep]
+	return models.SparseMatrix(
+		data=np.asarray(mat.data)[keep],
+		indices=np.asarray(mat.indices)[keep],
+		indptr=np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=mat.shape[0]))]),
+		shape=mat.shape
+	)
+
+
+
+
+class ModelCache:
+	'''
+	The on-disk cache. get*() methods return None on a miss.
+	'''
+
+	def __init__ (self, cacheDir, maxBytes: int=DEFAULT_MAX_BYTES, maxAgeSeconds: float=DEFAULT_MAX_AGE_SECONDS):
+		self.cacheDir = Path(cacheDir)
+		self.maxBytes = maxBytes
+		self.maxAgeSeconds = maxAgeSeconds
+
+		try:
+			self.cacheDir.mkdir(parents=True, exist_ok=True)
+			self.enabled = True
+		except OSError:
+			self.enabled = False
+
+
+	#
+	# Constraint Blocks
+
+	def getConstraints (self, key: str) -> Optional[Tuple[models.ConstraintBlock, List[str]]]:
+		'''
+		Returns (ConstraintBlock, lint warnings) or None.
+		The block's arrays are read only memory maps of the cache files.
+		'''
+		entry = self._entryDir('const', key)
+		table = self._readNameTable(entry)
+		if table == None:
+			return None
+
+		try:
+			split = {}
+			for op in _OP_CLASSES:
+				mat = models.SparseMatrix(
+					data=_loadArray(entry / f'{op}_data.npy'),
+					indices=_loadArray(entry / f'{op}_indices.npy'),
+					indptr=_loadArray(entry / f'{op}_indptr.npy'),
+					shape=(len(table[f'{op}_const_names']), len(table['var_names']))
+				)
+				split[op] = (tuple(table[f'{op}_const_names']), _loadArray(entry / f'{op}_vec.npy'), mat)
+		except (OSError, ValueError):
+			return None
+
+		block = models.ConstraintBlock(
+			var_names=tuple(table['var_names']),
+			le_const_names=split['le'][0], le_vec=split['le'][1], le_mat=split['le'][2],
+			ge_const_names=split['ge'][0], ge_vec=split['ge'][1], ge_mat=split['ge'][2],
+			eq_const_names=split['eq'][0], eq_vec=split['eq'][1], eq_mat=split['eq'][2]
+		)
+
+		self._touch(entry)
+		return block, table['messages']
+
+
+	def putConstraints (self, key: str, block: models.ConstraintBlock, messages: List[str]) -> None:
+		table = {
+			'var_names': list(block.var_names),
+			'messages': list(messages),
+		}
+		arrays = {}
+
+		for op in _OP_CLASSES:
+			mat = getattr(block, f'{op}_mat')
+			if not isinstance(mat, models.SparseMatrix):
+				mat = models.SparseMatrix.fromDense(mat)
+
+			table[f'{op}_const_names'] = list(getattr(block, f'{op}_const_names'))
+			arrays[f'{op}_vec'] = np.asarray(getattr(block, f'{op}_vec'), dtype=np.float64)
+			arrays[f'{op}_data'] = mat.data
+			arrays[f'{op}_indices'] = mat.indices
+			arrays[f'{op}_indptr'] = mat.indptr
+
+		self._writeEntry('const', key, table, arrays)
+
+
+	#
+	# Objective Vectors
+
+	def getObjective (self, key: str) -> Optional[Tuple[List[float], List[str]]]:
+		'''
+		Returns (objective coefficients, lint warnings) or None
+		'''
+		entry = self._entryDir('obj', key)
+		table = self._readNameTable(entry)
+		if table == None:
+			return None
+
+		try:
+			obj_coeffs = np.load(entry / 'obj_coeffs.npy').tolist()
+		except (OSError, ValueError):
+			return None
+
+		self._touch(entry)
+		return obj_coeffs, table['messages']
+
+
+	def putObjective (self, key: str, objCoeffs: List[float], messages: List[str]) -> None:
+		self._writeEntry(
+			'obj', key,
+			{'messages': list(messages)},
+			{'obj_coeffs': np.asarray(objCoeffs, dtype=np.float64)}
+		)
+
+
+	#
+	# Run Results
+
+	def hasResult (self, key: str) -> bool:
+		return self.enabled and (self._entryDir('res', key) / _NAME_TABLE).exists()
+
+
+	def getResult (self, key: str, names: models.ResultNames) -> Optional[models.RunResult]:
+		'''
+		Returns the stored RunResult (with names as its name table) or None
+		'''
+		entry = self._entryDir('res', key)
+		table = self._readNameTable(entry)
+		if table == None:
+			return None
+
+		arrays = {}
+		try:
+			for name in table['arrays']:
+				arrays[name] = np.load(entry / f'{name}.npy')
+		except (OSError, ValueError):
+			return None
+
+		if 'var_values' in arrays and len(arrays['var_values']) != len(names.var_names):
+			return None
+
+		self._touch(entry)
+		return models.RunResult(
+			status=table['status'],
+			termination=table['termination'],
+			objective_value=table['objective_value'],
+			names=names,
+			**arrays
+		)
+
+
+	def putResult (self, key: str, result: models.RunResult) -> None:
+		if result.termination not in _CACHEABLE_TERMINATIONS:
+			return
+
+		arrays = {}
+		for name in _RESULT_ARRAYS:
+			arr = getattr(result, name)
+			if arr is not None:
+				arrays[name] = arr
+
+		self._writeEntry(
+			'res', key,
+			{**result.summary(), 'arrays': list(arrays)},
+			arrays
+		)
+
+
+	#
+	# Housekeeping
+
+	def evict (self) -> None:
+		'''
+		Deletes entries unused for maxAgeSeconds, then least recently
+		used entries until the cache is under maxBytes
+		'''
+		if not self.enabled:
+			return
+
+		oldest = time.time() - self.maxAgeSeconds
+		entries = []
+		total = 0
+		for entry in self.cacheDir.iterdir():
+			if entry.name.startswith('.') or not entry.is_dir():
+				continue
+			try:
+				mtime = entry.stat().st_mtime
+				if mtime < oldest:
+					shutil.rmtree(entry, ignore_errors=True)
+					continue
+				size = sum(f.stat().st_size for f in entry.iterdir())
+				entries.append((mtime, size, entry))
+				total += size
+			except OSError:
+				continue
+
+		for _, size, entry in sorted(entries, key=lambda e: e[0]):
+			if total <= self.maxBytes:
+				break
+			shutil.rmtree(entry, ignore_errors=True)
+			total -= size
+
+
+	def clear (self) -> None:
+		if self.enabled:
+			shutil.rmtree(self.cacheDir, ignore_errors=True)
+			self.cacheDir.mkdir(parents=True, exist_ok=True)
+
+
+	def _entryDir (self, kind: str, key: str) -> Path:
+		return self.cacheDir / f'{kind}-{key}'
+
+
+	def _readNameTable (self, entry: Path) -> Optional[dict]:
+		if not self.enabled:
+			return None
+		try:
+			with open(entry / _NAME_TABLE, 'r') as f:
+				return json.load(f)
+		except (OSError, ValueError):
+			return None
+
+
+	def _writeEntry (self, kind: str, key: str, table: dict, arrays: dict) -> None:
+		'''
+		Writes into a temporary folder then renames it, so a half
+		written entry is never read
+		'''
+		if not self.enabled:
+			return
+
+		entry = self._entryDir(kind, key)
+		if entry.exists():
+			return
+
+		tmpDir = None
+		try:
+			tmpDir = Path(tempfile.mkdtemp(prefix='.tmp-', dir=self.cacheDir))
+			for name, arr in arrays.items():
+				np.save(tmpDir / f'{name}.npy', np.ascontiguousarray(arr))
+			with open(tmpDir / _NAME_TABLE, 'w') as f:
+				json.dump(table, f)
+			os.rename(tmpDir, entry)
+		except OSError:
+			# Most likely another process wrote the same entry first
+			if tmpDir != None:
+				shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+	def _touch (self, entry: Path) -> None:
+		# The folder's mtime doubles as the last used time for eviction
+		try:
+			os.utime(entry)
+		except OSError:
+			pass
+
+
+
+
+def _loadArray (filepath: Path) -> np.ndarray:
+	'''
+	Memory maps an .npy file (read only). Zero length arrays can't be
+	memory mapped so those are read normally.
+	'''
+	try:
+		return np.load(filepath, mmap_mode='r')
+	except ValueError:
+		arr = np.load(filepath)
+		arr.setflags(write=False)
+		return arr
+
+
+
+
+if __name__ == '__main__':
+	print("This file is not meant to be run")
+	sys.exit(1)
@@ -11,14 +11,29 @@ relevant info.
 
 New Jersey Forest Service 2022
 '''
+import abc
+from collections import deque
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import signal
 import sys
-from typing import Any, Dict, Union
+import threading
+import time
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple, Union
+import numpy as np
 import pyomo.environ as pyo
 import pyomo.opt as opt
 
+import runner.model_data_classes as models
+import runner.modelcache as modelcache
 import runner.text as text
+import runner.timing as timing
 
 
+_log = logging.getLogger(__name__)
+
 # In Python2, integer divisions truncate values (1/2 = 0 instead of 0.5)
 # which breaks the solver. Either way, we should be using python3
 if (sys.version[0] != '3'):
@@ -52,40 +67,243 @@ def _buildAbstractModel () -> pyo.AbstractModel:
 	# These guys are read from input.dat
 	model.vec_objective = pyo.Param(model.index_vars)
 
-	model.mat_le = pyo.Param(model.index_le_consts, model.index_vars)
+	# The matrices are sparse, data only needs to give the nonzeros
+	model.mat_le = pyo.Param(model.index_le_consts, model.index_vars, default=0)
 	model.vec_le = pyo.Param(model.index_le_consts)
 
-	model.mat_ge = pyo.Param(model.index_ge_consts, model.index_vars)
+	model.mat_ge = pyo.Param(model.index_ge_consts, model.index_vars, default=0)
 	model.vec_ge = pyo.Param(model.index_ge_consts)
 
-	model.mat_eq = pyo.Param(model.index_eq_consts, model.index_vars)
+	model.mat_eq = pyo.Param(model.index_eq_consts, model.index_vars, default=0)
 	model.vec_eq = pyo.Param(model.index_eq_consts)
 
 	#Defining the actual functions
 	def obj_function(_model):
 		return pyo.summation(_model.vec_objective, _model.x)
 
+	# Constraint rows only sum over their nonzero coefficients, so the
+	# expressions (and the LP file) scale with nonzeros, not vars * rows.
+	# The nonzeros are grouped by row once the matrices are loaded, and
+	# dropped again once the constraints are built
+	rowNonzeros = {}
+
+	def group_nonzeros (_model):
+		for mat in [_model.mat_le, _model.mat_ge, _model.mat_eq]:
+			rowNonzeros[mat.local_name] = _groupRowNonzeros(mat)
+
+	def release_nonzeros (_model):
+		rowNonzeros.clear()
+
 	def le_mat_rule (_model, k):
-		return sum(_model.mat_le[k, i] * _model.x[i] for i in _model.index_vars) <= _model.vec_le[k]
+		return _sparseRowSum(_model, rowNonzeros['mat_le'], k) <= _model.vec_le[k]
 
 	def ge_mat_rule (_model, k):
-		return sum(_model.mat_ge[k, i] * _model.x[i] for i in _model.index_vars) >= _model.vec_ge[k]
+		return _sparseRowSum(_model, rowNonzeros['mat_ge'], k) >= _model.vec_ge[k]
 
 	def eq_mat_rule (_model, k):
-		return sum(_model.mat_eq[k, i] * _model.x[i] for i in _model.index_vars) == _model.vec_eq[k]
+		return _sparseRowSum(_model, rowNonzeros['mat_eq'], k) == _model.vec_eq[k]
 
 	model.OBJ = pyo.Objective(rule=obj_function, sense=pyo.maximize)
+	model.GroupNonzeros = pyo.BuildAction(rule=group_nonzeros)
 	model.GEConstraint = pyo.Constraint(model.index_ge_consts, rule=ge_mat_rule)
 	model.LEConstraint = pyo.Constraint(model.index_le_consts, rule=le_mat_rule)
 	model.EQConstraint = pyo.Constraint(model.index_eq_consts, rule=eq_mat_rule)
+	model.ReleaseNonzeros = pyo.BuildAction(rule=release_nonzeros)
+
+	return model
+
+
+def buildConcreteModel (finalModel: models.FinalModel) -> pyo.ConcreteModel:
+	'''
+	Builds a ConcreteModel straight from a FinalModel, without going
+	through convertFinalModelToDataDict(...) and the AbstractModel.
+
+	The sets, variables, objective, constraints and dual suffix have the
+	same names as the models from loadPyomoModelFromDataDict(...), so
+	everything that reads a solved instance works on either. There are
+	no Params though, coefficients go straight into the expressions and
+	only nonzero coefficients are used.
+	'''
+	fm = finalModel
+	model, xs = _buildConstraintSystem(fm.constraints)
+
+	model.OBJ = pyo.Objective(
+		expr=pyo.quicksum(coef * x for coef, x in zip(fm.obj_coeffs, xs) if coef != 0),
+		sense=pyo.maximize
+	)
+
+	return model
+
+
+def buildSweepModel (constraints: models.ConstraintBlock) -> pyo.ConcreteModel:
+	'''
+	Builds a ConcreteModel for running many objectives against the same
+	constraints. The constraint system is built once, and the objective
+	coefficients are a mutable Param (vec_objective) which is changed with
+	setSweepObjective(...) between solves.
+
+	Naming is the same as buildConcreteModel(...). All objective
+	coefficients start at 0.
+	'''
+	model, xs = _buildConstraintSystem(constraints)
+
+	model.vec_objective = pyo.Param(model.index_vars, mutable=True, initialize=0)
+	model.OBJ = pyo.Objective(
+		expr=pyo.quicksum(model.vec_objective[name] * x for name, x in zip(constraints.var_names, xs)),
+		sense=pyo.maximize
+	)
 
 	return model
 
 
+def setSweepObjective (instance: pyo.ConcreteModel, finalModel: models.FinalModel) -> None:
+	'''
+	Swaps a sweep model's objective (see buildSweepModel) for the
+	finalModel's. The finalModel must use the same constraints the
+	sweep model was built from.
+	'''
+	instance.vec_objective.store_values(dict(zip(finalModel.var_names, finalModel.obj_coeffs)))
+
+
+def runObjectiveSweep (finalModels: List[models.FinalModel], verboseToConsole: bool=False) -> Iterator[Tuple[pyo.ConcreteModel, opt.SolverResults]]:
+	'''
+	Solves many models which share one ConstraintBlock (eg: from
+	converter.lintAndConvertManyFromFilepaths) by building the pyomo model
+	once, and only swapping the objective between solves.
+
+	Yields (instance, results) for each model in order. THE SAME INSTANCE
+	IS YIELDED EVERY TIME, so read whatever you need from it (variable
+	values, shadow prices, slacks, ...) before moving on to the next one.
+	'''
+	if len(finalModels) == 0:
+		return
+
+	constraints = finalModels[0].constraints
+	instance = buildSweepModel(constraints)
+
+	for fm in finalModels:
+		assert(fm.constraints is constraints), "All models in a sweep must share one ConstraintBlock"
+		setSweepObjective(instance, fm)
+		yield solveConcreteModel(instance, verboseToConsole)
+
+
+def _buildConstraintSystem (constraints: models.ConstraintBlock) -> Tuple[pyo.ConcreteModel, List[pyo.Var]]:
+	'''
+	Builds everything except the objective: sets, variables, constraints
+	and the dual suffix. Also returns the list of variables, where position
+	i is constraints.var_names[i], lining up with matrix columns.
+	'''
+	cb = constraints
+
+	model = pyo.ConcreteModel()
+	model.index_vars = pyo.Set(initialize=list(cb.var_names), ordered=True)
+	model.index_le_consts = pyo.Set(initialize=list(cb.le_const_names), ordered=True)
+	model.index_ge_consts = pyo.Set(initialize=list(cb.ge_const_names), ordered=True)
+	model.index_eq_consts = pyo.Set(initialize=list(cb.eq_const_names), ordered=True)
+
+	model.x = pyo.Var(model.index_vars, domain=pyo.NonNegativeReals)
+	xs = [model.x[name] for name in cb.var_names]
+
+	le_mat = _asSparse(cb.le_mat, len(xs))
+	ge_mat = _asSparse(cb.ge_mat, len(xs))
+	eq_mat = _asSparse(cb.eq_mat, len(xs))
+	le_rows = {name: ind for ind, name in enumerate(cb.le_const_names)}
+	ge_rows = {name: ind for ind, name in enumerate(cb.ge_const_names)}
+	eq_rows = {name: ind for ind, name in enumerate(cb.eq_const_names)}
+
+	def le_mat_rule (_model, k):
+		ind = le_rows[k]
+		return (None, _rowExpression(le_mat, ind, xs), float(cb.le_vec[ind]))
+
+	def ge_mat_rule (_model, k):
+		ind = ge_rows[k]
+		return (float(cb.ge_vec[ind]), _rowExpression(ge_mat, ind, xs), None)
+
+	def eq_mat_rule (_model, k):
+		ind = eq_rows[k]
+		return _rowExpression(eq_mat, ind, xs) == float(cb.eq_vec[ind])
+
+	model.GEConstraint = pyo.Constraint(model.index_ge_consts, rule=ge_mat_rule)
+	model.LEConstraint = pyo.Constraint(model.index_le_consts, rule=le_mat_rule)
+	model.EQConstraint = pyo.Constraint(model.index_eq_consts, rule=eq_mat_rule)
+
+	model.dual = pyo.Suffix(direction=pyo.Suffix.IMPORT_EXPORT)
+	model.rc = pyo.Suffix(direction=pyo.Suffix.IMPORT)
+
+	return model, xs
+
+
+def _asSparse (mat: models.Matrix, numCols: int) -> models.SparseMatrix:
+	'''
+	FinalModel matrices can be a list of lists or a SparseMatrix.
+	This converts either to a SparseMatrix.
+	'''
+	if isinstance(mat, models.SparseMatrix):
+		return mat
+	if len(mat) == 0:
+		return models.SparseMatrix.fromRows([], [], numCols)
+	return models.SparseMatrix.fromDense(mat)
+
+
+def _rowExpression (mat: models.SparseMatrix, rowInd: int, xs: List[pyo.Var]):
+	'''
+	The sum of coef * x over the nonzeros in a row of the matrix
+	'''
+	cols, vals = mat.row(rowInd)
+
+	if len(cols) == 0:
+		# An empty row would make the constraint a trivial True/False, which
+		# pyomo rejects. Keep an explicit 0 term so the constraint (and its
+		# slack & dual) still exists.
+		if len(xs) == 0:
+			raise ValueError(NO_VARIABLES_ERROR)
+		return 0 * xs[0]
+
+	return pyo.quicksum(coef * xs[col] for col, coef in zip(cols.tolist(), vals.tolist()))
+
+
+def _sparseRowSum (_model, rowNonzeros: Dict[Any, List], k):
+	'''
+	For the abstract model. The sum of mat[k, i] * x[i] over only
+	the nonzero entries in row k, see _groupRowNonzeros(...)
+	'''
+	terms = rowNonzeros.get(k, [])
+
+	if len(terms) == 0:
+		# Same as _rowExpression(...), keep the constraint from being trivial
+		if len(_model.index_vars) == 0:
+			raise ValueError(NO_VARIABLES_ERROR)
+		return 0 * _model.x[_model.index_vars.first()]
+
+	return pyo.quicksum(coef * _model.x[i] for i, coef in terms)
+
+
+def _groupRowNonzeros (mat: pyo.Param) -> Dict[Any, List]:
+	'''
+	Groups the explicitly set, nonzero entries of a matrix Param by row
+	{row: [(var, coef), ...]}
+
+	Data dicts only hold nonzeros (the Params default to 0), but .dat
+	files can still list zeros so those are dropped.
+	'''
+	rows = {}
+	for (k, i), coef in mat.sparse_items():
+		if coef != 0:
+			rows.setdefault(k, []).append((i, coef))
+	return rows
+
+
+# Constraints need at least one variable to hang their 0 term on, the
+# converter's lint rejects these models before they get here
+NO_VARIABLES_ERROR = "Model has no variables, constraints can't be built"
+
+
 def loadPyomoModelFromDataDict (datadict: dict):
 	model = _buildAbstractModel()
-	instance = model.create_instance(data=datadict)
+	with timing.phase('build'):
+		instance = model.create_instance(data=datadict)
 	instance.dual = pyo.Suffix(direction=pyo.Suffix.IMPORT_EXPORT)
+	instance.rc = pyo.Suffix(direction=pyo.Suffix.IMPORT)
 	return instance
 
 
@@ -93,26 +311,32 @@ def loadPyomoModelFromDat (datFilepath: str) -> pyo.ConcreteModel:
 	model = _buildAbstractModel()
 
 	# Now read data file
-	instance = model.create_instance(filename=datFilepath)
+	with timing.phase('build'):
+		instance = model.create_instance(filename=datFilepath)
 
 	# Add duals (shadow cost) info 
 	# I have no idea why duals are the same as shadow costs, but they are
 	instance.dual = pyo.Suffix(direction=pyo.Suffix.IMPORT_EXPORT)
+	instance.rc = pyo.Suffix(direction=pyo.Suffix.IMPORT)
 
 	return instance
 
 
-def solveConcreteModel (instance: pyo.ConcreteModel, verboseToConsole: bool=False) -> Union[pyo.ConcreteModel, opt.SolverResults]:
+def solveConcreteModel (instance: pyo.ConcreteModel, verboseToConsole: bool=False, timeLimit: Optional[float]=None) -> Union[pyo.ConcreteModel, opt.SolverResults]:
 	'''
 		Solves the passed in modle (mutates it), and returns
 		the concrete model + the solver results
+
+		timeLimit is in seconds, None for no limit
 	'''
-	print("Solving a model", end='')
+	_log.debug("Solving a model (glpk)")
 	solver = pyo.SolverFactory('glpk')
+	if timeLimit != None:
+		solver.options['tmlim'] = max(1, int(timeLimit))
 
 	# Now optimize
 	results = solver.solve(instance, tee=verboseToConsole)
-	print(" ... Solved")
+	_log.debug("Solved a model (glpk)")
 
 	return instance, results
 
@@ -121,6 +345,430 @@ def solveConcreteModel (instance: pyo.ConcreteModel, verboseToConsole: bool=Fals
 
 
 
+# =====================================================================================
+#                                    Solver Backends
+# =====================================================================================
+#
+# A backend takes a FinalModel and returns a models.RunResult. How it gets
+# there is up to the backend:
+#  - glpk builds a pyomo model, which pyomo writes to an LP file for the
+#    glpsol executable, and reads a solution file back
+#  - highs hands the arrays straight to the HiGHS library, in process,
+#    without pyomo or any files. It needs the highspy package.
+#
+
+class SolverBackend (abc.ABC):
+	name = ''
+
+	def __init__ (self, timeLimit: Optional[float]=None):
+		# Seconds per solve, None for no limit
+		self.timeLimit = timeLimit
+
+	@abc.abstractmethod
+	def isAvailable (self) -> bool:
+		...
+
+	@abc.abstractmethod
+	def solve (self, finalModel: models.FinalModel, verboseToConsole: bool=False) -> models.RunResult:
+		...
+
+	def _resultNames (self, block: models.ConstraintBlock) -> models.ResultNames:
+		'''
+		The name table for a block, reused while runs share the block
+		'''
+		if getattr(self, '_namesBlock', None) is not block:
+			self._namesBlock = block
+			self._names = models.ResultNames.fromBlock(block)
+		return self._names
+
+
+class GlpkBackend (SolverBackend):
+	name = 'glpk'
+
+	def __init__ (self, timeLimit: Optional[float]=None):
+		super().__init__(timeLimit)
+
+		# Models sharing a ConstraintBlock with the last solve reuse its
+		# sweep model (see buildSweepModel), only swapping the objective
+		self._sweepBlock = None
+		self._sweepInstance = None
+
+	def isAvailable (self) -> bool:
+		return pyo.SolverFactory('glpk').available(exception_flag=False)
+
+	def solve (self, finalModel: models.FinalModel, verboseToConsole: bool=False) -> models.RunResult:
+		with timing.phase('build'):
+			if finalModel.constraints is not self._sweepBlock:
+				self._sweepBlock = finalModel.constraints
+				self._sweepInstance = buildSweepModel(finalModel.constraints)
+
+			setSweepObjective(self._sweepInstance, finalModel)
+
+		# pyomo writes the LP file, runs glpsol & reads its output in one call
+		with timing.phase('solve'):
+			instance, results = solveConcreteModel(self._sweepInstance, verboseToConsole, self.timeLimit)
+
+		with timing.phase('extract'):
+			return extractRunResult(instance, results, self._resultNames(finalModel.constraints), finalModel.constraints)
+
+
+class HighsBackend (SolverBackend):
+	name = 'highs'
+
+	def isAvailable (self) -> bool:
+		try:
+			import highspy
+			return True
+		except ImportError:
+			return False
+
+	def solve (self, finalModel: models.FinalModel, verboseToConsole: bool=False) -> models.RunResult:
+		import highspy
+
+		fm = finalModel
+		numVars = len(fm.var_names)
+		inf = highspy.kHighsInf
+
+		with timing.phase('build'):
+			# Rows are stacked GE, LE then EQ, the same order pyomo reports duals in
+			mats = [_asSparse(m, numVars) for m in [fm.ge_mat, fm.le_mat, fm.eq_mat]]
+			A = models.SparseMatrix.vstack(mats)
+			ge_vec, le_vec, eq_vec = [np.asarray(v, dtype=np.float64) for v in [fm.ge_vec, fm.le_vec, fm.eq_vec]]
+
+			lp = highspy.HighsLp()
+			lp.num_col_ = numVars
+			lp.num_row_ = A.shape[0]
+			lp.sense_ = highspy.ObjSense.kMaximize
+			lp.col_cost_ = np.asarray(fm.obj_coeffs, dtype=np.float64)
+			lp.col_lower_ = np.zeros(numVars)
+			lp.col_upper_ = np.full(numVars, inf)
+			lp.row_lower_ = np.concatenate([ge_vec, np.full(len(le_vec), -inf), eq_vec])
+			lp.row_upper_ = np.concatenate([np.full(len(ge_vec), inf), le_vec, eq_vec])
+			lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+			lp.a_matrix_.num_col_ = numVars
+			lp.a_matrix_.num_row_ = A.shape[0]
+			lp.a_matrix_.start_ = A.indptr
+			lp.a_matrix_.index_ = A.indices
+			lp.a_matrix_.value_ = A.data
+
+			h = highspy.Highs()
+			h.setOptionValue('output_flag', verboseToConsole)
+			if self.timeLimit != None:
+				h.setOptionValue('time_limit', float(self.timeLimit))
+			h.passModel(lp)
+
+		_log.debug("Solving a model (highs)")
+		with timing.phase('solve'):
+			h.run()
+		_log.debug("Solved a model (highs)")
+
+		status, termination = _HIGHS_STATUSES.get(
+			h.modelStatusToString(h.getModelStatus()),
+			('error', 'error')
+		)
+
+		names = self._resultNames(fm.constraints)
+
+		if termination != 'optimal':
+			return models.RunResult(
+				status=status, termination=termination, objective_value=None, names=names
+			)
+
+		with timing.phase('extract'):
+			sol = h.getSolution()
+			row_value = np.asarray(sol.row_value)
+			ge_end = len(ge_vec)
+			le_end = ge_end + len(le_vec)
+
+			return models.RunResult(
+				status=status,
+				termination=termination,
+				objective_value=h.getInfo().objective_function_value,
+				names=names,
+				var_values=np.asarray(sol.col_value),
+				reduced_costs=np.asarray(sol.col_dual),
+				duals=np.asarray(sol.row_dual),
+				slack_ge=row_value[:ge_end] - ge_vec,
+				slack_le=le_vec - row_value[ge_end:le_end]
+			)
+
+
+# HiGHS model status -> (pyomo SolverStatus, pyomo TerminationCondition)
+# so highs runs read the same as glpk runs
+_HIGHS_STATUSES = {
+	'Optimal': ('ok', 'optimal'),
+	'Infeasible': ('warning', 'infeasible'),
+	'Unbounded': ('warning', 'unbounded'),
+	'Primal infeasible or unbounded': ('warning', 'infeasibleOrUnbounded'),
+	'Time limit reached': ('aborted', 'maxTimeLimit'),
+	'Iteration limit reached': ('aborted', 'maxIterations'),
+	'Interrupted by user': ('aborted', 'userInterrupt'),
+	'Model empty': ('ok', 'optimal'),
+}
+
+
+SOLVER_BACKENDS = {
+	GlpkBackend.name: GlpkBackend,
+	HighsBackend.name: HighsBackend,
+}
+
+
+def getSolverBackend (name: str, timeLimit: Optional[float]=None) -> SolverBackend:
+	'''
+	Returns a backend by name, see SOLVER_BACKENDS. timeLimit is
+	seconds per solve.
+	'''
+	if name not in SOLVER_BACKENDS:
+		raise ValueError(f"Unknown solver '{name}', expected one of: {', '.join(SOLVER_BACKENDS)}")
+	return SOLVER_BACKENDS[name](timeLimit)
+
+
+
+
+
+
+# =====================================================================================
+#                                 Running Many Models
+# =====================================================================================
+
+
+def solveModels (finalModels: List[models.FinalModel],
+				backendName: str='glpk',
+				numWorkers: int=1,
+				verboseToConsole: bool=False,
+				cancelEvent: Optional[threading.Event]=None,
+				timeLimit: Optional[float]=None,
+				resultCache: Optional[modelcache.ModelCache]=None) -> Iterator[models.RunResult]:
+	'''
+	Solves every model, yielding a RunResult for each in the same order
+	as finalModels. Each result has task_seconds & worker filled in.
+
+	With numWorkers > 1 the models are spread over a pool of processes.
+	Every ConstraintBlock is only sent to each worker once (models from a
+	directory load all share one), after that a model is just its objective.
+	Workers send back RunResults, never pyomo instances.
+
+	Setting cancelEvent (from another thread) stops the run, killing any
+	solve in progress, and the generator ends early. Since only a worker
+	process can be killed mid solve, passing a cancelEvent always solves
+	in a pool, even with one worker.
+
+	timeLimit is in seconds per model, models that hit it come back
+	with a maxTimeLimit termination.
+
+	With a resultCache, models already solved with the same solver
+	settings are read back from it (from_cache = True) and only the
+	rest go to the solver. New results are added to it.
+	'''
+	if resultCache == None:
+		yield from _solveAll(finalModels, backendName, numWorkers, verboseToConsole, cancelEvent, timeLimit)
+		return
+
+	# Find the hits up front so only the misses go to the solver. The
+	# hits themselves are read when it's their turn, so they aren't all
+	# in memory at once
+	blockHashes = {}
+	blockNames = {}
+	keys = []
+	for fm in finalModels:
+		if id(fm.constraints) not in blockHashes:
+			blockHashes[id(fm.constraints)] = modelcache.hashConstraintBlock(fm.constraints)
+			blockNames[id(fm.constraints)] = models.ResultNames.fromBlock(fm.constraints)
+		keys.append(modelcache.makeResultKey(
+			blockHashes[id(fm.constraints)],
+			modelcache.hashObjective(fm.obj_coeffs),
+			backendName,
+			timeLimit
+		))
+
+	isHit = [resultCache.hasResult(k) for k in keys]
+	misses = _solveAll(
+		[fm for fm, hit in zip(finalModels, isHit) if not hit],
+		backendName, numWorkers, verboseToConsole, cancelEvent, timeLimit
+	)
+
+	try:
+		for fm, key, hit in zip(finalModels, keys, isHit):
+			if cancelEvent != None and cancelEvent.is_set():
+				return
+
+			result = None
+			if hit:
+				result = _timedLookup(resultCache, key, blockNames[id(fm.constraints)])
+
+			if result == None:
+				if hit:
+					# Evicted since it was checked, just solve it here
+					result = _timedSolve(getSolverBackend(backendName, timeLimit), fm, verboseToConsole)
+				else:
+					result = next(misses, None)
+					if result == None:
+						return # cancelled
+				resultCache.putResult(key, result)
+
+			yield result
+	finally:
+		misses.close()
+		resultCache.evict()
+
+
+def _solveAll (finalModels: List[models.FinalModel],
+				backendName: str,
+				numWorkers: int,
+				verboseToConsole: bool,
+				cancelEvent: Optional[threading.Event],
+				timeLimit: Optional[float]) -> Iterator[models.RunResult]:
+	'''
+	solveModels(...) without the result cache
+	'''
+	if len(finalModels) == 0:
+		return
+
+	if cancelEvent == None and (numWorkers <= 1 or len(finalModels) <= 1):
+		backend = getSolverBackend(backendName, timeLimit)
+		for fm in finalModels:
+			yield _timedSolve(backend, fm, verboseToConsole)
+		return
+
+	# Deduplicate the constraint blocks
+	blocks = []
+	tasks = []
+	for fm in finalModels:
+		blockInd = next((i for i, b in enumerate(blocks) if b is fm.constraints), None)
+		if blockInd == None:
+			blockInd = len(blocks)
+			blocks.append(fm.constraints)
+		tasks.append((blockInd, fm.obj_coeffs))
+
+	# Results come back without their name table (it would be pickled
+	# with every result), the shared one is put back on here
+	allNames = [models.ResultNames.fromBlock(b) for b in blocks]
+
+	# spawn (instead of fork) so workers never inherit the GUI's tk state
+	ctx = multiprocessing.get_context('spawn')
+	numWorkers = max(1, min(numWorkers, len(finalModels)))
+
+	# Leaving the with block terminates the workers, finished or not, and
+	# _stopWorkers(...) also kills any solver executable they started
+	with ctx.Pool(numWorkers, initializer=_initWorker, initargs=(backendName, timeLimit, blocks, verboseToConsole)) as pool:
+		try:
+			# Only a window of tasks is handed to the pool at a time, so when
+			# the caller (exporting) is slower than solving, finished results
+			# don't pile up here and memory stays flat however many models
+			# there are. Results come back in order.
+			pending: Deque[Tuple[int, multiprocessing.pool.AsyncResult]] = deque()
+			toSubmit = iter(tasks)
+
+			def submitNext ():
+				task = next(toSubmit, None)
+				if task != None:
+					pending.append((task[0], pool.apply_async(_solveInWorker, (task,))))
+
+			for _ in range(numWorkers * _TASKS_PER_WORKER):
+				submitNext()
+
+			while len(pending) > 0:
+				blockInd, asyncResult = pending[0]
+				while True:
+					if cancelEvent != None and cancelEvent.is_set():
+						return
+					try:
+						result = asyncResult.get(timeout=_CANCEL_POLL_SECONDS)
+						break
+					except multiprocessing.TimeoutError:
+						continue
+
+				pending.popleft()
+				submitNext()
+
+				result.names = allNames[blockInd]
+				yield result
+		finally:
+			_stopWorkers(pool)
+
+
+# How often a pooled run checks its cancelEvent
+_CANCEL_POLL_SECONDS = 0.2
+# Tasks given to the pool at once per worker, solving or finished but
+# not yet taken by the caller
+_TASKS_PER_WORKER = 2
+
+
+def _stopWorkers (pool) -> None:
+	'''
+	Terminates the pool's workers along with anything they started.
+	Pool.terminate() only signals the workers themselves, so a glpsol
+	that pyomo started would be orphaned and keep solving. Each worker
+	leads its own process group (see _initWorker), which is killed whole.
+	'''
+	# Pool keeps no public list of its worker processes
+	pids = [p.pid for p in getattr(pool, '_pool', []) if p.pid != None]
+	pool.terminate()
+
+	if not hasattr(os, 'killpg'):
+		return
+
+	for pid in pids:
+		try:
+			os.killpg(pid, signal.SIGKILL)
+		except (ProcessLookupError, PermissionError):
+			pass # nothing left in the group
+
+
+def defaultNumWorkers () -> int:
+	return max(1, (os.cpu_count() or 1) - 1)
+
+
+def _timedLookup (resultCache: modelcache.ModelCache, key: str, names: models.ResultNames) -> Optional[models.RunResult]:
+	start = time.perf_counter()
+	result = resultCache.getResult(key, names)
+	if result == None:
+		return None
+
+	result.task_seconds = time.perf_counter() - start
+	result.worker = os.getpid()
+	result.from_cache = True
+	return result
+
+
+def _timedSolve (backend: SolverBackend, finalModel: models.FinalModel, verboseToConsole: bool) -> models.RunResult:
+	start = time.perf_counter()
+	with timing.recording() as rec:
+		result = backend.solve(finalModel, verboseToConsole)
+	result.task_seconds = time.perf_counter() - start
+	result.worker = os.getpid()
+	result.phase_seconds = rec.seconds
+	result.phase_peak_mib = rec.peakMiB
+	result.peak_mib = rec.peak()
+	return result
+
+
+# Set once per worker process by _initWorker
+_worker_state = {}
+
+def _initWorker (backendName: str, timeLimit: Optional[float], blocks: List[models.ConstraintBlock], verboseToConsole: bool) -> None:
+	# Solvers run as child processes join the worker's own group, so
+	# _stopWorkers(...) can kill them with it
+	if hasattr(os, 'setsid'):
+		os.setsid()
+
+	_worker_state['backend'] = getSolverBackend(backendName, timeLimit)
+	_worker_state['blocks'] = blocks
+	_worker_state['verbose'] = verboseToConsole
+
+
+def _solveInWorker (task) -> models.RunResult:
+	blockInd, obj_coeffs = task
+	fm = models.FinalModel(obj_coeffs=obj_coeffs, constraints=_worker_state['blocks'][blockInd])
+	result = _timedSolve(_worker_state['backend'], fm, _worker_state['verbose'])
+	result.names = None
+	return result
+
+
+
+
+
+
 
 
 
@@ -180,70 +828,155 @@ def getRunSummary (instance: pyo.ConcreteModel, results: opt.SolverResults) -> D
 	}
 
 
-def getVariableValues (instance: pyo.ConcreteModel, hideDummy=True) -> Dict[str, float]:
+def extractRunResult (instance: pyo.ConcreteModel,
+					results: opt.SolverResults,
+					names: Optional[models.ResultNames]=None,
+					constraints: Optional[models.ConstraintBlock]=None) -> models.RunResult:
 	'''
-		Returns a dict of variable names as keys and values as entries
-		{'167N_PLSQ_2021': 34343, ... }
+	Reads everything out of a solved instance into a RunResult, so the
+	instance can be thrown away. Pass names when solving many models on
+	the same constraints so they share one name table, and the block the
+	instance was built from so slacks come from its matrices (see
+	extractSolutionArrays).
+	'''
+	summary = getRunSummary(instance, results)
+
+	if names == None:
+		names = _instanceNames(instance)
+
+	result = models.RunResult(
+		status=summary['status'],
+		termination=summary['termination'],
+		objective_value=summary['objective_value'],
+		names=names
+	)
+
+	if not isModelSolved(results):
+		return result
+
+	arrays = extractSolutionArrays(instance, names, constraints)
+	result.var_values = arrays['var_values']
+	result.reduced_costs = arrays['reduced_costs']
+	result.duals = np.concatenate([arrays['duals_ge'], arrays['duals_le'], arrays['duals_eq']])
+	result.slack_ge = arrays['slack_ge']
+	result.slack_le = arrays['slack_le']
+	return result
 
-		hideDummy = True means it will hide variables with dummy in the name
+
+def extractSolutionArrays (instance: pyo.ConcreteModel,
+						names: models.ResultNames,
+						constraints: Optional[models.ConstraintBlock]=None) -> Dict[str, np.ndarray]:
 	'''
-	decisionVars = instance.x.keys()
-	if hideDummy:
-		decisionVars = filter(lambda s: 'dummy' not in s, decisionVars)
-	
-	return {
-		str(key): pyo.value(instance.x[key]) 
-		for key in decisionVars
+	Reads a solved instance into float64 arrays lined up with names
+		{
+			'var_values': ...,    'reduced_costs': ...,   (per variable)
+			'duals_ge': ...,      'duals_le': ...,        'duals_eq': ...,
+			'slack_ge': ...,      'slack_le': ...
 		}
+	Values the solver didn't report are nan.
 
-
-def getShadowPrices (instance: pyo.ConcreteModel, hideDummy=True) -> Dict[str, float]:
+	Given the ConstraintBlock the instance was built from, slacks are
+	A·x - b (GE) and b - A·x (LE) from its matrices, instead of pyomo
+	evaluating every constraint body. Without one (eg: models loaded
+	from .dat files) they're read from pyomo.
 	'''
-		Returns a dict of {constraint_name: shadow price}
+	xs = [instance.x[v] for v in names.var_names]
+	rc = getattr(instance, 'rc', None)
+	dual = getattr(instance, 'dual', None)
+
+	# np.array turns the Nones (unreported values) into nan
+	var_values = np.array([x.value for x in xs], dtype=np.float64)
+	arrays = {
+		'var_values': var_values,
+		'reduced_costs': np.array([rc.get(x) if rc != None else None for x in xs], dtype=np.float64),
+	}
+
+	byClass = [
+		('ge', instance.GEConstraint, names.ge_const_names),
+		('le', instance.LEConstraint, names.le_const_names),
+		('eq', instance.EQConstraint, names.eq_const_names),
+	]
+	for cls, component, constNames in byClass:
+		arrays[f'duals_{cls}'] = np.array(
+			[dual.get(component[c]) if dual != None else None for c in constNames],
+			dtype=np.float64
+		)
+
+	if constraints != None:
+		numVars = len(xs)
+		ge_vec = np.asarray(constraints.ge_vec, dtype=np.float64)
+		le_vec = np.asarray(constraints.le_vec, dtype=np.float64)
+		arrays['slack_ge'] = _asSparse(constraints.ge_mat, numVars).dot(var_values) - ge_vec
+		arrays['slack_le'] = le_vec - _asSparse(constraints.le_mat, numVars).dot(var_values)
+	else:
+		arrays['slack_ge'] = np.array([instance.GEConstraint[c].lslack() for c in names.ge_const_names], dtype=np.float64)
+		arrays['slack_le'] = np.array([instance.LEConstraint[c].uslack() for c in names.le_const_names], dtype=np.float64)
+
+	return arrays
+
+
+def _instanceNames (instance: pyo.ConcreteModel) -> models.ResultNames:
+	return models.ResultNames.fromNames(
+		[str(k) for k in instance.x.keys()],
+		[str(k) for k in instance.GEConstraint.keys()],
+		[str(k) for k in instance.LEConstraint.keys()],
+		[str(k) for k in instance.EQConstraint.keys()]
+	)
+
+
+#
+# The dicts below are what results used to be stored as, they're
+# kept for scripts. Each takes a RunResult from extractRunResult(...),
+# so reading all four extracts once. Given a solved instance instead,
+# each does its own extractSolutionArrays(...).
 
-		hideDummy = True means it will hide variables with dummy in the name
+def getVariableValues (solved: Union[pyo.ConcreteModel, models.RunResult]) -> Dict[str, float]:
 	'''
-	constNames = instance.dual.keys()
-	if hideDummy:
-		constNames = filter(lambda s: 'dummy' not in str(s), constNames)
+		Returns a dict of variable names as keys and values as entries
+		{'167N_PLSQ_2021': 34343, ... }
+	'''
+	return _asRunResult(solved).varValuesDict()
 
-	return {
-		str(key).split("[")[1][:-1]: instance.dual[key] 
-		for key in constNames
-		}
 
+def getShadowPrices (solved: Union[pyo.ConcreteModel, models.RunResult]) -> Dict[str, float]:
+	'''
+		Returns a dict of {constraint_name: shadow price}
+	'''
+	return _asRunResult(solved).shadowPricesDict()
 
-def getSlackGE (instance: pyo.ConcreteModel, hideDummy=True) -> Dict[str, float]:
+
+def getSlackGE (solved: Union[pyo.ConcreteModel, models.RunResult]) -> Dict[str, float]:
 	'''
 		Returns a dict of {GEConstraintName: slack amount}
-
-		hideDummy = True means it will hide variables with dummy in the name
 	'''
-	geConstNames = instance.GEConstraint.keys()
-	if hideDummy:
-		geConstNames = filter(lambda s: 'dummy' not in s, geConstNames)
-	
-	return {
-		str(key): instance.GEConstraint[key].lslack() 
-		for key in geConstNames
-		}
+	return _asRunResult(solved).slackGEDict()
 
 
-def getSlackLE (instance: pyo.ConcreteModel, hideDummy=True) -> Dict[str, float]:
+def getSlackLE (solved: Union[pyo.ConcreteModel, models.RunResult]) -> Dict[str, float]:
 	'''
 		Returns a dict of {LEConstraintName: slack amount}
+	'''
+	return _asRunResult(solved).slackLEDict()
+
 
-		hideDummy = True means it will hide variables with dummy in the name
+def _asRunResult (solved: Union[pyo.ConcreteModel, models.RunResult]) -> models.RunResult:
 	'''
-	leConstNames = instance.LEConstraint.keys()
-	if hideDummy:
-		leConstNames = filter(lambda s: 'dummy' not in s, leConstNames)
-	
-	return {
-		str(key): instance.LEConstraint[key].uslack() 
-		for key in leConstNames
-		}
+	The arrays of a solved instance, without the solver's status (which
+	the instance doesn't keep)
+	'''
+	if isinstance(solved, models.RunResult):
+		return solved
 
+	names = _instanceNames(solved)
+	arrays = extractSolutionArrays(solved, names)
+	return models.RunResult(
+		status='', termination='', objective_value=None, names=names,
+		var_values=arrays['var_values'],
+		reduced_costs=arrays['reduced_costs'],
+		duals=np.concatenate([arrays['duals_ge'], arrays['duals_le'], arrays['duals_eq']]),
+		slack_ge=arrays['slack_ge'],
+		slack_le=arrays['slack_le']
+	)
 
 
 
@@ -252,7 +985,7 @@ if __name__ == '__main__':
 	filepath = '/home/velcro/Documents/Professional/NJDEP/TechWork/ForMOM-Runner/sample-data/SLmonthly1_out.dat'
 	instance = loadPyomoModelFromDat(filepath)
 	instance, res = solveConcreteModel(instance)
-	resStr = text.exportRunText(instance, res)
+	resStr = text.exportRunText(extractRunResult(instance, res))
 
 	print(resStr)
 
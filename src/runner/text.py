@@ -11,13 +11,12 @@ Ideally the text constants would be in a .toml or .json but I didn't want to dea
 with reading a file from within the .pyz. If we ever need translations this is 
 still a good start.
 '''
-import pyomo.environ as pyo
-import pyomo.opt as opt
+import io
 import time
-from typing import List, Optional, Set
+from typing import Dict, List, Optional, Set, TextIO
 
 import runner.model_data_classes as models
-import runner.pyomo_runner as pyomo_runner
+import runner.timing as timing
 
 
 # The string displayed when the program boots
@@ -128,10 +127,10 @@ def statusLoadMany (errFiles: List[str],
 	return rStr
 
 
-def statusLoadSingle (objData: models.InputObjectiveData, messages: Optional[List[str]]) -> str:
+def statusLoadSingle (finalModel: models.FinalModel, messages: Optional[List[str]]) -> str:
 	rStr = ''
 
-	if objData == None:
+	if finalModel == None:
 		rStr = "XXXXXX\n[[ Errors Occured - Unable to Convert ]]\n" + \
 			   "\n\n[[ Error ]]\n".join([''] + messages)
 	else:
@@ -142,47 +141,156 @@ def statusLoadSingle (objData: models.InputObjectiveData, messages: Optional[Lis
 	return rStr
 
 
-def statusRunMany (names: List[str], results: List[opt.SolverResults]) -> str:
+def statusRunMany (names: List[str], results: List[models.RunResult], wallSeconds: Optional[float]=None) -> str:
 	'''
 	The string to show after running many models
 	'''
 	# First sort by successful vs unsuccessful
 	succ_names = []
-	succ_terms = []
+	succ_results = []
 	fail_names = []
-	fail_terms = []
+	fail_results = []
 
 	for name, res in zip(names, results):
-		termination = res.solver.termination_condition
-
-		if pyomo_runner.isModelSolved(res):
+		if res.isOptimal():
 			succ_names.append(name)
-			succ_terms.append(termination)
+			succ_results.append(res)
 		else:
 			fail_names.append(name)
-			fail_terms.append(termination)
+			fail_results.append(res)
 	
 	# Now build the string
 	rStr = 'Note: Failed runs do not get exported\n\n'
 
 	rStr += " === Successful Runs ===\n"
-	for name, term in zip(succ_names, succ_terms):
-		rStr += f"{name}  |  {term}\n"
+	for name, res in zip(succ_names, succ_results):
+		rStr += statusRunLine(name, res)
 	rStr += "\n" * 3
 
 	rStr += " === Failed Runs ===\n"
-	for name, term in zip(fail_names, fail_terms):
-		rStr += f"{name}  |  {term}\n"
+	for name, res in zip(fail_names, fail_results):
+		rStr += statusRunLine(name, res)
+
+	rStr += "\n" * 3
+	rStr += statusTiming(results, wallSeconds)
 
 	return rStr
 
 
-def statusRunSingle (instance: pyo.ConcreteModel, results: opt.SolverResults) -> str:
+def statusRunSingle (result: models.RunResult) -> str:
 	'''
 	The string to show after running a single model
 	'''
 	return " == Ran Single Model ==\n\n" + \
-		exportRunText(instance, results)
+		exportRunText(result)
+
+
+def statusRunStarted (numModels: int, numWorkers: int) -> str:
+	return f"Running {numModels} model(s) on {numWorkers} solver process(es)\n\n"
+
+
+def statusRunLine (name: str, result: models.RunResult) -> str:
+	'''
+	One line per finished run, added to the status box as runs finish
+	'''
+	return f"{name}  |  {result.termination}{_secondsStr(result)}\n"
+
+
+def statusRunCancelled (numDone: int, numTotal: int) -> str:
+	return "[[ Cancelled ]]\n" + \
+		f"Stopped after {numDone} of {numTotal} models.\n" + \
+		"Results of a cancelled run are not kept, run again to save output."
+
+
+def statusBackgroundError (tracebackStr: str) -> str:
+	return "XXXXXX\n[[ Something went wrong ]]\n\n" + tracebackStr
+
+
+def guiRunProgress (numDone: int, numTotal: int, currentName: Optional[str], elapsed: float) -> str:
+	'''
+	The label under the progress bar while a run is going
+	'''
+	rStr = f"{numDone} / {numTotal} done  |  {_durationStr(elapsed)} elapsed"
+
+	if numDone > 0 and numDone < numTotal:
+		eta = elapsed / numDone * (numTotal - numDone)
+		rStr += f"  |  ~{_durationStr(eta)} left"
+
+	if currentName != None:
+		rStr += f"\nSolving {currentName}"
+
+	return rStr
+
+
+def _durationStr (seconds: float) -> str:
+	minutes, seconds = divmod(int(seconds), 60)
+	if minutes == 0:
+		return f"{seconds}s"
+	return f"{minutes}m {str(seconds).zfill(2)}s"
+
+
+def statusTiming (results: List[models.RunResult], wallSeconds: Optional[float]=None) -> str:
+	'''
+	Per worker process solve times, to check the work was spread out,
+	and how many results came from the result cache
+	'''
+	perWorker: Dict[int, List[float]] = {}
+	for res in results:
+		if res.task_seconds != None and not res.from_cache:
+			perWorker.setdefault(res.worker, []).append(res.task_seconds)
+
+	numHits = sum(1 for res in results if res.from_cache)
+
+	if len(perWorker) == 0 and numHits == 0:
+		return ''
+
+	rStr = " === Timing ===\n"
+	if wallSeconds != None:
+		rStr += f"Wall time: {wallSeconds:.2f}s\n"
+	rStr += f"Result cache: {numHits} hits, {len(results) - numHits} misses (solved)\n"
+
+	# Nothing was solved when every run came from the cache
+	if len(perWorker) > 0:
+		rStr += f"Total task time: {sum(sum(t) for t in perWorker.values()):.2f}s\n"
+		rStr += f"Workers: {len(perWorker)}\n"
+
+		for i, times in enumerate(perWorker.values()):
+			rStr += f" - worker {i + 1}: {len(times)} models in {sum(times):.2f}s\n"
+
+	# Summed over every run
+	totals = timing.PhaseRecorder()
+	for res in results:
+		for name, seconds in (res.phase_seconds or {}).items():
+			totals.add(name, seconds, (res.phase_peak_mib or {}).get(name))
+
+	if len(totals.seconds) > 0:
+		rStr += "\n" + statusPhases(totals, "Run Phases (all runs)")
+
+	return rStr
+
+
+def statusPhases (recorder: timing.PhaseRecorder, title: str='Phases') -> str:
+	'''
+	One line per phase with its wall time & peak memory
+	'''
+	if len(recorder.seconds) == 0:
+		return ''
+
+	rStr = f" === {title} ===\n"
+	for name, seconds in recorder.seconds.items():
+		peak = recorder.peakMiB.get(name)
+		peakStr = f"  |  peak {peak:.0f} MiB" if peak != None else ''
+		rStr += f"{name:10} {seconds:8.2f}s{peakStr}\n"
+
+	return rStr
+
+
+def _secondsStr (result: models.RunResult) -> str:
+	if result.from_cache:
+		return "  |  cached"
+	if result.task_seconds == None:
+		return ''
+	return f"  |  {result.task_seconds:.2f}s"
 
 
 def statusSaveMany (outdir: str, numWritten: int) -> str:
@@ -216,89 +324,98 @@ def guiLoadedModelsSummary (loadedModels: List[models.FinalModel]) -> str:
 
 
 
-def exportSummaryText (names: List[str], instances: List[pyo.ConcreteModel], results: List[opt.SolverResults]) -> str:
+def exportSummaryText (names: List[str], results: List[models.RunResult]) -> str:
+	buf = io.StringIO()
+	writeSummaryText(buf, names, results)
+	return buf.getvalue()
+
+
+def writeSummaryText (f: TextIO, names: List[str], results: List[models.RunResult]):
+	'''
+	Writes the same text as exportSummaryText(...) to an open file,
+	a row at a time
+	'''
 	# First, extract data to parallel lists
 	all_runs_info = []
-	for inst, res in zip(instances, results):
-		all_runs_info.append(pyomo_runner.getRunSummary(inst, res))
-	
+	for res in results:
+		times = {k: (round(v, 3) if v != None else None) for k, v in res.timingSummary().items()}
+		all_runs_info.append({**res.summary(), **times})
+
 	# For each key in the summary results, get the max length
 	max_lens = {}
 	fields = list(all_runs_info[0].keys())
 	for k in fields:
-		max_lens[k] = max(len(str(run[k])) for run in all_runs_info) + 4
+		max_lens[k] = max([len(k)] + [len(str(run[k])) for run in all_runs_info]) + 4
 	max_name_len = max(len(n) for n in names) + 4
 
-	# Now build the string
-	rStr = ''
-
 	# Header
 	BASE_STR = '{0:{1}} | '
-	rStr += BASE_STR.format('Name', max_name_len)
-	for k in fields:
-		rStr += BASE_STR.format(k, max_lens[k])
-	rStr += "\n"
-	rStr += "-" * len(rStr)
-	rStr += "\n"
-	
+	header = BASE_STR.format('Name', max_name_len) + ''.join(BASE_STR.format(k, max_lens[k]) for k in fields)
+	f.write(header + "\n")
+	f.write("-" * (len(header) + 1) + "\n")
+
 	# Data
 	for name, info in zip(names, all_runs_info):
-		rStr += BASE_STR.format(name, max_name_len)
-		for k in fields:
-			rStr += BASE_STR.format(str(info[k]), max_lens[k])
+		row = BASE_STR.format(name, max_name_len) + ''.join(BASE_STR.format(str(info[k]), max_lens[k]) for k in fields)
+		f.write(row + "\n")
 
-	return rStr
 
 
 
+def exportRunText (result: models.RunResult) -> str:
+	buf = io.StringIO()
+	writeRunText(buf, result)
+	return buf.getvalue()
 
-def exportRunText (instance: pyo.ConcreteModel, results: opt.SolverResults) -> str:
-	rstr = ''
 
+def writeRunText (f: TextIO, result: models.RunResult):
+	'''
+	Writes the same text as exportRunText(...) to an open file, a section
+	(and within sections, TEXT_CHUNK_LINES lines) at a time, so the whole
+	report is never held in memory
+	'''
 	# Check status of model
-	status = results.solver.status
-	termination_cond = results.solver.termination_condition
+	status = result.status
+	termination_cond = result.termination
 
 	# List of possible status & term conditions
 	# https://github.com/Pyomo/pyomo/blob/main/pyomo/opt/results/solver.py
 
-	rstr += f"Solve attempted\n"
-	rstr += f"Status: {status}\n"
-	rstr += f"Termination Condition: {termination_cond}\n"
-	rstr += "\n" * 5
-
-	if (termination_cond != pyo.TerminationCondition.optimal):
-		rstr += " [[ ERROR ]]: Solve ended without optimal solution\n"
-		rstr += "\taborting"
-		return rstr
-
+	f.write(f"Solve attempted\n")
+	f.write(f"Status: {status}\n")
+	f.write(f"Termination Condition: {termination_cond}\n")
+	f.write("\n" * 5)
 
-	# Get values
-	decvars_values = pyomo_runner.getVariableValues(instance)
-	shadow_prices = pyomo_runner.getShadowPrices(instance)
-	ge_slack = pyomo_runner.getSlackGE(instance)
-	le_slack = pyomo_runner.getSlackLE(instance)
+	if not result.isOptimal():
+		f.write(" [[ ERROR ]]: Solve ended without optimal solution\n")
+		f.write("\taborting")
+		return
 
-	decvar_keys = sorted(list(decvars_values.keys()))
-	shadow_keys = sorted(list(shadow_prices.keys()))
-	ge_keys = sorted(list(ge_slack.keys()))
-	le_keys = sorted(list(le_slack.keys()))
+	# Now actual output
+	f.write("\n\n == Variables\n")
+	_writeSortedLines(f, "%-20s | %s", result.varValuesDict())
 
+	f.write("\n\n == Shadow Prices\n")
+	_writeSortedLines(f, "%-40s | %s", result.shadowPricesDict())
 
-	# Now actual output
-	rstr += "\n\n == Variables\n"
-	rstr += "\n".join(["%-20s | %s" % (k, decvars_values[k]) for k in decvar_keys])
+	f.write("\n\n == Slacks for GE\n")
+	_writeSortedLines(f, "%-40s | %s", result.slackGEDict())
 
-	rstr += "\n\n == Shadow Prices\n"
-	rstr += "\n".join(["%-40s | %s" % (k, shadow_prices[k]) for k in shadow_keys])
+	f.write("\n\n == Slacks for LE\n")
+	_writeSortedLines(f, "%-40s | %s", result.slackLEDict())
 
-	rstr += "\n\n == Slacks for GE\n"
-	rstr += "\n".join(["%-40s | %s" % (k, ge_slack[k]) for k in ge_keys])
 
-	rstr += "\n\n == Slacks for LE\n"
-	rstr += "\n".join(["%-40s | %s" % (k, le_slack[k]) for k in le_keys])
+TEXT_CHUNK_LINES = 4096
 
-	return rstr
+def _writeSortedLines (f: TextIO, lineFormat: str, values: Dict[str, float]):
+	'''
+	Writes "name | value" lines sorted by name, joined by newlines
+	(none after the last one)
+	'''
+	keys = sorted(values.keys())
+	for start in range(0, len(keys), TEXT_CHUNK_LINES):
+		chunk = "\n".join([lineFormat % (k, values[k]) for k in keys[start:start + TEXT_CHUNK_LINES]])
+		f.write(chunk if start == 0 else "\n" + chunk)
 
 
 
@@ -306,5 +423,6 @@ def exportRunText (instance: pyo.ConcreteModel, results: opt.SolverResults) -> s
 
 
 
-# Everything in this file should be of string return type
+# Everything in this file should be of string return type, except the
+# write*Text(...) functions which write those same strings to a file
 
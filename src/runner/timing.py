@@ -0,0 +1,192 @@
+'''
+Timing
+
+Lightweight per phase instrumentation. Code marks its phases with
+
+    with timing.phase('lint'):
+        ...
+
+and whoever wants the numbers wraps the work in a recorder
+
+    with timing.recording() as rec:
+        loadTheModels()
+    rec.seconds  # {'read_csv': 0.8, 'lint': 0.2, ...}
+
+Each phase records wall time (summed if the phase runs more than once)
+and the peak memory (MiB) the process reached while it ran, the largest
+if it ran more than once. With no recorder active phase() does nothing,
+and with one it's a couple of clock reads and two small /proc file
+accesses, so it's left on everywhere.
+
+Peak memory is the resident set high-water mark, which Linux lets us
+reset at the start of each phase (/proc/self/clear_refs), so it covers
+native memory (numpy, HiGHS) too. Enclosing phases are handed the peak
+reached so far before it's reset. Elsewhere it's tracemalloc's peak if
+tracing was turned on (PYTHONTRACEMALLOC=1) and the peak can be reset
+(Python 3.9+), otherwise None. The mark
+is per process, so phases running at the same time on other threads
+share it. Solver subprocesses (glpsol) aren't included.
+
+Recorders are per thread (contextvars), so the gui's background work
+and solver worker processes each only see their own phases.
+'''
+
+import contextlib
+import contextvars
+import sys
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# Phases of a single run, in the order they happen. Load phases
+# (read_csv, lint, convert, cache) are per batch instead.
+RUN_PHASES = ['build', 'solve', 'extract', 'export']
+
+
+class PhaseRecorder:
+	'''
+	Wall seconds & peak memory (MiB) per phase name
+	'''
+
+	def __init__ (self):
+		self.seconds: Dict[str, float] = {}
+		self.peakMiB: Dict[str, Optional[float]] = {}
+
+	def add (self, name: str, seconds: float, peakMiB: Optional[float]) -> None:
+		self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+		if peakMiB != None:
+			self.peakMiB[name] = max(peakMiB, self.peakMiB.get(name) or 0.0)
+
+	def peak (self) -> Optional[float]:
+		'''
+		The largest peak of any phase, None if none were measured
+		'''
+		return max(self.peakMiB.values(), default=None)
+
+	def merge (self, other: 'PhaseRecorder') -> None:
+		for name, seconds in other.seconds.items():
+			self.add(name, seconds, other.peakMiB.get(name))
+
+	def asDict (self) -> Dict[str, Dict[str, Optional[float]]]:
+		'''
+		{'lint': {'seconds': 0.2, 'peak_mib': 120.5}, ...} for json reports
+		'''
+		return {
+			name: {'seconds': seconds, 'peak_mib': self.peakMiB.get(name)}
+			for name, seconds in self.seconds.items()
+		}
+
+
+_current: contextvars.ContextVar = contextvars.ContextVar('phase_recorder', default=None)
+
+# Peak so far of each phase enclosing the current one, outermost first
+_enclosing: contextvars.ContextVar = contextvars.ContextVar('enclosing_phases', default=())
+
+
+@contextlib.contextmanager
+def recording (recorder: Optional[PhaseRecorder]=None) -> Iterator[PhaseRecorder]:
+	'''
+	Makes recorder (or a new one) collect every phase() within the block
+	'''
+	recorder = recorder if recorder != None else PhaseRecorder()
+	token = _current.set(recorder)
+	try:
+		yield recorder
+	finally:
+		_current.reset(token)
+
+
+@contextlib.contextmanager
+def phase (name: str) -> Iterator[None]:
+	recorder = _current.get()
+	if recorder == None:
+		yield
+		return
+
+	# The mark is about to be reset, so the enclosing phase keeps what it had
+	enclosing: Tuple[List[Optional[float]], ...] = _enclosing.get()
+	if len(enclosing) > 0:
+		enclosing[-1][0] = _maxOrNone(enclosing[-1][0], _readPeakMiB())
+	_resetPeak()
+
+	mine: List[Optional[float]] = [None]
+	token = _enclosing.set(enclosing + (mine,))
+	start = time.perf_counter()
+	try:
+		yield
+	finally:
+		seconds = time.perf_counter() - start
+		_enclosing.reset(token)
+		mine[0] = _maxOrNone(mine[0], _readPeakMiB())
+		recorder.add(name, seconds, mine[0])
+
+
+def residentMemoryMiB () -> Optional[float]:
+	'''
+	Memory this process is using right now, None where unsupported
+	'''
+	return _readStatusMiB('VmRSS:')
+
+
+def _readPeakMiB () -> Optional[float]:
+	'''
+	Peak memory since the last _resetPeak()
+	'''
+	if _peakSource == 'hwm':
+		return _readStatusMiB('VmHWM:')
+	if _canResetTracemalloc():
+		return tracemalloc.get_traced_memory()[1] / 2**20
+	return None
+
+
+def _resetPeak () -> None:
+	global _peakSource
+
+	if _peakSource == 'hwm':
+		try:
+			with open('/proc/self/clear_refs', 'w') as f:
+				f.write('5')
+			return
+		except OSError:
+			# Not allowed here (old kernel, locked down container)
+			_peakSource = 'tracemalloc'
+
+	if _canResetTracemalloc():
+		tracemalloc.reset_peak()
+
+
+def _canResetTracemalloc () -> bool:
+	'''
+	Without reset_peak (Python 3.8) the traced peak is the lifetime one,
+	which says nothing about a phase, so it isn't reported at all
+	'''
+	return tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak')
+
+
+def _readStatusMiB (field: str) -> Optional[float]:
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith(field):
+					return int(line.split()[1]) / 2**10 # KiB
+	except OSError:
+		pass
+	return None
+
+
+def _maxOrNone (a: Optional[float], b: Optional[float]) -> Optional[float]:
+	if a == None or b == None:
+		return b if a == None else a
+	return max(a, b)
+
+
+# 'hwm' (Linux resident high-water mark) or 'tracemalloc'
+_peakSource = 'hwm' if sys.platform.startswith('linux') else 'tracemalloc'
+
+
+
+
+if __name__ == '__main__':
+	print("This file is not meant to be run")
+	sys.exit(1)
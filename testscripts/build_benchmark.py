@@ -0,0 +1,140 @@
+'''
+Build Benchmark
+
+Compares the two ways of turning a FinalModel into a pyomo instance
+ - FinalModel -> convertFinalModelToDataDict -> AbstractModel.create_instance
+ - FinalModel -> pyomo_runner.buildConcreteModel
+
+on a randomly generated sparse model, reporting build time and peak
+python memory (tracemalloc) of each.
+
+With --objectives N it also compares the model construction cost of a
+many objective run, rebuilding for every objective vs building one
+sweep model (pyomo_runner.buildSweepModel) and swapping objectives.
+
+Example:
+  $ python3 testscripts/build_benchmark.py --vars 2000 --consts 500
+'''
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import runner.converter as converter
+import runner.model_data_classes as models
+import runner.pyomo_runner as pyomo_runner
+
+
+def makeRandomModel (numVars: int, numConsts: int, density: float, seed: int=0) -> models.FinalModel:
+	rng = np.random.default_rng(seed)
+	var_names = [f'{100 + v // 20}N_{2021 + (v // 4) % 5 * 5}_RX{v % 4}' for v in range(numVars)]
+	const_names = [f'const_{c}' for c in range(numConsts)]
+
+	row_cols = []
+	row_vals = []
+	for _ in range(numConsts):
+		nnz = max(1, rng.binomial(numVars, density))
+		cols = np.sort(rng.choice(numVars, size=nnz, replace=False))
+		row_cols.append(cols)
+		row_vals.append(rng.uniform(1, 100, size=nnz))
+
+	ops = ['le', 'ge', 'eq']
+	constData = models.InputConstraintData(
+		var_names=var_names,
+		const_names=const_names,
+		vec_const_bounds=rng.uniform(100, 10000, size=numConsts),
+		vec_operators=[ops[c % 3] for c in range(numConsts)],
+		mat_constraint_coeffs=models.SparseMatrix.fromRows(row_cols, row_vals, numVars)
+	)
+	objData = models.InputObjectiveData(
+		var_names=list(var_names),
+		obj_coeffs=rng.uniform(0, 50, size=numVars).tolist()
+	)
+
+	objData, constData, messages = converter.lintInputData(objData, constData)
+	assert(objData != None), messages
+	return converter.convertInputToFinalModel(objData, constData)
+
+
+def measure (func):
+	'''
+	Returns (seconds, peak MiB, result) of calling func
+	'''
+	gc.collect()
+	tracemalloc.start()
+	start = time.perf_counter()
+	result = func()
+	elapsed = time.perf_counter() - start
+	_, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	return elapsed, peak / 2**20, result
+
+
+def viaDataDict (fm: models.FinalModel):
+	datadict = converter.convertFinalModelToDataDict(fm)
+	return pyomo_runner.loadPyomoModelFromDataDict(datadict)
+
+
+def makeObjectiveVariants (fm: models.FinalModel, numObjectives: int, seed: int=1):
+	rng = np.random.default_rng(seed)
+	return [
+		models.FinalModel(
+			obj_coeffs=rng.uniform(0, 50, size=len(fm.var_names)).tolist(),
+			constraints=fm.constraints
+		)
+		for _ in range(numObjectives)
+	]
+
+
+def rebuildEach (fms):
+	for fm in fms:
+		pyomo_runner.buildConcreteModel(fm)
+
+
+def sweep (fms):
+	instance = pyomo_runner.buildSweepModel(fms[0].constraints)
+	for fm in fms:
+		pyomo_runner.setSweepObjective(instance, fm)
+
+
+def main ():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--vars', type=int, default=1000)
+	parser.add_argument('--consts', type=int, default=300)
+	parser.add_argument('--density', type=float, default=0.02)
+	parser.add_argument('--objectives', type=int, default=0)
+	args = parser.parse_args()
+
+	fm = makeRandomModel(args.vars, args.consts, args.density)
+	nnz = sum(len(m.data) for m in [fm.le_mat, fm.ge_mat, fm.eq_mat])
+	print(f'{args.vars} vars, {args.consts} constraints, {nnz} nonzeros')
+	print()
+
+	rows = [
+		('datadict + AbstractModel', lambda: viaDataDict(fm)),
+		('buildConcreteModel', lambda: pyomo_runner.buildConcreteModel(fm)),
+	]
+
+	if args.objectives > 0:
+		fms = makeObjectiveVariants(fm, args.objectives)
+		rows += [
+			(f'rebuild x{args.objectives}', lambda: rebuildEach(fms)),
+			(f'sweep x{args.objectives}', lambda: sweep(fms)),
+		]
+
+	print(f'{"path":30} | {"seconds":>10} | {"peak MiB":>10}')
+	print('-' * 57)
+	for name, func in rows:
+		elapsed, peak, _ = measure(func)
+		print(f'{name:30} | {elapsed:10.3f} | {peak:10.1f}')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,110 @@
+'''
+Load Benchmark
+
+Times the name heavy parts of loading against the number of variables,
+to check they stay linear (fitted exponent near 1)
+ - checkVarNameList       repeated / blank variable name check
+ - fillInEmptyNames       naming unnamed constraints (1% unnamed)
+ - convertToFinalModel    lining objective coefficients up with the block
+ - full load              lintAndConvertManyFromFilepaths on a generated
+                          triplet model with only Acres rows, so the
+                          file sizes themselves grow linearly
+
+Example:
+  $ python3 testscripts/load_benchmark.py --vars 10000 20000 40000 80000
+'''
+
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import runner.converter as converter
+import runner.model_data_classes as models
+
+import scaling_benchmark
+
+
+def timeIt (func, repeats: int=3) -> float:
+	'''
+	Best wall seconds of a few calls
+	'''
+	best = None
+	for _ in range(repeats):
+		start = time.perf_counter()
+		func()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best == None else min(best, elapsed)
+	return best
+
+
+def measureSize (numVars: int, folder: pathlib.Path) -> dict:
+	var_names = scaling_benchmark.makeVarNames(numVars)
+	rng = np.random.default_rng(0)
+
+	const_names = [f'const_{i}' for i in range(numVars)]
+	for i in rng.choice(numVars, size=max(1, numVars // 100), replace=False):
+		const_names[i] = ''
+
+	# Objective files list their variables in any order
+	shuffled = rng.permutation(numVars)
+	objData = models.InputObjectiveData(
+		var_names=[var_names[i] for i in shuffled],
+		obj_coeffs=rng.uniform(0, 50, size=numVars).tolist()
+	)
+	block = models.ConstraintBlock(
+		var_names=tuple(var_names),
+		le_const_names=(), ge_const_names=(), eq_const_names=(),
+		le_vec=[], ge_vec=[], eq_vec=[],
+		le_mat=[], ge_mat=[], eq_mat=[]
+	)
+
+	constPath, objPaths = scaling_benchmark.writeForestModel(folder, numVars, 0, 0.0, 1, triplets=True)
+
+	def fullLoad ():
+		loaded = converter.lintAndConvertManyFromFilepaths(objPaths, str(constPath))
+		assert(loaded[0][0] != None), loaded[0][1]
+
+	return {
+		'vars': numVars,
+		'checkVarNameList': timeIt(lambda: converter.checkVarNameList(var_names)),
+		'fillInEmptyNames': timeIt(lambda: converter.fillInEmptyNames(const_names, 'unnamedConst')),
+		'convertToFinalModel': timeIt(lambda: converter.convertToFinalModel(objData, block)),
+		'full load': timeIt(fullLoad, repeats=1),
+	}
+
+
+def main ():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--vars', type=int, nargs='+', default=[10000, 20000, 40000, 80000])
+	args = parser.parse_args()
+
+	rows = []
+	with tempfile.TemporaryDirectory(prefix='formom-load-') as tmp:
+		for numVars in sorted(args.vars):
+			rows.append(measureSize(numVars, pathlib.Path(tmp).joinpath(str(numVars))))
+
+	cols = [c for c in rows[0].keys() if c != 'vars']
+	print(f'{"vars":>10} | ' + ' | '.join(f'{c:>19}' for c in cols))
+	print('-' * (13 + 22 * len(cols)))
+	for row in rows:
+		print(f'{row["vars"]:>10} | ' + ' | '.join(f'{row[c]:>19.4f}' for c in cols))
+
+	print()
+	print('Fitted seconds ~= c * vars^k')
+	for c in cols:
+		fit = scaling_benchmark.fitPowerLaw([r['vars'] for r in rows], [r[c] for r in rows])
+		if fit == None:
+			print(f'  {c:20} -')
+		else:
+			print(f'  {c:20} k = {fit["k"]:.2f}  (R^2 {fit["r2"]:.3f})')
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,439 @@
+'''
+Scaling Benchmark
+
+Generates synthetic forest models in the ForMOM csv format, at several
+sizes, and times every stage of loading & running them
+ - read_csv, lint, convert    (converter, once per constraint file)
+ - build, solve, extract      (pyomo_runner, summed over the objectives)
+ - export                     (export, summed over the objectives)
+
+Each size runs in a fresh process, so its peak memory isn't hidden by
+a bigger size before it. The results table and a log-log fit of every
+stage (seconds ~= c * vars^k) are printed and written to --out as
+scaling_results.csv & scaling_results.json.
+
+Passing an earlier scaling_results.json as --baseline compares against
+it, and exits with 1 if any stage got more than --tolerance times slower.
+
+The generated models look like the real ones: variables are
+stand_year_prescription (167N_2030_STQO), every stand & year has an
+eq Acres row over its prescriptions, and the rest of the rows are
+random le/ge rows with --density nonzeros, always feasible & bounded.
+
+Examples:
+  $ python3 testscripts/scaling_benchmark.py --vars 250 500 1000 2000 --solver highs
+  $ python3 testscripts/scaling_benchmark.py --baseline old/scaling_results.json
+  $ python3 testscripts/scaling_benchmark.py --vars 5000 --generate-only bigmodel/
+'''
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import math
+import multiprocessing
+import os
+import pathlib
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import runner.converter as converter
+import runner.export as export
+import runner.pyomo_runner as pyomo_runner
+import runner.timing as timing
+
+
+LOAD_STAGES = ['read_csv', 'lint', 'convert']
+STAGES = LOAD_STAGES + timing.RUN_PHASES
+
+YEARS = [2021, 2025, 2030, 2040, 2050]
+PRESCRIPTIONS = ['STQO', 'WFNM', 'PLSQ', 'SPWF']
+
+# Stages quicker than this are all noise, never call them regressions
+MIN_REGRESSION_SECONDS = 0.05
+
+
+# =====================================================================================
+#                                  Model Generator
+# =====================================================================================
+
+
+def makeVarNames (numVars: int) -> List[str]:
+	'''
+	stand_year_prescription names, every prescription of a stand & year
+	next to each other: 100N_2021_STQO, 100N_2021_WFNM, ...
+	'''
+	perStand = len(YEARS) * len(PRESCRIPTIONS)
+	names = []
+	for v in range(numVars):
+		s = v // perStand
+		stand = f'{100 + s // 2}{"NS"[s % 2]}'
+		year = YEARS[(v // len(PRESCRIPTIONS)) % len(YEARS)]
+		rx = PRESCRIPTIONS[v % len(PRESCRIPTIONS)]
+		names.append(f'{stand}_{year}_{rx}')
+	return names
+
+
+def writeForestModel (folder: pathlib.Path,
+					numVars: int,
+					numConsts: int,
+					density: float,
+					numObjectives: int,
+					seed: int=0,
+					triplets: bool=False) -> Tuple[pathlib.Path, List[pathlib.Path]]:
+	'''
+	Writes a constraint csv and numObjectives objective csvs into folder.
+	There's always one Acres row per stand & year, so there can be
+	more rows than numConsts asked for. With triplets the constraints
+	are written in the triplet format, with a forest_const_bounds.csv.
+
+	Returns (constraint path, objective paths)
+	'''
+	rng = np.random.default_rng(seed)
+	folder.mkdir(parents=True, exist_ok=True)
+	var_names = makeVarNames(numVars)
+
+	# Acres rows: the prescriptions of a stand & year share its acres
+	groups = [list(range(g, min(g + len(PRESCRIPTIONS), numVars))) for g in range(0, numVars, len(PRESCRIPTIONS))]
+	acres = rng.integers(50000, 300000, size=len(groups))
+
+	# Every acre split evenly over the prescriptions is feasible,
+	# the random rows get right hand sides that keep it that way
+	x0 = np.zeros(numVars)
+	for g, cols in enumerate(groups):
+		x0[cols] = acres[g] / len(cols)
+
+	constPath = folder.joinpath('forest_const.csv')
+	writer = _TripletRowWriter(constPath, var_names) if triplets else _WideRowWriter(constPath, var_names)
+	with writer:
+		for g, cols in enumerate(groups):
+			name = var_names[cols[0]].rsplit('_', 1)[0] + '_Acres'
+			writer.writeRow(name, cols, ['1'] * len(cols), 'eq', str(acres[g]))
+
+		for r in range(max(0, numConsts - len(groups))):
+			nnz = max(1, rng.binomial(numVars, density))
+			cols = np.sort(rng.choice(numVars, size=nnz, replace=False))
+			vals = np.round(rng.uniform(1, 100, size=nnz), 2)
+			atX0 = float(vals @ x0[cols])
+
+			if r % 2 == 0:
+				op, rhs = 'le', math.ceil(atX0 * rng.uniform(1.0, 1.5))
+			else:
+				op, rhs = 'ge', math.floor(atX0 * rng.uniform(0.5, 1.0))
+
+			name = f'carbon_{YEARS[r % len(YEARS)]}_{r}'
+			writer.writeRow(name, cols, [f'{v:g}' for v in vals], op, str(rhs))
+
+	objPaths = []
+	for o in range(numObjectives):
+		objPath = folder.joinpath(f'forest_obj_{o}.csv')
+		coeffs = np.round(rng.uniform(0, 50, size=numVars), 2)
+		with open(objPath, 'w', newline='') as f:
+			f.write('variables,carbon_ac\n')
+			for name, c in zip(var_names, coeffs):
+				f.write(f'{name},{c:g}\n')
+		objPaths.append(objPath)
+
+	return constPath, objPaths
+
+
+class _WideRowWriter:
+	'''
+	Constraint rows in the usual format, a column per variable
+	'''
+
+	def __init__ (self, constPath: pathlib.Path, var_names: List[str]):
+		self.f = open(constPath, 'w', newline='')
+		self.numVars = len(var_names)
+		self.f.write(','.join(['const_name'] + var_names + ['operator', 'rtSide']) + '\n')
+
+	def writeRow (self, name: str, cols, cells: List[str], op: str, rhs: str) -> None:
+		row = ['0'] * self.numVars
+		for c, cell in zip(cols, cells):
+			row[c] = cell
+		self.f.write(','.join([name] + row + [op, rhs]) + '\n')
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *exc):
+		self.f.close()
+
+
+class _TripletRowWriter:
+	'''
+	Constraint rows as triplets plus a bounds file, see converter.TRIPLET_HEADER
+	'''
+
+	def __init__ (self, constPath: pathlib.Path, var_names: List[str]):
+		self.f = open(constPath, 'w', newline='')
+		self.bounds = open(converter.getBoundsFilepath(constPath), 'w', newline='')
+		self.f.write(','.join(converter.TRIPLET_HEADER) + '\n')
+		self.bounds.write('const_name,operator,rtSide\n')
+		self.var_names = var_names
+
+	def writeRow (self, name: str, cols, cells: List[str], op: str, rhs: str) -> None:
+		for c, cell in zip(cols, cells):
+			self.f.write(f'{name},{self.var_names[c]},{cell}\n')
+		self.bounds.write(f'{name},{op},{rhs}\n')
+
+	def __enter__ (self):
+		return self
+
+	def __exit__ (self, *exc):
+		self.f.close()
+		self.bounds.close()
+
+
+# =====================================================================================
+#                                     Measuring
+# =====================================================================================
+
+
+def runScale (constPath: pathlib.Path, objPaths: List[pathlib.Path], solver: str, outFormat: str, outDir: pathlib.Path) -> Dict:
+	'''
+	Loads, solves and exports one generated model, returning its row of
+	the results table. Meant to be run in its own process.
+	'''
+	baseMiB = timing.residentMemoryMiB()
+
+	with timing.recording() as loadPhases:
+		loaded = converter.lintAndConvertManyFromFilepaths(objPaths, str(constPath))
+	for fm, messages in loaded:
+		assert(fm != None), messages
+	finalModels = [fm for fm, _ in loaded]
+
+	outDir.mkdir(parents=True, exist_ok=True)
+	exporter = export.makeRunExporter(str(outDir), outFormat, False)
+	assert(exporter.begin())
+
+	terminations = set()
+	for p, res in zip(objPaths, pyomo_runner.solveModels(finalModels, backendName=solver)):
+		terminations.add(res.termination)
+		with contextlib.redirect_stdout(io.StringIO()):
+			exporter.writeRun(p.name, res)
+	exporter.finish(loadPhases)
+
+	block = finalModels[0].constraints
+	row = {
+		'vars': len(block.var_names),
+		'consts': len(block.le_const_names) + len(block.ge_const_names) + len(block.eq_const_names),
+		'nonzeros': sum(_nonzeros(m) for m in [block.le_mat, block.ge_mat, block.eq_mat]),
+		'objectives': len(finalModels),
+		'termination': '/'.join(sorted(terminations)),
+	}
+	for stage in LOAD_STAGES:
+		row[stage] = loadPhases.seconds.get(stage, 0.0)
+	for stage in timing.RUN_PHASES:
+		row[stage] = sum((s.phase_seconds or {}).get(stage, 0.0) for s in exporter.summaries)
+	row['total'] = sum(row[stage] for stage in STAGES)
+	row['base_mib'] = baseMiB
+	runPeaks = [s.peak_mib for s in exporter.summaries if s.peak_mib != None]
+	row['peak_mib'] = max([p for p in [loadPhases.peak()] + runPeaks if p != None], default=None)
+	# What loading & running added on top of the imports
+	row['run_mib'] = row['peak_mib'] - baseMiB if baseMiB != None and row['peak_mib'] != None else None
+	return row
+
+
+def _nonzeros (mat) -> int:
+	if hasattr(mat, 'data'):
+		return len(mat.data)
+	return int(np.count_nonzero(mat))
+
+
+def runScaleIsolated (*args) -> Dict:
+	'''
+	runScale() in a fresh process, so peak memory is only its own
+	'''
+	ctx = multiprocessing.get_context('spawn')
+	with ctx.Pool(1) as pool:
+		return pool.apply(runScale, args)
+
+
+# =====================================================================================
+#                                  Fits & Reporting
+# =====================================================================================
+
+
+def fitPowerLaw (xs: List[float], ys: List[float]) -> Optional[Dict[str, float]]:
+	'''
+	Least squares fit of log(y) = log(c) + k log(x), so y ~= c * x^k.
+	None with under two usable points.
+	'''
+	pts = [(x, y) for x, y in zip(xs, ys) if x != None and y != None and x > 0 and y > 0]
+	if len(set(x for x, _ in pts)) < 2:
+		return None
+
+	logx = np.log([x for x, _ in pts])
+	logy = np.log([y for _, y in pts])
+	k, logc = np.polyfit(logx, logy, 1)
+
+	residual = logy - (k * logx + logc)
+	total = logy - logy.mean()
+	r2 = 1.0 - (residual @ residual) / (total @ total) if total @ total > 0 else 1.0
+	return {'c': float(math.exp(logc)), 'k': float(k), 'r2': float(r2)}
+
+
+def fitAll (rows: List[Dict]) -> Dict[str, Optional[Dict[str, float]]]:
+	xs = [r['vars'] for r in rows]
+	return {col: fitPowerLaw(xs, [r[col] for r in rows]) for col in STAGES + ['total', 'run_mib']}
+
+
+def compareToBaseline (rows: List[Dict], baseline: Dict, tolerance: float) -> List[str]:
+	'''
+	Returns a message for every stage of every size (matched on vars)
+	which is more than tolerance times slower than the baseline
+	'''
+	baseRows = {r['vars']: r for r in baseline['rows']}
+	regressions = []
+	for row in rows:
+		base = baseRows.get(row['vars'])
+		if base == None:
+			continue
+		for stage in STAGES + ['total']:
+			old, new = base.get(stage), row[stage]
+			if old == None or new - old < MIN_REGRESSION_SECONDS:
+				continue
+			if new > old * tolerance:
+				regressions.append(f"{row['vars']} vars, {stage}: {old:.3f}s -> {new:.3f}s ({new / old:.1f}x)")
+	return regressions
+
+
+def printTable (rows: List[Dict]) -> None:
+	cols = ['vars', 'consts', 'nonzeros'] + STAGES + ['total', 'peak_mib', 'run_mib']
+	widths = [max(10, len(c)) for c in cols]
+	print(' | '.join(f'{c:>{w}}' for c, w in zip(cols, widths)))
+	print('-+-'.join('-' * w for w in widths))
+	for row in rows:
+		cells = []
+		for c, w in zip(cols, widths):
+			v = row[c]
+			if v == None:
+				cells.append(f'{"-":>{w}}')
+			elif isinstance(v, float):
+				cells.append(f'{v:>{w}.3f}')
+			else:
+				cells.append(f'{v:>{w}}')
+		print(' | '.join(cells))
+
+
+def printFits (fits: Dict[str, Optional[Dict[str, float]]]) -> None:
+	print(f'{"stage":10} | {"fit (x = vars)":>26} | {"R^2":>6}')
+	print('-' * 48)
+	for col, fit in fits.items():
+		if fit == None:
+			print(f'{col:10} | {"-":>26} | {"-":>6}')
+		else:
+			print(f'{col:10} | {fit["c"]:>14.3e} * x^{fit["k"]:<6.2f} | {fit["r2"]:6.3f}')
+
+
+def writeResults (outDir: pathlib.Path, settings: Dict, rows: List[Dict], fits: Dict) -> None:
+	outDir.mkdir(parents=True, exist_ok=True)
+
+	with open(outDir.joinpath('scaling_results.csv'), 'w', newline='') as f:
+		writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+		writer.writeheader()
+		writer.writerows(rows)
+
+	with open(outDir.joinpath('scaling_results.json'), 'w') as f:
+		json.dump({'settings': settings, 'rows': rows, 'fits': fits}, f, indent=2)
+
+
+# =====================================================================================
+#                                       Main
+# =====================================================================================
+
+
+def main ():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--vars', type=int, nargs='+', default=[250, 500, 1000, 2000])
+	parser.add_argument('--const-ratio', type=float, default=0.87,
+		help='rows per variable (default: %(default)s, like the MiniModel)')
+	parser.add_argument('--density', type=float, default=0.01,
+		help='fraction of nonzeros in the non Acres rows')
+	parser.add_argument('--objectives', type=int, default=3)
+	parser.add_argument('--seed', type=int, default=0)
+	parser.add_argument('--triplets', action='store_true',
+		help='write the constraints as triplets + a bounds file instead of wide csvs')
+	parser.add_argument('--solver', choices=list(pyomo_runner.SOLVER_BACKENDS), default='glpk')
+	parser.add_argument('--format', choices=export.OUT_TYPES, default='csv')
+	parser.add_argument('--out', type=pathlib.Path, default=pathlib.Path('scaling-results'))
+	parser.add_argument('--data', type=pathlib.Path, default=None,
+		help='keep the generated models here, instead of a temporary folder')
+	parser.add_argument('--generate-only', type=pathlib.Path, default=None, metavar='FOLDER',
+		help='only write the models (one sub folder per size) and exit')
+	parser.add_argument('--baseline', type=pathlib.Path, default=None,
+		help='an earlier scaling_results.json to compare against')
+	parser.add_argument('--tolerance', type=float, default=1.5,
+		help='slowdown over the baseline that counts as a regression (default: %(default)s)')
+	parser.add_argument('--in-process', action='store_true',
+		help="run every size in this process, quicker but peak memory only grows")
+	args = parser.parse_args()
+
+	if args.generate_only != None:
+		for numVars in args.vars:
+			folder = args.generate_only.joinpath(f'forest_{numVars}v')
+			writeForestModel(folder, numVars, round(numVars * args.const_ratio), args.density, args.objectives, args.seed, args.triplets)
+			print(f'Wrote {folder}')
+		return 0
+
+	if not pyomo_runner.getSolverBackend(args.solver).isAvailable():
+		print(f"Solver '{args.solver}' is not available on this machine", file=sys.stderr)
+		return 1
+
+	dataDir = args.data if args.data != None else pathlib.Path(tempfile.mkdtemp(prefix='formom-scaling-'))
+	runScaleFunc = runScale if args.in_process else runScaleIsolated
+
+	rows = []
+	try:
+		for numVars in sorted(args.vars):
+			folder = dataDir.joinpath(f'forest_{numVars}v')
+			start = time.perf_counter()
+			constPath, objPaths = writeForestModel(folder, numVars, round(numVars * args.const_ratio), args.density, args.objectives, args.seed, args.triplets)
+			print(f'{numVars} vars: generated in {time.perf_counter() - start:.2f}s, running...', flush=True)
+
+			rows.append(runScaleFunc(constPath, objPaths, args.solver, args.format, folder.joinpath('output')))
+	finally:
+		if args.data == None:
+			shutil.rmtree(dataDir, ignore_errors=True)
+
+	fits = fitAll(rows)
+	settings = {k: v for k, v in vars(args).items() if k in ['const_ratio', 'density', 'objectives', 'seed', 'triplets', 'solver', 'format']}
+	writeResults(args.out, settings, rows, fits)
+
+	print()
+	printTable(rows)
+	print()
+	printFits(fits)
+	print()
+	print(f'Results written to {args.out}')
+
+	if args.baseline != None:
+		with open(args.baseline) as f:
+			baseline = json.load(f)
+		if baseline.get('settings') != settings:
+			print(f'Warning: baseline was run with different settings {baseline.get("settings")}', file=sys.stderr)
+
+		regressions = compareToBaseline(rows, baseline, args.tolerance)
+		print()
+		if len(regressions) == 0:
+			print(f'No stage is more than {args.tolerance}x slower than {args.baseline}')
+		else:
+			print(f'{len(regressions)} regression(s) against {args.baseline}:')
+			for r in regressions:
+				print(f'  {r}')
+			return 1
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
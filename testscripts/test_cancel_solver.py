@@ -0,0 +1,114 @@
+'''
+Cancel Solver Test
+
+Checks that cancelling a pooled run (the gui's Cancel button) kills the
+solver executable pyomo started, not just the worker processes.
+
+A fake glpsol is put on the PATH that answers --version and otherwise
+sleeps, so a solve never finishes on its own. Linux only, it looks for
+leftover solver processes through /proc.
+
+  $ python3 testscripts/test_cancel_solver.py
+  $ python3 -m pytest testscripts/test_cancel_solver.py
+'''
+
+import os
+import pathlib
+import stat
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import runner.converter as converter
+import runner.pyomo_runner as pyomo_runner
+
+
+SAMPLE_DIR = pathlib.Path(__file__).parent.joinpath('..', 'sample-data')
+MARKER = 'FORMOM_FAKE_GLPSOL=1'
+
+FAKE_GLPSOL = f'''#!/bin/sh
+if [ "$1" = "--version" ]; then
+	echo "GLPSOL: GLPK LP/MIP Solver, v4.65"
+	exit 0
+fi
+export {MARKER}
+sleep 600
+'''
+
+
+def fakeSolverPids () -> list:
+	'''
+	Processes started by the fake glpsol (the script & its sleep)
+	'''
+	pids = []
+	for proc in pathlib.Path('/proc').iterdir():
+		if not proc.name.isdigit():
+			continue
+		try:
+			environ = proc.joinpath('environ').read_bytes()
+		except OSError:
+			continue
+		if MARKER.encode() in environ.split(b'\0'):
+			pids.append(int(proc.name))
+	return pids
+
+
+def waitFor (condition, timeout: float) -> bool:
+	end = time.time() + timeout
+	while time.time() < end:
+		if condition():
+			return True
+		time.sleep(0.1)
+	return condition()
+
+
+def test_cancel_kills_solver ():
+	if not sys.platform.startswith('linux'):
+		print('Skipped, needs /proc')
+		return
+
+	objData, constData, err = converter.lintInputDataFromFilepaths(
+		str(SAMPLE_DIR.joinpath('icecream_obj.csv')),
+		str(SAMPLE_DIR.joinpath('icecream_const.csv'))
+	)
+	assert(objData != None), err
+	finalModel = converter.convertInputToFinalModel(objData, constData)
+
+	with tempfile.TemporaryDirectory(prefix='formom-fakeglpsol-') as tmp:
+		glpsol = pathlib.Path(tmp).joinpath('glpsol')
+		glpsol.write_text(FAKE_GLPSOL)
+		glpsol.chmod(glpsol.stat().st_mode | stat.S_IEXEC)
+
+		oldPath = os.environ['PATH']
+		os.environ['PATH'] = tmp + os.pathsep + oldPath
+		try:
+			cancelEvent = threading.Event()
+			allResults = pyomo_runner.solveModels(
+				[finalModel, finalModel],
+				backendName='glpk',
+				numWorkers=2,
+				cancelEvent=cancelEvent
+			)
+			results = []
+			consumer = threading.Thread(target=lambda: results.extend(allResults))
+			consumer.start()
+
+			assert(waitFor(lambda: len(fakeSolverPids()) > 0, timeout=60)), 'the fake solver never started'
+
+			cancelEvent.set()
+			consumer.join(timeout=10)
+			assert(not consumer.is_alive()), 'cancelling did not stop the run'
+			assert(len(results) == 0)
+
+			left = fakeSolverPids() if not waitFor(lambda: len(fakeSolverPids()) == 0, timeout=5) else []
+			assert(len(left) == 0), f'solver processes left running: {left}'
+		finally:
+			os.environ['PATH'] = oldPath
+
+
+if __name__ == '__main__':
+	test_cancel_kills_solver()
+	print('Passed')
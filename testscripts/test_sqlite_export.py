@@ -0,0 +1,87 @@
+'''
+SQLite Export Test
+
+Checks the sqlite output type appends across sessions, and that a
+constraint whose operator changed between sessions gets its own row
+instead of silently keeping the old kind.
+
+  $ python3 testscripts/test_sqlite_export.py
+  $ python3 -m pytest testscripts/test_sqlite_export.py
+'''
+
+import contextlib
+import io
+import os
+import pathlib
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import runner.export as export
+import runner.model_data_classes as models
+
+
+def makeResult (ge: list, le: list, eq: list) -> models.RunResult:
+	varNames = ['167N_2021_STQO', '167N_2021_PLSQ']
+	names = models.ResultNames.fromNames(varNames, ge, le, eq)
+	numConsts = len(names.const_names)
+	return models.RunResult(
+		status='ok',
+		termination='optimal',
+		objective_value=10.0,
+		names=names,
+		var_values=np.array([1.0, 2.0]),
+		reduced_costs=np.zeros(2),
+		duals=np.arange(numConsts, dtype=np.float64),
+		slack_ge=np.full(len(ge), 3.0),
+		slack_le=np.full(len(le), 4.0)
+	)
+
+
+def writeSession (outFolder: str, runs: dict) -> None:
+	exporter = export.makeRunExporter(outFolder, 'sqlite', False)
+	assert(exporter.begin())
+	with contextlib.redirect_stdout(io.StringIO()):
+		for name, res in runs.items():
+			exporter.writeRun(name, res)
+		assert(exporter.finish() == len(runs))
+
+
+def test_append_with_changed_operator ():
+	with tempfile.TemporaryDirectory(prefix='formom-sqlite-') as tmp:
+		writeSession(tmp, {'first.csv': makeResult(['min_acres'], ['budget'], [])})
+		# RunOutput-<time> folders are per second
+		time.sleep(1.1)
+		# budget is now an equality
+		writeSession(tmp, {'second.csv': makeResult(['min_acres'], [], ['budget'])})
+
+		conn = sqlite3.connect(str(pathlib.Path(tmp).joinpath(export.SQLITE_FILENAME)))
+
+		runs = [name for (name,) in conn.execute('SELECT name FROM runs ORDER BY id')]
+		assert(runs == ['first', 'second']), runs
+
+		kinds = conn.execute("SELECT kind FROM constraints WHERE name = 'budget' ORDER BY id").fetchall()
+		assert(kinds == [('le',), ('eq',)]), kinds
+
+		perRun = conn.execute('''
+			SELECT r.name, c.kind, x.slack FROM const_values x
+			JOIN runs r ON r.id = x.run_id JOIN constraints c ON c.id = x.const_id
+			WHERE c.name = 'budget' ORDER BY r.id
+		''').fetchall()
+		assert(perRun == [('first', 'le', 4.0), ('second', 'eq', None)]), perRun
+
+		# The unchanged constraint & the variables are shared
+		assert(conn.execute("SELECT COUNT(*) FROM constraints WHERE name = 'min_acres'").fetchone()[0] == 1)
+		assert(conn.execute('SELECT COUNT(*) FROM variables').fetchone()[0] == 2)
+		assert(conn.execute('SELECT COUNT(*) FROM var_values').fetchone()[0] == 4)
+		conn.close()
+
+
+if __name__ == '__main__':
+	test_append_with_changed_operator()
+	print('Passed')
@@ -0,0 +1,192 @@
+'''
+Text Benchmark
+
+Times writing .txt run reports for large synthetic runs, comparing the
+old build-a-string-then-write approach (copied below as legacyRunText &
+legacySummaryText) with the streaming text.writeRunText(...) and
+text.writeSummaryText(...), and checks the files are byte identical
+
+Example:
+  $ python3 testscripts/text_benchmark.py --vars 50000 200000 --runs 400
+'''
+
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import runner.model_data_classes as models
+import runner.text as text
+
+import scaling_benchmark
+
+
+# =====================================================================================
+#                                   Previous Implementation
+# =====================================================================================
+
+def legacyRunText (result: models.RunResult) -> str:
+	rstr = ''
+	rstr += f"Solve attempted\n"
+	rstr += f"Status: {result.status}\n"
+	rstr += f"Termination Condition: {result.termination}\n"
+	rstr += "\n" * 5
+
+	if not result.isOptimal():
+		rstr += " [[ ERROR ]]: Solve ended without optimal solution\n"
+		rstr += "\taborting"
+		return rstr
+
+	decvars_values = result.varValuesDict()
+	shadow_prices = result.shadowPricesDict()
+	ge_slack = result.slackGEDict()
+	le_slack = result.slackLEDict()
+
+	decvar_keys = sorted(list(decvars_values.keys()))
+	shadow_keys = sorted(list(shadow_prices.keys()))
+	ge_keys = sorted(list(ge_slack.keys()))
+	le_keys = sorted(list(le_slack.keys()))
+
+	rstr += "\n\n == Variables\n"
+	rstr += "\n".join(["%-20s | %s" % (k, decvars_values[k]) for k in decvar_keys])
+	rstr += "\n\n == Shadow Prices\n"
+	rstr += "\n".join(["%-40s | %s" % (k, shadow_prices[k]) for k in shadow_keys])
+	rstr += "\n\n == Slacks for GE\n"
+	rstr += "\n".join(["%-40s | %s" % (k, ge_slack[k]) for k in ge_keys])
+	rstr += "\n\n == Slacks for LE\n"
+	rstr += "\n".join(["%-40s | %s" % (k, le_slack[k]) for k in le_keys])
+	return rstr
+
+
+def legacySummaryText (names, results) -> str:
+	all_runs_info = []
+	for res in results:
+		times = {k: (round(v, 3) if v != None else None) for k, v in res.timingSummary().items()}
+		all_runs_info.append({**res.summary(), **times})
+
+	max_lens = {}
+	fields = list(all_runs_info[0].keys())
+	for k in fields:
+		max_lens[k] = max([len(k)] + [len(str(run[k])) for run in all_runs_info]) + 4
+	max_name_len = max(len(n) for n in names) + 4
+
+	rStr = ''
+	BASE_STR = '{0:{1}} | '
+	rStr += BASE_STR.format('Name', max_name_len)
+	for k in fields:
+		rStr += BASE_STR.format(k, max_lens[k])
+	rStr += "\n"
+	rStr += "-" * len(rStr)
+	rStr += "\n"
+
+	for name, info in zip(names, all_runs_info):
+		rStr += BASE_STR.format(name, max_name_len)
+		for k in fields:
+			rStr += BASE_STR.format(str(info[k]), max_lens[k])
+		rStr += "\n"
+	return rStr
+
+
+
+
+# =====================================================================================
+#                                   Benchmark
+# =====================================================================================
+
+def makeResult (numVars: int, seed: int=0) -> models.RunResult:
+	rng = np.random.default_rng(seed)
+	numConsts = int(numVars * 0.87)
+	numGE, numLE = numConsts // 3, numConsts // 3
+	constNames = [f'const_{i}' for i in range(numConsts)]
+	names = models.ResultNames.fromNames(
+		scaling_benchmark.makeVarNames(numVars),
+		constNames[:numGE],
+		constNames[numGE:numGE + numLE],
+		constNames[numGE + numLE:]
+	)
+	return models.RunResult(
+		status='ok',
+		termination='optimal',
+		objective_value=float(rng.uniform(0, 1e6)),
+		names=names,
+		var_values=rng.uniform(0, 1e4, numVars),
+		reduced_costs=np.zeros(numVars),
+		duals=rng.uniform(-10, 10, numConsts),
+		slack_ge=rng.uniform(0, 100, numGE),
+		slack_le=rng.uniform(0, 100, numLE),
+		phase_seconds={'build': 0.1, 'solve': 1.0, 'extract': 0.01},
+		peak_mib=100.0
+	)
+
+
+def measure (func, repeats: int=3) -> dict:
+	'''
+	Best wall seconds of a few calls, and the peak traced memory of
+	another (tracing slows the call down, so it's timed separately)
+	'''
+	best = None
+	for _ in range(repeats):
+		start = time.perf_counter()
+		func()
+		elapsed = time.perf_counter() - start
+		best = elapsed if best == None else min(best, elapsed)
+
+	tracemalloc.start()
+	func()
+	peak = tracemalloc.get_traced_memory()[1]
+	tracemalloc.stop()
+	return {'seconds': best, 'peak_mib': peak / 2**20}
+
+
+def main ():
+	parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--vars', type=int, nargs='+', default=[50000, 200000])
+	parser.add_argument('--runs', type=int, default=400,
+		help='runs in the summary table')
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory(prefix='formom-text-') as tmp:
+		oldPath = pathlib.Path(tmp).joinpath('old.txt')
+		newPath = pathlib.Path(tmp).joinpath('new.txt')
+
+		def writeOld (makeStr):
+			with open(oldPath, 'w') as f:
+				f.write(makeStr())
+
+		cases = []
+		for numVars in args.vars:
+			res = makeResult(numVars)
+
+			def writeNew (res=res):
+				with open(newPath, 'w') as f:
+					text.writeRunText(f, res)
+
+			cases.append((f'run, {numVars} vars', lambda res=res: writeOld(lambda: legacyRunText(res)), writeNew))
+
+		names = [f'objective_{i}.csv' for i in range(args.runs)]
+		results = [makeResult(10, seed=i).withoutValues() for i in range(args.runs)]
+
+		def writeNewSummary ():
+			with open(newPath, 'w') as f:
+				text.writeSummaryText(f, names, results)
+
+		cases.append((f'summary, {args.runs} runs', lambda: writeOld(lambda: legacySummaryText(names, results)), writeNewSummary))
+
+		print(f'{"case":>22} | {"old s":>8} | {"new s":>8} | {"old MiB":>8} | {"new MiB":>8} | identical')
+		print('-' * 82)
+		for label, old, new in cases:
+			o = measure(old)
+			n = measure(new)
+			same = oldPath.read_bytes() == newPath.read_bytes()
+			print(f'{label:>22} | {o["seconds"]:8.3f} | {n["seconds"]:8.3f} | {o["peak_mib"]:8.1f} | {n["peak_mib"]:8.1f} | {same}')
+
+
+if __name__ == '__main__':
+	main()